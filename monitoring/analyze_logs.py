@@ -1,12 +1,46 @@
+"""Анализ логов сервисов.
+
+JSON-логи (LOG_OUTPUT=json) разбираются без json.loads. JsonFormatter
+пишет поля в постоянном порядке (ts, level, event, ticket_id, session_id,
+latency_ms, service, msg), и до msg в строке ровно одно двоеточие на
+поле. Поэтому в куске файла достаточно один раз найти все двоеточия
+(NumPy): строка начинается с двоеточия после {"ts", поле k строки лежит
+между ее k-м двоеточием и именем поля k + 1. Значения полей собираются в
+колонки (событие, ticket_id, session_id, latency_ms), и счетчики,
+гистограммы задержек и продажи по сеансам считаются над колонками, без
+цикла по строкам.
+
+Файлы отображаются в память (mmap) и режутся на куски по CHUNK_SIZE
+байт; с --jobs N куски разбираются в N процессах.
+
+Текстовые строки (старые логи, LOG_OUTPUT=text) считаются по шаблонам,
+как раньше.
+
+Нужен numpy (monitoring/requirements.txt):
+
+    pip install -r requirements.txt
+    python analyze_logs.py [--jobs N] [каталог логов ...]
+"""
+import argparse
+import mmap
 import os
 import re
+import time
 from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 LOG_DIRS = {
     "ticket": "../ticket-service/logs",
     "payment": "../payment-service/logs",
 }
 
+# Сколько байт разбирать за раз
+CHUNK_SIZE = 64 * 1024 * 1024
+
 metrics = Counter()
 
 patterns = {
@@ -17,25 +51,345 @@ patterns = {
     "payment_failed": re.compile(r"FAILED"),
 }
 
-def analyze_logs():
-    for service, path in LOG_DIRS.items():
+# Метрика -> событие JSON-лога
+METRIC_EVENTS = {
+    "reserved": "TICKET_RESERVED",
+    "sold": "TICKET_SOLD",
+    "cancelled": "TICKET_CANCELLED",
+    "payment_success": "PAYMENT_SUCCESS",
+    "payment_failed": "PAYMENT_FAILED",
+}
+
+# Поля строки JSON-лога в порядке JsonFormatter; номер поля = номер двоеточия
+FIELDS = ("ts", "level", "event", "ticket_id", "session_id", "latency_ms", "service", "msg")
+TS, LEVEL, EVENT, TICKET_ID, SESSION_ID, LATENCY_MS, SERVICE = range(7)
+# Ширина окна чисел: ts - всегда 10 цифр, точка и 3 цифры; id и latency_ms - до 12 байт
+TS_WIDTH = 14
+NUMBER_WIDTH = 12
+# Гистограмма задержек: логарифмические корзины от 1 мкс до 100 с (по 50 на порядок)
+LATENCY_EDGES = np.geomspace(0.001, 100000, 401)
+_LATENCY_BINS_PER_DECADE = 50
+
+NEWLINE, COLON = b"\n:"
+# Начало JSON-строки: перевод строки предыдущей и {"ts": (8 байт, кончаются двоеточием)
+LINE_START = b'{"ts":'
+_LINE_START_WORD = np.frombuffer(b"\n\n" + LINE_START, dtype=np.uint64)[0]
+# Без первого байта: он может быть любым
+_LINE_START_MASK = np.frombuffer(b"\0" + b"\xff" * 7, dtype=np.uint64)[0]
+NULL_BYTE = ord("n")
+# Байт -> цифра; не-цифры (точка, кавычки, буквы имен полей) -> 0
+_DIGITS = np.zeros(256)
+_DIGITS[b"0"[0]:b"9"[0] + 1] = np.arange(10)
+
+
+def _powers(width: int, fixed3: bool) -> np.ndarray:
+    """Степени 10 для окна цифр, выровненного по концу числа.
+
+    Для чисел с тремя знаками после точки точка (4-й байт с конца) не
+    учитывается, и результат - в тысячных.
+    """
+    if not fixed3:
+        return 10.0 ** np.arange(width - 1, -1, -1)
+    powers = 10.0 ** np.arange(width - 2, -1, -1)
+    return np.concatenate([powers[:-3], [0], powers[-3:]])
+
+
+class Fields:
+    """Границы полей JSON-строк куска: [start, end) значения по номеру поля"""
+
+    def __init__(self, buf: np.ndarray, colons: np.ndarray, first: np.ndarray):
+        self.buf = buf
+        self.colons = colons
+        self.first = first
+        self._windows = {}
+
+    def windows(self, width: int) -> np.ndarray:
+        """Окна по width байт с каждой позиции куска (без копирования)"""
+        if width not in self._windows:
+            self._windows[width] = sliding_window_view(self.buf, width)
+        return self._windows[width]
+
+    def start(self, field: int) -> np.ndarray:
+        return self.colons[self.first + field] + 1
+
+    def end(self, field: int) -> np.ndarray:
+        # Значение заканчивается перед ,"следующее_поле"
+        return self.colons[self.first + field + 1] - len(FIELDS[field + 1]) - 3
+
+    def numbers(self, field: int, width: int = NUMBER_WIDTH, fixed3: bool = False) -> np.ndarray:
+        """Числа поля (целые или с тремя знаками после точки); null -> NaN.
+
+        Окно выровнено по концу значения: младший разряд - последний байт
+        окна. Окно короче имени поля перед значением, а в именах полей нет
+        цифр, поэтому байты перед числом дают 0 и маска длины не нужна.
+        """
+        start, end = self.start(field), self.end(field)
+        values = _DIGITS[self.windows(width)[np.maximum(end - width, 0)]] @ _powers(width, fixed3)
+        if fixed3:
+            values /= 1000
+        values[self.buf[start] == NULL_BYTE] = np.nan
+        return values
+
+
+class EventCodes:
+    """Коды событий: значение поля event -> 64-битный ключ -> номер события.
+
+    Ключ - длина значения и его первые и последние 8 байт: названия до 16
+    символов различаются всегда, длиннее - по длине, началу и концу.
+    Названий немного, поэтому коды раздаются сравнением ключей со всей
+    колонкой по одному названию, без сортировки.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self._codes: Dict[int, int] = {}
+
+    def encode(self, fields: Fields) -> np.ndarray:
+        """Номера событий строк; -1 - события нет (null)"""
+        start, end = fields.start(EVENT), fields.end(EVENT)
+        words = fields.windows(8)
+        head = words[start].view(np.uint64)[:, 0]
+        tail = words[end - 8].view(np.uint64)[:, 0]
+        with np.errstate(over="ignore"):
+            keys = head ^ (tail * np.uint64(0x9E3779B97F4A7C15)) ^ ((end - start).astype(np.uint64) << np.uint64(56))
+
+        codes = np.full(len(keys), -1, dtype=np.int64)
+        for key, code in self._codes.items():
+            codes[keys == key] = code
+        pending = (codes < 0) & (fields.buf[start] != NULL_BYTE)
+        while pending.any():
+            row = int(np.argmax(pending))
+            key = int(keys[row])
+            # Значение в кавычках
+            name = bytes(fields.buf[start[row] + 1:end[row] - 1]).decode("utf-8", errors="replace")
+            code = self._codes[key] = len(self.names)
+            self.names.append(name)
+            match = pending & (keys == key)
+            codes[match] = code
+            pending &= ~match
+        return codes
+
+
+class LogReport:
+    """Накопленные по кускам счетчики"""
+
+    def __init__(self):
+        self.codes = EventCodes()
+        self.lines = 0
+        self.json_lines = 0
+        self.bytes = 0
+        self.text = Counter()
+        self.levels = Counter()
+        self.events = np.zeros(0, dtype=np.int64)
+        self.latency = np.zeros((0, len(LATENCY_EDGES) + 1), dtype=np.int64)
+        self.sold_by_session = Counter()
+        self.first_ts = np.inf
+        self.last_ts = -np.inf
+
+    def _grow(self):
+        count = len(self.codes.names)
+        if len(self.events) < count:
+            self.events = np.pad(self.events, (0, count - len(self.events)))
+            self.latency = np.pad(self.latency, ((0, count - len(self.latency)), (0, 0)))
+
+    def add_chunk(self, buf: np.ndarray):
+        """Учесть кусок из целых строк (последний байт - перевод строки)"""
+        self.bytes += len(buf)
+        line_count = int(np.count_nonzero(buf == NEWLINE))
+        self.lines += line_count
+        if len(buf) < 8:
+            self._count_text(buf, np.zeros(0, dtype=np.int64))
+            return
+
+        colons = np.flatnonzero(buf == COLON)
+        # Двоеточие после {"ts" в начале строки - начало JSON-строки (в msg
+        # кавычки экранированы, там такой последовательности не бывает).
+        # Сначала отбор по одному байту ('t' за три байта до двоеточия), затем
+        # сравнение 8 байт; первая строка куска проверяется отдельно
+        first = np.flatnonzero(buf[np.maximum(colons - 3, 0)] == LINE_START[2])
+        words = sliding_window_view(buf, 8)[np.maximum(colons[first] - 7, 0)].view(np.uint64)[:, 0]
+        is_start = (words & _LINE_START_MASK) == (_LINE_START_WORD & _LINE_START_MASK)
+        is_start |= colons[first] == len(LINE_START) - 1
+        first = first[is_start]
+        if len(first) and colons[first[0]] == len(LINE_START) - 1 and buf[:len(LINE_START)].tobytes() != LINE_START:
+            first = first[1:]
+        # До msg у строки должны быть все поля
+        next_first = np.append(first[1:], len(colons))
+        first = first[next_first - first > SERVICE]
+        line_starts = colons[first] - len(LINE_START) + 1
+
+        if len(first) < line_count:
+            self._count_text(buf, line_starts)
+        if not len(first):
+            return
+        self.json_lines += len(first)
+        fields = Fields(buf, colons, first)
+
+        # Строки пишутся по времени: диапазон - по первой и последней строке куска
+        ts = Fields(buf, colons, first[[0, -1]]).numbers(TS, TS_WIDTH, fixed3=True)
+        self.first_ts = min(self.first_ts, ts[0])
+        self.last_ts = max(self.last_ts, ts[-1])
+        # Первая буква уровня: D, I, W, E, C
+        level_letters = np.bincount(buf[fields.start(LEVEL) + 1], minlength=256)
+        for letter in np.flatnonzero(level_letters):
+            self.levels[chr(letter)] += int(level_letters[letter])
+
+        events = self.codes.encode(fields)
+        self._grow()
+        has_event = events >= 0
+        fields = Fields(buf, colons, first[has_event])
+        events = events[has_event]
+        self.events += np.bincount(events, minlength=len(self.events))
+
+        latency = fields.numbers(LATENCY_MS, fixed3=True)
+        timed = ~np.isnan(latency)
+        # Номер корзины по логарифму: как searchsorted по LATENCY_EDGES, без поиска
+        with np.errstate(divide="ignore"):
+            bins = np.ceil((np.log10(latency[timed]) + 3) * _LATENCY_BINS_PER_DECADE - 1e-9)
+        bins = np.clip(bins, 0, len(LATENCY_EDGES)).astype(np.int64)
+        self.latency += np.bincount(
+            events[timed] * self.latency.shape[1] + bins, minlength=self.latency.size
+        ).reshape(self.latency.shape)
+
+        if "TICKET_SOLD" in self.codes.names:
+            sold = events == self.codes.names.index("TICKET_SOLD")
+            if sold.any():
+                sessions = Fields(buf, colons, fields.first[sold]).numbers(SESSION_ID)
+                session_ids, counts = np.unique(sessions[~np.isnan(sessions)].astype(np.int64), return_counts=True)
+                self.sold_by_session.update(dict(zip(session_ids.tolist(), counts.tolist())))
+
+    def _count_text(self, buf: np.ndarray, json_starts: np.ndarray):
+        """Строки, не являющиеся JSON-логом - по шаблонам patterns"""
+        ends = np.flatnonzero(buf == NEWLINE)
+        starts = np.empty_like(ends)
+        starts[:1] = 0
+        starts[1:] = ends[:-1] + 1
+        text = ~np.isin(starts, json_starts, assume_unique=True)
+        data = buf[:len(buf)].tobytes()
+        for start, end in zip(starts[text].tolist(), ends[text].tolist()):
+            line = data[start:end].decode("utf-8", errors="replace")
+            for key, pattern in patterns.items():
+                if pattern.search(line):
+                    self.text[key] += 1
+
+    def merge(self, other: "LogReport"):
+        """Добавить счетчики другого отчета (коды событий сопоставляются по названию)"""
+        self.lines += other.lines
+        self.json_lines += other.json_lines
+        self.bytes += other.bytes
+        self.text.update(other.text)
+        self.levels.update(other.levels)
+        self.sold_by_session.update(other.sold_by_session)
+        self.first_ts = min(self.first_ts, other.first_ts)
+        self.last_ts = max(self.last_ts, other.last_ts)
+        for code, name in enumerate(other.codes.names):
+            if name not in self.codes.names:
+                self.codes.names.append(name)
+            self._grow()
+            mine = self.codes.names.index(name)
+            self.events[mine] += other.events[code]
+            self.latency[mine] += other.latency[code]
+
+    def event_count(self, name: str) -> int:
+        if name not in self.codes.names:
+            return 0
+        return int(self.events[self.codes.names.index(name)])
+
+    def latency_percentiles(self, name: str, quantiles=(0.5, 0.95, 0.99)) -> List[float]:
+        """Перцентили задержки события (мс, верхняя граница корзины)"""
+        histogram = self.latency[self.codes.names.index(name)]
+        total = histogram.sum()
+        if not total:
+            return []
+        cumulative = np.cumsum(histogram)
+        bounds = np.append(LATENCY_EDGES, np.inf)
+        return [float(bounds[np.searchsorted(cumulative, q * total)]) for q in quantiles]
+
+
+def file_ranges(file_path: str) -> List[Tuple[str, int, int]]:
+    """Диапазоны файла по CHUNK_SIZE байт (границы уточняются до перевода строки)"""
+    size = os.path.getsize(file_path)
+    return [(file_path, start, min(start + CHUNK_SIZE, size)) for start in range(0, size, CHUNK_SIZE)]
+
+
+def analyze_range(task: Tuple[str, int, int]) -> LogReport:
+    """Разобрать строки, начинающиеся в [start, end) файла"""
+    file_path, start, end = task
+    report = LogReport()
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # Строка, начатая до start, - в предыдущем диапазоне
+        if start:
+            start = data.find(b"\n", start - 1) + 1 or len(data)
+        if end < len(data):
+            end = data.find(b"\n", end - 1) + 1 or len(data)
+        if start < end:
+            buf = np.frombuffer(data, dtype=np.uint8, count=end - start, offset=start)
+            if buf[-1] != NEWLINE:
+                buf = np.append(buf, np.uint8(NEWLINE))
+            report.add_chunk(buf)
+            del buf
+    return report
+
+
+def analyze_logs(log_dirs: Optional[Dict[str, str]] = None, jobs: int = 1) -> LogReport:
+    tasks = []
+    for path in (log_dirs or LOG_DIRS).values():
         if not os.path.exists(path):
             continue
 
-        for file in os.listdir(path):
+        for file in sorted(os.listdir(path)):
             file_path = os.path.join(path, file)
-            with open(file_path, "r") as f:
-                for line in f:
-                    for key, pattern in patterns.items():
-                        if pattern.search(line):
-                            metrics[key] += 1
+            if os.path.isfile(file_path) and os.path.getsize(file_path):
+                tasks.extend(file_ranges(file_path))
+
+    report = LogReport()
+    if jobs > 1 and len(tasks) > 1:
+        with Pool(jobs) as pool:
+            for part in pool.imap_unordered(analyze_range, tasks):
+                report.merge(part)
+    else:
+        for task in tasks:
+            report.merge(analyze_range(task))
 
-if name == "main":
-    analyze_logs()
+    # Точные счетчики по событиям JSON-логов плюс шаблоны по текстовым строкам
+    metrics.clear()
+    for key, event in METRIC_EVENTS.items():
+        metrics[key] = report.event_count(event) + report.text[key]
+    return report
+
+
+def format_time(ts: float) -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Метрики по логам сервисов")
+    parser.add_argument("dirs", nargs="*", help="каталоги логов (по умолчанию - логи ticket и payment)")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="число процессов")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    report = analyze_logs({path: path for path in args.dirs} or None, args.jobs)
+    elapsed = time.perf_counter() - started
 
     print("=== Monitoring metrics ===")
     print(f"Reserved tickets: {metrics['reserved']}")
     print(f"Sold tickets: {metrics['sold']}")
     print(f"Cancelled tickets: {metrics['cancelled']}")
     print(f"Successful payments: {metrics['payment_success']}")
-    print(f"Failed payments: {metrics['payment_failed']}")
\ No newline at end of file
+    print(f"Failed payments: {metrics['payment_failed']}")
+
+    print(f"\n=== Log lines: {report.lines} (JSON {report.json_lines}) ===")
+    if report.json_lines:
+        print("Levels: " + ", ".join(f"{level}={count}" for level, count in sorted(report.levels.items())))
+        print(f"Time range: {format_time(report.first_ts)} .. {format_time(report.last_ts)}")
+        print(f"\n{'Event':<24}{'count':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for name in sorted(report.codes.names):
+            timing = "".join(f"{value:>10.3f}" for value in report.latency_percentiles(name))
+            print(f"{name:<24}{report.event_count(name):>10}{timing}")
+        if report.sold_by_session:
+            print("\nTop sessions by sold tickets:")
+            for session_id, count in report.sold_by_session.most_common(10):
+                print(f"  session {session_id}: {count}")
+
+    print(f"\nAnalyzed {report.bytes / 1e6:.1f} MB in {elapsed:.2f} s")
@@ -1,7 +1,8 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from app.schemas import NotificationRequest
-from app.logger import logger
+from app.logger import logger, set_level, logging_settings
+from app.request_metrics import RequestMetrics, RequestMetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from typing import List
 from datetime import datetime
 import json
@@ -20,6 +21,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики запросов: добавляется последним, чтобы учитывать остальные middleware
+request_metrics = RequestMetrics()
+app.add_middleware(RequestMetricsMiddleware, metrics=request_metrics)
+
 # Хранилище уведомлений
 notifications = []
 
@@ -48,11 +53,11 @@ def send_notification(request: NotificationRequest):
         body = request.message
     
     logger.info(
-        f"Notification for ticket {request.ticket_id}: {subject}"
+        "Notification for ticket %s: %s", request.ticket_id, subject
     )
     
     if request.email:
-        logger.info(f"Email would be sent to: {request.email}")
+        logger.info("Email would be sent to: %s", request.email)
     
     notification = {
         "ticket_id": request.ticket_id,
@@ -72,4 +77,30 @@ def send_notification(request: NotificationRequest):
 def get_notifications():
     """Получить все уведомления"""
     logger.info("GET /notifications")
-    return notifications
\ No newline at end of file
+    return notifications
+
+
+@app.get("/metrics")
+async def get_request_metrics():
+    """Задержки, статусы и число выполняющихся запросов в формате Prometheus.
+
+    async: метрики обновляются в цикле событий, отдаем их оттуда же.
+    """
+    return Response(content=request_metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/logging")
+def get_logging_settings():
+    """Уровень логов, выборка частых INFO-записей и состояние очереди логов"""
+    return logging_settings()
+
+
+@app.put("/logging/level")
+def update_logging_level(level: str):
+    """Сменить уровень логов сервиса без перезапуска"""
+    try:
+        set_level(level)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown log level: {level}")
+    logger.warning("Log level set to %s", level.upper())
+    return logging_settings()
@@ -1,10 +1,12 @@
 import random
-from fastapi import FastAPI, HTTPException
+import time
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.logger import logger
+from app.logger import logger, set_level, logging_settings, elapsed_ms
 from app.schemas import PaymentInitRequest, PaymentResultResponse, RefundRequest, RefundResponse
 from app.ticket_client import confirm_ticket, cancel_ticket, notify
 from app.logging_service import log_action
+from app.request_metrics import RequestMetrics, RequestMetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from pydantic import BaseModel
 
 class BulkPaymentRequest(BaseModel):
@@ -26,6 +28,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики запросов: добавляется последним, чтобы учитывать остальные middleware
+request_metrics = RequestMetrics()
+app.add_middleware(RequestMetricsMiddleware, metrics=request_metrics)
+
 # Хранилище платежей
 payments = {}
 
@@ -38,11 +44,12 @@ def startup():
 @app.post("/api/payment/payment/init", response_model=PaymentResultResponse)
 def init_payment_api(request: PaymentInitRequest):
     """Обработать платёж за билет - УЧЕБНАЯ ИМИТАЦИЯ (2/3 успех)"""
-    logger.info(f"Payment initiated for ticket {request.ticket_id}, amount {request.amount}, email {request.email}")
+    started = time.perf_counter()
+    logger.info("Payment initiated for ticket %s, amount %s, email %s", request.ticket_id, request.amount, request.email)
 
     # Валидация суммы
     if request.amount <= 0:
-        logger.warning(f"Invalid amount: {request.amount}")
+        logger.warning("Invalid amount: %s", request.amount)
         cancel_ticket(request.ticket_id)
         return PaymentResultResponse(
             ticket_id=request.ticket_id,
@@ -52,16 +59,22 @@ def init_payment_api(request: PaymentInitRequest):
 
     # УЧЕБНАЯ ИМИТАЦИЯ: случайный результат (50% успех, 50% ошибка)
     success = random.choice([True, False])
+    failure_message = "Ошибка обработки платежа. Попробуйте ещё раз."
     
     try:
+        # Подтвердить билет. Если бронь истекла или билет отменен, место уже
+        # свободно и могло уйти другому - платёж не засчитывается и возвращается
+        if success and not confirm_ticket(request.ticket_id):
+            success = False
+            failure_message = "Бронь билета истекла или отменена. Платёж возвращён."
+        
         if success:
-            # Подтвердить билет
-            confirm_ticket(request.ticket_id)
-            
             # Отправить уведомление
             notify(request.ticket_id, "purchase", request.email)
             
-            logger.info(f"Payment successful for ticket {request.ticket_id}")
+            logger.info("Payment successful for ticket %s", request.ticket_id, extra={
+                "event": "PAYMENT_SUCCESS", "ticket_id": request.ticket_id, "latency_ms": elapsed_ms(started)
+            })
             
             # Логируем действие пользователя
             log_action(
@@ -86,7 +99,9 @@ def init_payment_api(request: PaymentInitRequest):
             # Отправить уведомление
             notify(request.ticket_id, "cancellation", request.email)
             
-            logger.warning(f"Payment failed for ticket {request.ticket_id}")
+            logger.warning("Payment failed for ticket %s", request.ticket_id, extra={
+                "event": "PAYMENT_FAILED", "ticket_id": request.ticket_id, "latency_ms": elapsed_ms(started)
+            })
             
             # Логируем действие пользователя
             log_action(
@@ -102,10 +117,10 @@ def init_payment_api(request: PaymentInitRequest):
             return PaymentResultResponse(
                 ticket_id=request.ticket_id,
                 status="FAILED",
-                message="Ошибка обработки платежа. Попробуйте ещё раз."
+                message=failure_message
             )
     except Exception as e:
-        logger.error(f"Payment processing error: {e}")
+        logger.error("Payment processing error: %s", e)
         cancel_ticket(request.ticket_id)
         return PaymentResultResponse(
             ticket_id=request.ticket_id,
@@ -117,11 +132,12 @@ def init_payment_api(request: PaymentInitRequest):
 @app.post("/payment/init", response_model=PaymentResultResponse)
 def init_payment(request: PaymentInitRequest):
     """Обработать платёж за билет - УЧЕБНАЯ ИМИТАЦИЯ (2/3 успех)"""
-    logger.info(f"Payment initiated for ticket {request.ticket_id}, amount {request.amount}, email {request.email}")
+    started = time.perf_counter()
+    logger.info("Payment initiated for ticket %s, amount %s, email %s", request.ticket_id, request.amount, request.email)
 
     # Валидация суммы
     if request.amount <= 0:
-        logger.warning(f"Invalid amount: {request.amount}")
+        logger.warning("Invalid amount: %s", request.amount)
         cancel_ticket(request.ticket_id)
         return PaymentResultResponse(
             ticket_id=request.ticket_id,
@@ -131,16 +147,22 @@ def init_payment(request: PaymentInitRequest):
 
     # УЧЕБНАЯ ИМИТАЦИЯ: случайный результат (50% успех, 50% ошибка)
     success = random.choice([True, False])
+    failure_message = "Ошибка обработки платежа. Попробуйте ещё раз."
     
     try:
+        # Подтвердить билет. Если бронь истекла или билет отменен, место уже
+        # свободно и могло уйти другому - платёж не засчитывается и возвращается
+        if success and not confirm_ticket(request.ticket_id):
+            success = False
+            failure_message = "Бронь билета истекла или отменена. Платёж возвращён."
+        
         if success:
-            # Подтвердить билет
-            confirm_ticket(request.ticket_id)
-            
             # Отправить уведомление
             notify(request.ticket_id, "purchase", request.email)
             
-            logger.info(f"Payment successful for ticket {request.ticket_id}")
+            logger.info("Payment successful for ticket %s", request.ticket_id, extra={
+                "event": "PAYMENT_SUCCESS", "ticket_id": request.ticket_id, "latency_ms": elapsed_ms(started)
+            })
             
             # Логируем действие пользователя
             log_action(
@@ -165,7 +187,9 @@ def init_payment(request: PaymentInitRequest):
             # Отправить уведомление
             notify(request.ticket_id, "cancellation", request.email)
             
-            logger.warning(f"Payment failed for ticket {request.ticket_id}")
+            logger.warning("Payment failed for ticket %s", request.ticket_id, extra={
+                "event": "PAYMENT_FAILED", "ticket_id": request.ticket_id, "latency_ms": elapsed_ms(started)
+            })
             
             # Логируем действие пользователя
             log_action(
@@ -181,10 +205,10 @@ def init_payment(request: PaymentInitRequest):
             return PaymentResultResponse(
                 ticket_id=request.ticket_id,
                 status="FAILED",
-                message="Ошибка обработки платежа. Попробуйте ещё раз."
+                message=failure_message
             )
     except Exception as e:
-        logger.error(f"Payment processing error: {e}")
+        logger.error("Payment processing error: %s", e)
         cancel_ticket(request.ticket_id)
         return PaymentResultResponse(
             ticket_id=request.ticket_id,
@@ -196,13 +220,13 @@ def init_payment(request: PaymentInitRequest):
 @app.post("/payment/refund", response_model=RefundResponse)
 def refund_payment(request: RefundRequest):
     """Вернуть деньги за билет"""
-    logger.info(f"Refund requested for ticket {request.ticket_id}, reason: {request.reason}")
+    logger.info("Refund requested for ticket %s, reason: %s", request.ticket_id, request.reason)
     
     try:
         # Отменяем билет напрямую через ticket-service
         cancel_ticket(request.ticket_id)
         
-        logger.info(f"Refund successful for ticket {request.ticket_id}")
+        logger.info("Refund successful for ticket %s", request.ticket_id)
         
         # Логируем действие пользователя
         log_action(
@@ -221,7 +245,7 @@ def refund_payment(request: RefundRequest):
             message=f"✅ Возврат билета {request.ticket_id} успешен!"
         )
     except Exception as e:
-        logger.error(f"Refund error for ticket {request.ticket_id}: {e}")
+        logger.error("Refund error for ticket %s: %s", request.ticket_id, e)
         return RefundResponse(
             ticket_id=request.ticket_id,
             status="FAILED",
@@ -233,11 +257,12 @@ def refund_payment(request: RefundRequest):
 @app.post("/api/payment/bulk-payment", response_model=PaymentResultResponse)
 def bulk_payment(request: BulkPaymentRequest):
     """Групповая оплата билетов - один шанс для всех билетов"""
-    logger.info(f"Bulk payment initiated for tickets {request.ticket_ids}, total amount {request.total_amount}, email {request.email}")
+    started = time.perf_counter()
+    logger.info("Bulk payment initiated for tickets %s, total amount %s, email %s", request.ticket_ids, request.total_amount, request.email)
 
     # Валидация суммы
     if request.total_amount <= 0:
-        logger.warning(f"Invalid total amount: {request.total_amount}")
+        logger.warning("Invalid total amount: %s", request.total_amount)
         # Отменяем все билеты
         for ticket_id in request.ticket_ids:
             try:
@@ -255,36 +280,61 @@ def bulk_payment(request: BulkPaymentRequest):
     
     try:
         if success:
-            # Подтверждаем все билеты
+            # Подтверждаем все билеты. Билеты с истекшей или отмененной бронью
+            # не подтверждаются: их места могли уйти другим, деньги за них возвращаются
             confirmed_tickets = []
+            refunded_tickets = []
             for ticket_id in request.ticket_ids:
-                try:
-                    confirm_ticket(ticket_id)
+                if confirm_ticket(ticket_id):
                     confirmed_tickets.append(ticket_id)
-                except Exception as e:
-                    logger.error(f"Error confirming ticket {ticket_id}: {e}")
+                else:
+                    refunded_tickets.append(ticket_id)
+                    cancel_ticket(ticket_id)
+                    logger.warning("Payment refunded for ticket %s: ticket not confirmed", ticket_id, extra={
+                        "event": "PAYMENT_FAILED", "ticket_id": ticket_id, "latency_ms": elapsed_ms(started)
+                    })
             
-            # Отправляем уведомления для всех билетов
-            for ticket_id in request.ticket_ids:
+            # Уведомление о покупке - только по подтвержденным билетам
+            for ticket_id in confirmed_tickets:
                 try:
                     notify(ticket_id, "purchase", request.email)
                 except:
                     pass
+            for ticket_id in refunded_tickets:
+                try:
+                    notify(ticket_id, "cancellation", request.email)
+                except:
+                    pass
             
-            logger.info(f"Bulk payment successful for tickets {request.ticket_ids}")
+            if confirmed_tickets:
+                logger.info("Bulk payment successful for tickets %s", confirmed_tickets)
             
             # Логируем действие пользователя
             log_action(
-                action="BULK_PAYMENT_SUCCESS",
+                action="BULK_PAYMENT_SUCCESS" if confirmed_tickets else "BULK_PAYMENT_FAILED",
                 user_id=request.email or "anonymous",
                 details={
                     "ticket_ids": request.ticket_ids,
                     "total_amount": request.total_amount,
                     "email": request.email,
-                    "confirmed_tickets": confirmed_tickets
+                    "confirmed_tickets": confirmed_tickets,
+                    "refunded_tickets": refunded_tickets
                 }
             )
             
+            if not confirmed_tickets:
+                return PaymentResultResponse(
+                    ticket_id=0,  # Групповая операция
+                    status="FAILED",
+                    message=f"💸 Брони билетов истекли или отменены. Платёж возвращён, билетов: {len(refunded_tickets)}"
+                )
+            if refunded_tickets:
+                return PaymentResultResponse(
+                    ticket_id=0,  # Групповая операция
+                    status="SUCCESS",
+                    message=(f"💰 Оплачено билетов: {len(confirmed_tickets)}. "
+                             f"Билетов с истекшей или отмененной бронью: {len(refunded_tickets)}, деньги за них возвращены.")
+                )
             return PaymentResultResponse(
                 ticket_id=0,  # Групповая операция
                 status="SUCCESS",
@@ -298,9 +348,9 @@ def bulk_payment(request: BulkPaymentRequest):
                     cancel_ticket(ticket_id)
                     cancelled_tickets.append(ticket_id)
                 except Exception as e:
-                    logger.error(f"Error cancelling ticket {ticket_id}: {e}")
+                    logger.error("Error cancelling ticket %s: %s", ticket_id, e)
             
-            logger.warning(f"Bulk payment failed for tickets {request.ticket_ids}")
+            logger.warning("Bulk payment failed for tickets %s", request.ticket_ids)
             
             # Логируем действие пользователя
             log_action(
@@ -320,7 +370,7 @@ def bulk_payment(request: BulkPaymentRequest):
                 message=f"💸 Оплата не удалась. Все билеты ({len(cancelled_tickets)}) отменены."
             )
     except Exception as e:
-        logger.error(f"Bulk payment processing error: {e}")
+        logger.error("Bulk payment processing error: %s", e)
         # Отменяем все билеты при ошибке
         for ticket_id in request.ticket_ids:
             try:
@@ -331,4 +381,30 @@ def bulk_payment(request: BulkPaymentRequest):
             ticket_id=0,  # Групповая операция
             status="FAILED",
             message="Внутренняя ошибка сервера"
-        )
\ No newline at end of file
+        )
+
+
+@app.get("/metrics")
+async def get_request_metrics():
+    """Задержки, статусы и число выполняющихся запросов в формате Prometheus.
+
+    async: метрики обновляются в цикле событий, отдаем их оттуда же.
+    """
+    return Response(content=request_metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/logging")
+def get_logging_settings():
+    """Уровень логов, выборка частых INFO-записей и состояние очереди логов"""
+    return logging_settings()
+
+
+@app.put("/logging/level")
+def update_logging_level(level: str):
+    """Сменить уровень логов сервиса без перезапуска"""
+    try:
+        set_level(level)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown log level: {level}")
+    logger.warning("Log level set to %s", level.upper())
+    return logging_settings()
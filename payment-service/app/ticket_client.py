@@ -4,14 +4,22 @@ from app.logger import logger
 TICKET_SERVICE_URL = "http://ticket-service:8001"
 
 
-def confirm_ticket(ticket_id: int):
+def confirm_ticket(ticket_id: int) -> bool:
+    """Подтвердить оплату билета.
+
+    False - билет не подтвержден: бронь истекла или билет отменен (409,
+    место уже свободно и могло уйти другому), билета нет или Ticket
+    Service недоступен.
+    """
     try:
         url = f"{TICKET_SERVICE_URL}/tickets/confirm/{ticket_id}"
         response = requests.post(url, timeout=3)
         response.raise_for_status()
-        logger.info(f"Ticket {ticket_id} confirmed")
+        logger.info("Ticket %s confirmed", ticket_id)
+        return True
     except Exception as e:
-        logger.error(f"Failed to confirm ticket {ticket_id}: {e}")
+        logger.error("Failed to confirm ticket %s: %s", ticket_id, e)
+        return False
 
 
 def cancel_ticket(ticket_id: int):
@@ -19,9 +27,9 @@ def cancel_ticket(ticket_id: int):
         url = f"{TICKET_SERVICE_URL}/tickets/cancel/{ticket_id}"
         response = requests.post(url, timeout=3)
         response.raise_for_status()
-        logger.info(f"Ticket {ticket_id} cancelled")
+        logger.info("Ticket %s cancelled", ticket_id)
     except Exception as e:
-        logger.error(f"Failed to cancel ticket {ticket_id}: {e}")
+        logger.error("Failed to cancel ticket %s: %s", ticket_id, e)
 
 
 NOTIFICATION_SERVICE_URL = "http://notification-service:8003"
@@ -45,6 +53,6 @@ def notify(ticket_id: int, event_type: str = "purchase", email: str = None):
         }
         response = requests.post(url, json=payload, timeout=3)
         response.raise_for_status()
-        logger.info(f"Notification triggered for ticket {ticket_id}, event: {event_type}")
+        logger.info("Notification triggered for ticket %s, event: %s", ticket_id, event_type)
     except Exception as e:
-        logger.error(f"Failed to notify for ticket {ticket_id}: {e}")
\ No newline at end of file
+        logger.error("Failed to notify for ticket %s: %s", ticket_id, e)
\ No newline at end of file
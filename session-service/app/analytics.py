@@ -0,0 +1,247 @@
+"""Аналитика заполняемости залов на NumPy.
+
+Состояние мест всех сеансов одного зала собирается в матрицу uint8
+(сеансы x места), дальше все считается над матрицами целиком: проданные
+места по сеансам, заполняемость по кинотеатрам, фильмам и дням (bincount
+по коду группы) и тепловая карта зала по местам.
+
+"Какие места продаются первыми" считается по версиям мест: версия места -
+момент его последнего изменения, поэтому порядок версий занятых мест
+сеанса - порядок продажи. Учитываются места, занятые после загрузки
+сеанса (у загруженных из снапшота мест истории нет).
+
+Кэш двухуровневый. SessionIndex (порядок сеансов, группы по залам, коды
+кинотеатров, фильмов и дней) меняется только при создании и удалении
+сеансов: OccupancyAnalytics подписан на изменения каталога и ведет их
+счетчик. Отчет пересчитывается при изменении любого места: отпечаток -
+версии карт мест всех сеансов индекса (версия сеанса растет при каждом
+изменении места, в том числе в других воркерах).
+"""
+import json
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class SessionIndex:
+    """Каталожная часть аналитики для списка сеансов в порядке id"""
+
+    def __init__(self, session_list):
+        self.sessions = session_list
+        count = len(session_list)
+        # Группа - зал с раскладкой: у сеансов группы одна матрица мест
+        groups: Dict[tuple, List[int]] = {}
+        cinema_codes: Dict[int, int] = {}
+        movie_codes: Dict[str, int] = {}
+        day_codes: Dict[str, int] = {}
+        cinema, movie, day = [], [], []
+        for i, session in enumerate(session_list):
+            groups.setdefault((session.hall_id, session.layout), []).append(i)
+            cinema.append(cinema_codes.setdefault(session.cinema_id, len(cinema_codes)))
+            movie.append(movie_codes.setdefault(session.movie_title, len(movie_codes)))
+            day.append(day_codes.setdefault(session.session_date, len(day_codes)))
+
+        self.ids = np.fromiter((session.id for session in session_list), dtype=np.int64, count=count)
+        self.capacity = np.zeros(count, dtype=np.int64)
+        self.groups = []
+        for (hall_id, layout), positions in groups.items():
+            positions = np.array(positions, dtype=np.int64)
+            self.capacity[positions] = len(layout)
+            self.groups.append((hall_id, layout, positions))
+        self.by = {
+            "by_cinema": (list(cinema_codes), np.array(cinema, dtype=np.int64)),
+            "by_movie": (list(movie_codes), np.array(movie, dtype=np.int64)),
+            "by_day": (list(day_codes), np.array(day, dtype=np.int64))
+        }
+
+
+def seat_matrix(group, count: int) -> np.ndarray:
+    """Состояние мест сеансов группы: матрица (сеансы x места), 1 - свободно.
+
+    Сеансы с нераспакованной битовой картой (бинарный снапшот, расписание)
+    распаковываются здесь же через unpackbits, не трогая сами сеансы.
+    """
+    rows = np.empty((len(group), count), dtype=np.uint8)
+    unpacked, unpacked_data = [], []
+    packed, packed_data = [], []
+    for i, session in enumerate(group):
+        # Сеанс могут распаковать параллельно: читаем packed_seats один раз
+        bits = session.packed_seats
+        if bits is not None and session.availability is None:
+            packed.append(i)
+            packed_data.append(bits)
+        else:
+            unpacked.append(i)
+            unpacked_data.append(session.seat_states())
+    if unpacked:
+        rows[unpacked] = np.frombuffer(b"".join(unpacked_data), dtype=np.uint8).reshape(len(unpacked), count)
+    if packed:
+        width = (count + 7) // 8
+        data = np.frombuffer(b"".join(packed_data), dtype=np.uint8).reshape(len(packed), width)
+        rows[packed] = np.unpackbits(data, axis=1, bitorder="little")[:, :count]
+    return rows
+
+
+def sale_order(group, occupied: np.ndarray) -> tuple:
+    """Средний нормированный порядок продажи места (0 - продается первым) и
+    число сеансов, по которым он посчитан"""
+    count = occupied.shape[1]
+    with_history, versions_data, base = [], [], []
+    for i, session in enumerate(group):
+        versions = session.seat_versions
+        if versions is not None:
+            with_history.append(i)
+            versions_data.append(versions)
+            base.append(session.base_version)
+    if not with_history:
+        return np.full(count, np.nan), np.zeros(count, dtype=np.int64)
+
+    versions = np.frombuffer(b"".join(versions_data), dtype=np.uint64).reshape(len(with_history), count)
+    # Продано после загрузки сеанса - есть момент продажи
+    sold = occupied[with_history].astype(bool) & (versions > np.array(base, dtype=np.uint64)[:, None])
+    ordered = np.where(sold, versions, np.iinfo(np.uint64).max)
+    # Ранг места в сеансе: одна сортировка, ранги раскладываются по ее перестановке
+    ranks = np.empty(ordered.shape, dtype=np.float64)
+    np.put_along_axis(ranks, ordered.argsort(axis=1), np.arange(count, dtype=np.float64)[None, :], axis=1)
+    ranks /= np.maximum(sold.sum(axis=1) - 1, 1)[:, None]
+    sessions_sold = sold.sum(axis=0)
+    total = np.where(sold, ranks, 0).sum(axis=0)
+    mean = np.where(sessions_sold > 0, total / np.maximum(sessions_sold, 1), np.nan)
+    return mean, sessions_sold
+
+
+def group_fill(labels: list, codes: np.ndarray, sold: np.ndarray, capacity: np.ndarray) -> Dict:
+    """Заполняемость по группам: bincount по коду группы"""
+    sessions = np.bincount(codes, minlength=len(labels))
+    sold_sum = np.bincount(codes, weights=sold, minlength=len(labels))
+    capacity_sum = np.bincount(codes, weights=capacity, minlength=len(labels))
+    fill = np.round(sold_sum / np.maximum(capacity_sum, 1), 4)
+    return {
+        label: {
+            "sessions": group_sessions,
+            "sold": int(group_sold),
+            "capacity": int(group_capacity),
+            "fill_rate": group_fill_rate
+        }
+        for label, group_sessions, group_sold, group_capacity, group_fill_rate in zip(
+            labels, sessions.tolist(), sold_sum.tolist(), capacity_sum.tolist(), fill.tolist()
+        )
+    }
+
+
+def rounded(values: np.ndarray) -> list:
+    """Список для JSON: NaN -> None"""
+    return [None if value != value else value for value in np.round(values, 4).tolist()]
+
+
+class OccupancyReport:
+    """Посчитанная аналитика и ее закодированные ответы.
+
+    Заполняемость считается сразу, тепловая карта зала - при первом
+    запросе по матрицам мест, собранным для заполняемости.
+    """
+
+    def __init__(self, index: SessionIndex):
+        sold = np.zeros(len(index.sessions), dtype=np.int64)
+        # Зал -> (сеансы, матрица занятых мест, раскладка); зал мог сменить
+        # раскладку - берем раскладку с большим числом сеансов
+        self._halls: Dict[int, tuple] = {}
+        for hall_id, layout, positions in index.groups:
+            count = len(layout)
+            if not count:
+                continue
+            group = [index.sessions[i] for i in positions.tolist()]
+            occupied = 1 - seat_matrix(group, count)
+            sold[positions] = occupied.sum(axis=1)
+            current = self._halls.get(hall_id)
+            if current is None or len(current[0]) < len(group):
+                self._halls[hall_id] = (group, occupied, layout)
+
+        capacity = index.capacity
+        total_sold = int(sold.sum())
+        total_capacity = int(capacity.sum())
+        self.occupancy = {
+            "total": {
+                "sessions": len(index.sessions),
+                "sold": total_sold,
+                "capacity": total_capacity,
+                "fill_rate": round(total_sold / total_capacity, 4) if total_capacity else 0.0
+            },
+            # По сеансам - колонками, чтобы год сеансов кодировался быстро
+            "sessions": {
+                "id": index.ids.tolist(),
+                "sold": sold.tolist(),
+                "capacity": capacity.tolist(),
+                "fill_rate": np.round(sold / np.maximum(capacity, 1), 4).tolist()
+            },
+            **{
+                name: group_fill(labels, codes, sold, capacity)
+                for name, (labels, codes) in index.by.items()
+            }
+        }
+        self._bodies: Dict[object, bytes] = {}
+        self._lock = threading.Lock()
+
+    def heatmap(self, hall_id: int) -> Optional[dict]:
+        """Тепловая карта зала или None, если у зала нет сеансов"""
+        hall = self._halls.get(hall_id)
+        if hall is None:
+            return None
+        group, occupied, layout = hall
+        order_mean, order_sessions = sale_order(group, occupied)
+        return {
+            "hall_id": hall_id,
+            "sessions": len(group),
+            "seats": [{"row": row, "number": number} for row, number in layout.seats],
+            "occupancy": rounded(occupied.mean(axis=0)),
+            "sale_order": rounded(order_mean),
+            "sale_order_sessions": order_sessions.tolist()
+        }
+
+    def body(self, key, build) -> Optional[bytes]:
+        """JSON-тело ответа: build() вызывается и кодируется один раз на отчет"""
+        with self._lock:
+            if key not in self._bodies:
+                content = build()
+                self._bodies[key] = None if content is None else json.dumps(
+                    content, ensure_ascii=False, separators=(",", ":")
+                ).encode("utf-8")
+            return self._bodies[key]
+
+
+class OccupancyAnalytics:
+    """Кэш отчета: пересчитывается при первом запросе после изменения мест или сеансов"""
+
+    def __init__(self):
+        self._index: Optional[SessionIndex] = None
+        self._index_generation = None
+        self._report: Optional[OccupancyReport] = None
+        self._versions = None
+        self._lock = threading.Lock()
+        # Номер изменения каталога: растет при каждом создании и удалении сеансов
+        self.generation = 0
+        self.builds = 0
+
+    def session_changed(self, session):
+        """Подписчик storage.session_listeners: каталог сеансов изменился"""
+        self.generation += 1
+
+    def report(self, session_ids: List[int], sessions: dict) -> OccupancyReport:
+        """Отчет по сеансам session_ids (отсортированы) из словаря sessions"""
+        with self._lock:
+            # Номер читается до списка: изменение во время сборки индекса
+            # приведет к повторной сборке при следующем запросе
+            generation = self.generation
+            if self._index is None or self._index_generation != generation:
+                # Сеанс могут удалить, пока собирается список: такие id пропускаем
+                session_list = [sessions.get(session_id) for session_id in list(session_ids)]
+                self._index = SessionIndex([session for session in session_list if session is not None])
+                self._index_generation = generation
+                self._report = None
+            versions = tuple(session.version for session in self._index.sessions)
+            if self._report is None or self._versions != versions:
+                self._report = OccupancyReport(self._index)
+                self._versions = versions
+                self.builds += 1
+            return self._report
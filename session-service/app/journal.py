@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import threading
+from contextlib import nullcontext
+from typing import Callable, ContextManager, Iterator, Optional
+
+from app.logger import logger
+
+
+class SessionJournal:
+    """Журнал изменений сеансов (append-only) поверх снапшота sessions.json.
+
+    Каждая запись задает абсолютное значение (место, сеанс целиком или
+    удаление), поэтому повторное применение записей поверх более нового
+    снапшота дает то же итоговое состояние.
+
+    Журнал может писаться несколькими процессами. Тогда checkpoint_lock
+    делает чекпоинты поочередными, rotation_lock на время ротации
+    останавливает всех писателей, а append замечает, что журнал
+    ротировал другой процесс, и открывает новый файл.
+    """
+
+    def __init__(self, path: str,
+                 checkpoint_lock: Optional[Callable[[], ContextManager]] = None,
+                 rotation_lock: Optional[Callable[[], ContextManager]] = None):
+        self.path = path
+        self.checkpoint_lock = checkpoint_lock or nullcontext
+        self.rotation_lock = rotation_lock or nullcontext
+        self.shared = rotation_lock is not None
+        self.old_path = f"{path}.old"
+        self.records = 0
+        self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+        self._file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def append(self, record: dict):
+        """Дописать запись в конец журнала"""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._file is not None and self.shared and self._rotated_elsewhere():
+                self._file.close()
+                self._file = None
+            if self._file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            self.records += 1
+
+    def _rotated_elsewhere(self) -> bool:
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def replay(self) -> Iterator[dict]:
+        """Прочитать записи: сначала незавершенный чекпоинт, потом текущий журнал"""
+        for path in (self.old_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        # Оборванная запись при падении процесса
+                        logger.warning("Skipping broken journal record in %s", path)
+
+    def _rotate(self) -> bool:
+        """Начать новый журнал, старый хранится до записи снапшота"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if not os.path.exists(self.path):
+                return False
+            if os.path.exists(self.old_path):
+                # Предыдущий чекпоинт не завершился - склеиваем журналы
+                with open(self.old_path, "ab") as dst, open(self.path, "rb") as src:
+                    shutil.copyfileobj(src, dst)
+                os.remove(self.path)
+            else:
+                os.replace(self.path, self.old_path)
+            self.records = 0
+            return True
+
+    def checkpoint(self, write_snapshot: Callable[[], None]):
+        """Сжать журнал в снапшот"""
+        with self._checkpoint_lock, self.checkpoint_lock():
+            with self.rotation_lock():
+                rotated = self._rotate()
+            if not rotated:
+                return
+            write_snapshot()
+            os.remove(self.old_path)
+            logger.info("Sessions journal checkpointed")
+
+    def start_checkpointer(self, write_snapshot: Callable[[], None], interval: float):
+        """Периодически делать чекпоинт в фоновом потоке"""
+        def run():
+            while not self._stop.wait(interval):
+                if not self.records:
+                    continue
+                try:
+                    self.checkpoint(write_snapshot)
+                except Exception as e:
+                    logger.error("Error checkpointing sessions: %s", e)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="sessions-checkpointer", daemon=True)
+        self._thread.start()
+
+    def stop_checkpointer(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
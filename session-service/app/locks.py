@@ -0,0 +1,17 @@
+import threading
+from typing import Hashable
+
+
+class StripedLock:
+    """Фиксированный набор блокировок, между которыми распределяются ключи.
+
+    Обработчики одного ключа (например, одного сеанса) выполняются по очереди,
+    разных ключей - параллельно, если не попали в одну полосу. Память не
+    растет с числом ключей.
+    """
+
+    def __init__(self, stripes: int):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def __call__(self, key: Hashable) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
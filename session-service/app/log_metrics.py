@@ -0,0 +1,138 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from app.logger import logger
+
+# Сколько байт читать из файла за раз
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class _FileState:
+    """Позиция чтения файла логов и недочитанный хвост последней строки"""
+
+    __slots__ = ("offset", "partial", "seen")
+
+    def __init__(self):
+        self.offset = 0
+        self.partial = b""
+        self.seen = True
+
+
+class LogMetricsTailer:
+    """Фоновый подсчет метрик по логам сервисов.
+
+    Файлы отслеживаются по (устройство, inode), поэтому переименованный при
+    ротации файл дочитывается с прежней позиции, а новый файл с тем же
+    именем читается с начала. Если файл стал короче позиции (truncate),
+    он перечитывается с начала. Каждый байт логов просматривается один раз.
+
+    Строки JSON-логов (LOG_OUTPUT=json) считаются точно, по полю event
+    (events: событие -> счетчик); текстовые строки - по patterns.
+    """
+
+    def __init__(self, log_dirs: Dict[str, str], patterns: Dict[str, "re.Pattern"], interval: float,
+                 events: Optional[Dict[str, str]] = None):
+        self.log_dirs = log_dirs
+        self.patterns = patterns
+        self.events = events or {}
+        self.interval = interval
+        self._files: Dict[Tuple[int, int], _FileState] = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def counters(self) -> Counter:
+        """Текущие значения счетчиков"""
+        with self._lock:
+            return Counter(self._counters)
+
+    def poll(self):
+        """Дочитать новые строки во всех файлах логов"""
+        for state in self._files.values():
+            state.seen = False
+
+        for path in self.log_dirs.values():
+            if not os.path.isdir(path):
+                continue
+            for file in os.listdir(path):
+                file_path = os.path.join(path, file)
+                try:
+                    self._poll_file(file_path)
+                except OSError as e:
+                    logger.warning("Error reading log file %s: %s", file_path, e)
+
+        # Удаленные файлы больше не отслеживаем
+        for key in [key for key, state in self._files.items() if not state.seen]:
+            del self._files[key]
+
+    def _poll_file(self, file_path: str):
+        with open(file_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            key = (stat.st_dev, stat.st_ino)
+            state = self._files.get(key)
+            if state is None:
+                state = self._files[key] = _FileState()
+            state.seen = True
+
+            if stat.st_size < state.offset:
+                # Файл обрезали - читаем заново
+                state.offset = 0
+                state.partial = b""
+            if stat.st_size == state.offset:
+                return
+
+            f.seek(state.offset)
+            while True:
+                chunk = f.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                state.offset += len(chunk)
+                lines = (state.partial + chunk).split(b"\n")
+                # Последняя строка может быть еще не дописана
+                state.partial = lines.pop()
+                self._count(lines)
+
+    def _count(self, lines):
+        found = Counter()
+        for raw_line in lines:
+            if raw_line.startswith(b"{"):
+                try:
+                    key = self.events.get(json.loads(raw_line).get("event"))
+                except ValueError:
+                    key = None
+                if key is not None:
+                    found[key] += 1
+                continue
+            line = raw_line.decode("utf-8", errors="replace")
+            for key, pattern in self.patterns.items():
+                if pattern.search(line):
+                    found[key] += 1
+        if found:
+            with self._lock:
+                self._counters.update(found)
+
+    def start(self):
+        """Запустить фоновый опрос логов"""
+        def run():
+            while True:
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error("Error collecting log metrics: %s", e)
+                if self._stop.wait(self.interval):
+                    break
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="log-metrics-tailer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
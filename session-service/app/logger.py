@@ -1,18 +1,162 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
 
+SERVICE_NAME = "session-service"
 LOG_DIR = "logs"
-LOG_FILE = os.path.join(LOG_DIR, "session-service.log")
+LOG_FILE = os.path.join(LOG_DIR, f"{SERVICE_NAME}.log")
+LOG_FORMAT = "%(asctime)s | %(levelname)s | %(message)s"
+
+# Формат логов: text (строка LOG_FORMAT) или json (строка JSON на запись)
+LOG_OUTPUT = os.getenv("LOG_OUTPUT", "text")
+# Уровень логов сервиса; меняется на ходу через set_level (PUT /logging/level)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Размер очереди записей; при переполнении записи отбрасываются, а не ждут диск
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Выборка INFO-записей частых обработчиков: "функция=доля,..." (1 - все записи, 0 - ни одной)
+LOG_SAMPLING = os.getenv(
+    "LOG_SAMPLING",
+    "get_sessions_api=0.1,get_session=0.1,get_seats_api=0.1,get_seats=0.1,get_seat=0.1"
+)
 
 os.makedirs(LOG_DIR, exist_ok=True)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-    handlers=[
-        logging.FileHandler(LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
 
-logger = logging.getLogger("session-service")
\ No newline at end of file
+class DroppingQueueHandler(QueueHandler):
+    """Кладет запись в очередь и не ждет: при полной очереди запись отбрасывается.
+
+    Текст записи (подстановка аргументов) готовится в потоке запроса, но
+    только для записей, прошедших уровень и выборку; время, формат строки
+    и запись в файл и консоль - в потоке QueueListener.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        # Форматтер по умолчанию из basicConfig добавил бы уровень и имя к тексту
+        self.setFormatter(logging.Formatter("%(message)s"))
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RouteSampler(logging.Filter):
+    """Выборка INFO-записей по обработчику (имени функции, из которой пишется лог).
+
+    Пропускается каждая n-я запись, а не случайная: из 1000 запросов с
+    долей 0.01 в лог попадают ровно 10. WARNING и выше пишутся всегда.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates: Dict[str, float] = {}
+        self._intervals: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        for name, rate in rates.items():
+            self.set_rate(name, rate)
+
+    def set_rate(self, name: str, rate: float):
+        self.rates[name] = rate
+        self._intervals[name] = round(1 / rate) if rate > 0 else 0
+
+    def filter(self, record) -> bool:
+        if record.levelno != logging.INFO:
+            return True
+        interval = self._intervals.get(record.funcName)
+        if interval is None:
+            return True
+        if not interval:
+            return False
+        count = self._counts.get(record.funcName, 0)
+        self._counts[record.funcName] = count + 1
+        return count % interval == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Строка JSON на запись: ts, level, event, ticket_id, session_id,
+    latency_ms, service и msg - всегда все и всегда в этом порядке
+    (null, если поля нет). event, ticket_id, session_id и latency_ms
+    передаются в extra.
+
+    До msg в строке ровно одно двоеточие на поле: monitoring/analyze_logs.py
+    находит поля по номеру двоеточия, не разбирая JSON.
+    """
+
+    def format(self, record) -> str:
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            message = f"{message}\n{record.exc_text}"
+        event = getattr(record, "event", None)
+        ticket_id = getattr(record, "ticket_id", None)
+        session_id = getattr(record, "session_id", None)
+        latency_ms = getattr(record, "latency_ms", None)
+        return (
+            f'{{"ts":{record.created:.3f},"level":"{record.levelname}",'
+            f'"event":{"null" if event is None else json.dumps(event)},'
+            f'"ticket_id":{"null" if ticket_id is None else int(ticket_id)},'
+            f'"session_id":{"null" if session_id is None else int(session_id)},'
+            f'"latency_ms":{"null" if latency_ms is None else format(latency_ms, ".3f")},'
+            f'"service":"{SERVICE_NAME}","msg":{json.dumps(message, ensure_ascii=False)}}}'
+        )
+
+
+def elapsed_ms(started: float) -> float:
+    """Миллисекунды с момента started (time.perf_counter()) - для latency_ms"""
+    return (time.perf_counter() - started) * 1000
+
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """"функция=доля,..." -> {функция: доля}"""
+    rates = {}
+    for item in value.split(","):
+        name, _, rate = item.strip().partition("=")
+        if name and rate:
+            rates[name] = float(rate)
+    return rates
+
+
+formatter = JsonFormatter() if LOG_OUTPUT == "json" else logging.Formatter(LOG_FORMAT)
+file_handler = logging.FileHandler(LOG_FILE)
+file_handler.setFormatter(formatter)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(formatter)
+
+log_queue = queue.Queue(LOG_QUEUE_SIZE)
+queue_handler = DroppingQueueHandler(log_queue)
+listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+listener.start()
+# При выходе дописать то, что осталось в очереди
+atexit.register(listener.stop)
+
+logging.basicConfig(level=logging.INFO, handlers=[queue_handler])
+
+sampler = RouteSampler(parse_sampling(LOG_SAMPLING))
+
+logger = logging.getLogger(SERVICE_NAME)
+logger.setLevel(LOG_LEVEL)
+logger.addFilter(sampler)
+
+
+def set_level(level: str):
+    """Сменить уровень логов сервиса (ValueError - неизвестный уровень)"""
+    logger.setLevel(level.upper())
+
+
+def logging_settings() -> dict:
+    """Текущий уровень, выборка и состояние очереди"""
+    return {
+        "level": logging.getLevelName(logger.level),
+        "sampling": dict(sampler.rates),
+        "queued": log_queue.qsize(),
+        "dropped": queue_handler.dropped
+    }
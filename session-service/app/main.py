@@ -1,18 +1,32 @@
+import asyncio
 import json
 import os
 import re
-from datetime import datetime
+import threading
 from collections import Counter
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from fastapi import FastAPI, HTTPException, Header, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict
+from typing import List, Dict, Optional
 
-from app.schemas import SessionSchema, CreateSessionSchema, SeatSchema, UpdateSeatSchema, HallSchema, UpdateSessionSchema, CinemaSchema, CreateMultipleSessionsSchema
-from app.storage import sessions, halls, cinemas
-from app.logger import logger
-from app.models import Seat
-from app.logging_service import log_action, get_logs, LOG_FILE
+from app.schemas import SessionSchema, CreateSessionSchema, SeatSchema, UpdateSeatSchema, UpdateSeatsSchema, SeatChangeSchema, HallSchema, UpdateSessionSchema, CinemaSchema, CreateMultipleSessionsSchema, CreateScheduleSchema, ScheduleCreatedSchema
+from app.storage import sessions, session_ids, halls, cinemas, add_session, add_sessions, remove_session, clear_sessions, is_slot_occupied, occupied_slots, slot_key, next_session_id, allocate_session_ids, find_sessions, session_matches, movie_key, session_listeners, halls_by_cinema, reindex_halls
+from app.logger import logger, set_level, logging_settings
+from app.models import Seat, SeatLayout, SeatConflict
+from app.logging_service import log_action, query_actions, tail_lines, clear_logs
+from app.journal import SessionJournal
+from app.snapshot import read_snapshot, write_snapshot
+from app.log_metrics import LogMetricsTailer
+from app.seat_events import seat_events, format_event, HEARTBEAT_INTERVAL
+from app.response_cache import ResponseCache, encode_json
+from app.locks import StripedLock
+from app.seat_finder import find_best_block
+from app.analytics import OccupancyAnalytics
+from app.request_metrics import RequestMetrics, RequestMetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from app.shared_state import SharedState, SharedArenaFull
+from app.sqlite_store import SqliteSessionStore
 
 app = FastAPI(
     title="Session Service",
@@ -28,91 +42,391 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+JSON_CONTENT_TYPE = b"application/json; charset=utf-8"
+
+class JsonCharset:
+    """ASGI middleware: явная кодировка utf-8 в content-type JSON-ответов.
+
+    Меняет только заголовки http.response.start, тело ответа идет как есть
+    (в отличие от @app.middleware("http"), который оборачивает каждый ответ).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_charset(message):
+            if message["type"] == "http.response.start":
+                headers = message.get("headers", ())
+                for i, (name, value) in enumerate(headers):
+                    if name == b"content-type":
+                        if value.startswith(b"application/json") and value != JSON_CONTENT_TYPE:
+                            headers = list(headers)
+                            headers[i] = (name, JSON_CONTENT_TYPE)
+                            message = {**message, "headers": headers}
+                        break
+            await send(message)
+
+        await self.app(scope, receive, send_with_charset)
+
 # Добавляем middleware для правильной кодировки
-@app.middleware("http")
-async def add_charset_header(request, call_next):
-    response = await call_next(request)
-    if response.headers.get("content-type", "").startswith("application/json"):
-        response.headers["content-type"] = "application/json; charset=utf-8"
-    return response
+app.add_middleware(JsonCharset)
 
 # Файловое хранилище
-DATA_DIR = "/app/data"
+DATA_DIR = os.getenv("SESSION_DATA_DIR", "/app/data")
 SESSIONS_FILE = f"{DATA_DIR}/sessions.json"
+SESSIONS_BIN_FILE = f"{DATA_DIR}/sessions.bin"
+SESSIONS_JOURNAL_FILE = f"{DATA_DIR}/sessions.journal"
 HALLS_FILE = f"{DATA_DIR}/halls.json"
+SESSIONS_DB_FILE = f"{DATA_DIR}/sessions.db"
+# Где хранятся сеансы и залы: json (снапшот и журнал) или sqlite (sessions.db)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+# Формат снапшота сеансов: json (sessions.json) или binary (sessions.bin)
+SESSIONS_SNAPSHOT_FORMAT = os.getenv("SESSIONS_SNAPSHOT_FORMAT", "json")
+# Как часто журнал изменений сжимается в снапшот (секунды)
+CHECKPOINT_INTERVAL = float(os.getenv("SESSIONS_CHECKPOINT_INTERVAL", "30"))
+
+# Общее состояние для запуска в несколько воркеров (uvicorn --workers N):
+# директория в общей памяти. Включается, только если воркеров больше одного
+# (SESSION_WORKERS) или директория задана явно; один воркер работает в памяти
+# процесса - с блокировками по сеансам и push-рассылкой SSE
+SESSION_WORKERS = int(os.getenv("SESSION_WORKERS", "1"))
+SHARED_STATE_DIR = os.getenv("SESSION_SHARED_STATE_DIR") or (
+    "/dev/shm/session-service" if SESSION_WORKERS > 1 else None
+)
+SHARED_ARENA_MB = int(os.getenv("SESSION_SHARED_ARENA_MB", "256"))
+# Как часто воркер проверяет изменения мест для SSE-подписчиков (секунды)
+SEAT_EVENTS_POLL_INTERVAL = float(os.getenv("SEAT_EVENTS_POLL_INTERVAL", "0.1"))
+
+shared_state = SharedState(SHARED_STATE_DIR, SHARED_ARENA_MB * 1024 * 1024) if SHARED_STATE_DIR else None
+
+# Изменения мест одного сеанса выполняются по очереди (под блокировкой полосы)
+SESSION_LOCK_STRIPES = int(os.getenv("SESSION_LOCK_STRIPES", "64"))
+session_locks = StripedLock(SESSION_LOCK_STRIPES)
+
+# Создание и удаление сеансов (проверка слота и запись) - по одному за раз
+catalog_lock = threading.RLock()
+
+@contextmanager
+def catalog_change():
+    """Блокировка изменения каталога; в режиме воркеров - общая для всех воркеров"""
+    if shared_state is None:
+        with catalog_lock:
+            yield
+        return
+    with shared_state.write_lock():
+        sync_catalog()
+        # Лента растет только при изменениях каталога - здесь же она и сжимается
+        compact_catalog_feed()
+        yield
+
+@contextmanager
+def shared_session_lock():
+    """Места лежат в общей памяти: пишет один воркер за раз. Каталог дочитывается
+    под блокировкой - блок удаленного сеанса мог уже достаться новому сеансу"""
+    with shared_state.write_lock():
+        sync_catalog()
+        yield
+
+def session_lock(session_id):
+    """Блокировка изменения мест сеанса"""
+    if shared_state is None:
+        return session_locks(session_id)
+    return shared_session_lock()
+
+@contextmanager
+def journal_rotation():
+    """Ротация журнала в режиме воркеров: остальные воркеры не пишут, каталог актуален.
+    Заодно сжимается лента каталога, если она сильно выросла"""
+    with shared_state.write_lock():
+        sync_catalog()
+        compact_catalog_feed()
+        yield
+
+if shared_state is None:
+    session_journal = SessionJournal(SESSIONS_JOURNAL_FILE)
+else:
+    session_journal = SessionJournal(
+        SESSIONS_JOURNAL_FILE,
+        checkpoint_lock=shared_state.checkpoint_lock,
+        rotation_lock=journal_rotation
+    )
+
+# Кэш готовых ответов каталога; сбрасывается при изменении сеансов и залов
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+catalog_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+session_listeners.append(catalog_cache.session_changed)
 
 def ensure_data_dir():
     """Создать директорию для данных если не существует"""
     os.makedirs(DATA_DIR, exist_ok=True)
 
+if STORAGE_BACKEND == "sqlite":
+    ensure_data_dir()
+    sqlite_store = SqliteSessionStore(SESSIONS_DB_FILE)
+else:
+    sqlite_store = None
+
+def session_to_dict(session):
+    """Сериализовать сеанс для снапшота и журнала"""
+    return {
+        "id": session.id,
+        "movie_title": session.movie_title,
+        "cinema_id": session.cinema_id,
+        "hall_id": session.hall_id,
+        "start_time": session.start_time,
+        "session_date": session.session_date,
+        "price": session.price,
+        "seats": [
+            {"row": row, "number": number, "is_available": bool(available)}
+            for (row, number), available in zip(session.layout.seats, session.seat_states())
+        ]
+    }
+
+def session_to_schema(session):
+    """Описание сеанса для ответов API (без мест)"""
+    return SessionSchema(
+        id=session.id,
+        movie_title=session.movie_title,
+        cinema_id=session.cinema_id,
+        hall_id=session.hall_id,
+        start_time=session.start_time,
+        session_date=session.session_date,
+        price=session.price
+    )
+
+def session_from_dict(session_data):
+    """Восстановить сеанс из снапшота или записи журнала"""
+    seats_data = session_data["seats"]
+    # Раскладка мест общая для всех сеансов с одинаковым залом
+    layout = SeatLayout.intern((seat["row"], seat["number"]) for seat in seats_data)
+    availability = bytearray(bool(seat["is_available"]) for seat in seats_data)
+    
+    from app.models import Session
+    # Простая и надежная логика для session_date
+    session_date = session_data.get("session_date")
+    if not session_date:
+        # Fallback: пробуем извлечь из start_time
+        start_time_str = session_data.get("start_time", "")
+        if "T" in start_time_str:
+            session_date = start_time_str.split("T")[0]
+        elif " " in start_time_str:
+            session_date = start_time_str.split(" ")[0]
+        else:
+            session_date = datetime.now().strftime("%Y-%m-%d")
+    
+    return Session(
+        id=session_data["id"],
+        movie_title=session_data["movie_title"],
+        cinema_id=session_data.get("cinema_id", 1),  # Для обратной совместимости
+        hall_id=session_data["hall_id"],
+        start_time=session_data["start_time"],
+        session_date=session_date,
+        price=session_data["price"],
+        layout=layout,
+        availability=availability
+    )
+
 def save_sessions():
-    """Сохранить сессии в файл"""
+    """Сохранить снапшот всех сессий в файл"""
     ensure_data_dir()
-    sessions_data = {}
-    for session_id, session in sessions.items():
-        sessions_data[session_id] = {
-            "id": session.id,
-            "movie_title": session.movie_title,
-            "cinema_id": session.cinema_id,
-            "hall_id": session.hall_id,
-            "start_time": session.start_time,
-            "session_date": session.session_date,
-            "price": session.price,
-            "seats": [
-                {"row": seat.row, "number": seat.number, "is_available": seat.is_available}
-                for seat in session.seats
-            ]
+    if SESSIONS_SNAPSHOT_FORMAT == "binary":
+        write_snapshot(SESSIONS_BIN_FILE, list(sessions.values()))
+        saved_file, stale_file = SESSIONS_BIN_FILE, SESSIONS_FILE
+    else:
+        sessions_data = {
+            session_id: session_to_dict(session)
+            for session_id, session in list(sessions.items())
         }
-    
-    with open(SESSIONS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(sessions_data, f, ensure_ascii=False, indent=2)
-    logger.info(f"Sessions saved to {SESSIONS_FILE}")
+        
+        # Пишем во временный файл, чтобы не оставить битый снапшот при падении
+        tmp_file = f"{SESSIONS_FILE}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(sessions_data, f, ensure_ascii=False)
+        os.replace(tmp_file, SESSIONS_FILE)
+        saved_file, stale_file = SESSIONS_FILE, SESSIONS_BIN_FILE
+    
+    # Снапшот в другом формате больше не актуален
+    if os.path.exists(stale_file):
+        os.remove(stale_file)
+    logger.info("Sessions saved to %s", saved_file)
+
+def read_json_snapshot(path):
+    """Прочитать сеансы из sessions.json"""
+    with open(path, 'r', encoding='utf-8') as f:
+        sessions_data = json.load(f)
+    return [session_from_dict(session_data) for session_data in sessions_data.values()]
+
+def journal_seat(session_id, seat):
+    """Записать изменение места в журнал"""
+    if sqlite_store is not None:
+        sqlite_store.update_seats(session_id, [seat])
+        return
+    session_journal.append({
+        "op": "seat",
+        "session_id": session_id,
+        "row": seat.row,
+        "number": seat.number,
+        "is_available": seat.is_available
+    })
+
+def journal_seats(session_id, seats):
+    """Записать изменение нескольких мест в журнал одной записью"""
+    if sqlite_store is not None:
+        sqlite_store.update_seats(session_id, seats)
+        return
+    session_journal.append({
+        "op": "seats",
+        "session_id": session_id,
+        "seats": [
+            {"row": seat.row, "number": seat.number, "is_available": seat.is_available}
+            for seat in seats
+        ]
+    })
+
+def journal_session_created(session):
+    """Записать новый сеанс в журнал"""
+    if sqlite_store is not None:
+        sqlite_store.add_sessions([session])
+        return
+    session_journal.append({"op": "create", "session": session_to_dict(session)})
+
+def journal_schedule_created(new_sessions):
+    """Записать пачку новых сеансов одной записью журнала.
+
+    Места не пишутся: у новых сеансов все свободны, раскладка каждого зала
+    пишется один раз.
+    """
+    if sqlite_store is not None:
+        sqlite_store.add_sessions(new_sessions)
+        return
+    layouts = {}
+    for session in new_sessions:
+        if session.hall_id not in layouts:
+            layouts[session.hall_id] = session.layout.seats
+    session_journal.append({
+        "op": "schedule",
+        "layouts": layouts,
+        "sessions": [
+            [session.id, session.movie_title, session.cinema_id, session.hall_id,
+             session.start_time, session.session_date, session.price]
+            for session in new_sessions
+        ]
+    })
+
+def schedule_sessions_from_record(record):
+    """Восстановить сеансы из записи журнала schedule"""
+    from app.models import Session
+    layouts = {
+        int(hall_id): SeatLayout.intern(seats)
+        for hall_id, seats in record["layouts"].items()
+    }
+    created_at = datetime.now().isoformat()
+    return [
+        Session(
+            id=session_id,
+            movie_title=movie_title,
+            cinema_id=cinema_id,
+            hall_id=hall_id,
+            start_time=start_time,
+            session_date=session_date,
+            price=price,
+            layout=layouts[hall_id],
+            availability=None,
+            created_at=created_at,
+            packed_seats=layouts[hall_id].free_seat_bits()
+        )
+        for session_id, movie_title, cinema_id, hall_id, start_time, session_date, price in record["sessions"]
+    ]
+
+def journal_session_deleted(session_id):
+    """Записать удаление сеанса в журнал"""
+    if sqlite_store is not None:
+        sqlite_store.delete_session(session_id)
+        return
+    session_journal.append({"op": "delete", "session_id": session_id})
+
+def apply_journal_record(record):
+    """Применить запись журнала к сессиям в памяти"""
+    op = record.get("op")
+    if op == "create":
+        add_session(session_from_dict(record["session"]))
+    elif op == "schedule":
+        add_sessions(schedule_sessions_from_record(record))
+    elif op == "delete":
+        remove_session(record["session_id"])
+    elif op == "seat":
+        session = sessions.get(record["session_id"])
+        if session:
+            session.set_seat_available(record["row"], record["number"], record["is_available"])
+    elif op == "seats":
+        session = sessions.get(record["session_id"])
+        if session:
+            for seat in record["seats"]:
+                session.set_seat_available(seat["row"], seat["number"], seat["is_available"])
 
 def load_sessions():
-    """Загрузить сессии из файла"""
-    if not os.path.exists(SESSIONS_FILE):
-        logger.info("Sessions file not found, using default data")
+    """Загрузить сессии из выбранного хранилища"""
+    if sqlite_store is None:
+        load_sessions_from_files()
         return
     
     try:
-        with open(SESSIONS_FILE, 'r', encoding='utf-8') as f:
-            sessions_data = json.load(f)
+        if sqlite_store.is_empty():
+            migrate_sessions_to_sqlite()
+            return
+        clear_sessions()
+        add_sessions(sqlite_store.load_sessions())
+        logger.info("Loaded %s sessions from %s", len(sessions), SESSIONS_DB_FILE)
+    except Exception as e:
+        logger.error("Error loading sessions: %s", e)
+
+def migrate_sessions_to_sqlite():
+    """Миграция: перенести сеансы из JSON-снапшота и журнала в пустую базу.
+
+    Файлы остаются на месте, при возврате на STORAGE_BACKEND=json они
+    читаются как раньше (без изменений, сделанных в базе).
+    """
+    load_sessions_from_files()
+    sqlite_store.add_sessions(sorted(sessions.values(), key=lambda session: session.id))
+    logger.info("Migrated %s sessions to %s", len(sessions), SESSIONS_DB_FILE)
+
+def load_sessions_from_files():
+    """Загрузить сессии: снапшот из файла плюс журнал изменений"""
+    try:
+        clear_sessions()
+        snapshots = [(SESSIONS_FILE, read_json_snapshot), (SESSIONS_BIN_FILE, read_snapshot)]
+        if SESSIONS_SNAPSHOT_FORMAT == "binary":
+            snapshots.reverse()
         
-        sessions.clear()
-        for session_id, session_data in sessions_data.items():
-            session_seats = [
-                Seat(row=seat["row"], number=seat["number"], is_available=seat["is_available"])
-                for seat in session_data["seats"]
-            ]
-            
-            from app.models import Session
-            # Простая и надежная логика для session_date
-            session_date = session_data.get("session_date")
-            if not session_date:
-                # Fallback: пробуем извлечь из start_time
-                start_time_str = session_data.get("start_time", "")
-                if "T" in start_time_str:
-                    session_date = start_time_str.split("T")[0]
-                elif " " in start_time_str:
-                    session_date = start_time_str.split(" ")[0]
-                else:
-                    session_date = datetime.now().strftime("%Y-%m-%d")
-            
-            session = Session(
-                id=session_data["id"],
-                movie_title=session_data["movie_title"],
-                cinema_id=session_data.get("cinema_id", 1),  # Для обратной совместимости
-                hall_id=session_data["hall_id"],
-                start_time=session_data["start_time"],
-                session_date=session_date,
-                price=session_data["price"],
-                seats=session_seats
-            )
-            sessions[int(session_id)] = session
+        # Снапшот в другом формате (после смены SESSIONS_SNAPSHOT_FORMAT) тоже читаем
+        converted = False
+        for snapshot_file, read in snapshots:
+            if os.path.exists(snapshot_file):
+                for session in read(snapshot_file):
+                    add_session(session)
+                converted = snapshot_file != snapshots[0][0]
+                logger.info("Loaded %s sessions from %s", len(sessions), snapshot_file)
+                break
+        else:
+            logger.info("Sessions file not found, using default data")
+        
+        replayed = 0
+        for record in session_journal.replay():
+            apply_journal_record(record)
+            replayed += 1
         
-        logger.info(f"Loaded {len(sessions)} sessions from file")
+        if replayed:
+            logger.info("Replayed %s journal records", replayed)
+            session_journal.checkpoint(save_sessions)
+        if converted:
+            save_sessions()
     except Exception as e:
-        logger.error(f"Error loading sessions: {e}")
+        logger.error("Error loading sessions: %s", e)
 
 def save_halls():
     """Сохранить залы в файл"""
@@ -133,9 +447,32 @@ def save_halls():
     
     with open(HALLS_FILE, 'w', encoding='utf-8') as f:
         json.dump(halls_data, f, ensure_ascii=False, indent=2)
-    logger.info(f"Halls saved to {HALLS_FILE}")
+    logger.info("Halls saved to %s", HALLS_FILE)
 
 def load_halls():
+    """Загрузить залы из выбранного хранилища"""
+    if sqlite_store is None:
+        load_halls_from_file()
+        return
+    
+    try:
+        db_halls = sqlite_store.load_halls()
+        if db_halls is None:
+            # Миграция: залы из halls.json (или залы по умолчанию) - в базу
+            load_halls_from_file()
+            sqlite_store.save_halls(halls.values())
+            logger.info("Migrated %s halls to %s", len(halls), SESSIONS_DB_FILE)
+            return
+        halls.clear()
+        for hall in db_halls:
+            halls[hall.id] = hall
+        reindex_halls()
+        catalog_cache.invalidate("halls")
+        logger.info("Loaded %s halls from %s", len(halls), SESSIONS_DB_FILE)
+    except Exception as e:
+        logger.error("Error loading halls: %s", e)
+
+def load_halls_from_file():
     """Загрузить залы из файла"""
     if not os.path.exists(HALLS_FILE):
         logger.info("Halls file not found, using default data")
@@ -163,26 +500,194 @@ def load_halls():
             )
             halls[int(hall_id)] = hall
         
-        logger.info(f"Loaded {len(halls)} halls from file")
+        reindex_halls()
+        catalog_cache.invalidate("halls")
+        logger.info("Loaded %s halls from file", len(halls))
+    except Exception as e:
+        logger.error("Error loading halls: %s", e)
+
+def feed_create_record(session, layout_id, offset):
+    """Запись ленты каталога о сеансе, места которого лежат в блоке offset"""
+    return {"op": "create", "session": [
+        session.id, session.movie_title, session.cinema_id, session.hall_id,
+        session.start_time, session.session_date, session.price, session.created_at,
+        layout_id, offset
+    ]}
+
+def commit_new_sessions(new_sessions):
+    """Добавить созданные сеансы в каталог (в режиме воркеров - и в общую память)"""
+    if shared_state is None:
+        if len(new_sessions) == 1:
+            add_session(new_sessions[0])
+        else:
+            add_sessions(new_sessions)
+        return
+    records = []
+    for session in new_sessions:
+        layout_id = shared_state.layout_record(session.layout, records)
+        offset = shared_state.allocate(session, records)
+        records.append(feed_create_record(session, layout_id, offset))
+    add_sessions(new_sessions)
+    shared_state.publish(records)
+
+def commit_session_deleted(session_id):
+    """Убрать сеанс из каталога (в режиме воркеров - и у остальных воркеров)"""
+    session = remove_session(session_id)
+    if shared_state is not None:
+        records = [{"op": "delete", "session_id": session_id}]
+        if session is not None:
+            # Блок мест освобождается для следующих сеансов
+            shared_state.free(session, records)
+        shared_state.publish(records)
+
+def session_from_feed(record):
+    """Сеанс из записи ленты каталога, привязанный к своему блоку в общей памяти"""
+    session_id, movie_title, cinema_id, hall_id, start_time, session_date, price, created_at, layout_id, offset = record["session"]
+    from app.models import Session
+    session = Session(
+        id=session_id,
+        movie_title=movie_title,
+        cinema_id=cinema_id,
+        hall_id=hall_id,
+        start_time=start_time,
+        session_date=session_date,
+        price=price,
+        layout=shared_state.layouts[layout_id],
+        availability=None,
+        created_at=created_at
+    )
+    shared_state.bind(session, offset)
+    return session
+
+def apply_feed_record(record):
+    """Применить запись ленты каталога, опубликованную другим воркером"""
+    if record["op"] == "create":
+        add_session(session_from_feed(record))
+    elif record["op"] == "delete":
+        remove_session(record["session_id"])
+
+def reload_feed_catalog(records, unchanged):
+    """Лента прочитана с начала (первый запуск воркера или ее сжали):
+    каталог приводится к ее записям, сеансы с прежним блоком остаются как есть"""
+    # После сжатого каталога в ленте могут быть новые создания и удаления
+    live = {}
+    for record in records:
+        if record["op"] == "create":
+            live[record["session"][0]] = record
+        elif record["op"] == "delete":
+            live.pop(record["session_id"], None)
+    for session_id in [session_id for session_id in sessions if session_id not in live]:
+        remove_session(session_id)
+    new_sessions = [
+        session_from_feed(record) for session_id, record in live.items()
+        if session_id not in unchanged or session_id not in sessions
+    ]
+    if new_sessions:
+        add_sessions(new_sessions)
+
+def sync_catalog():
+    """Дочитать изменения каталога от других воркеров"""
+    if shared_state is not None:
+        shared_state.sync(apply_feed_record, reload_feed_catalog)
+
+def compact_catalog_feed():
+    """Сжать ленту каталога до текущих сеансов (под блокировкой записи, после sync)"""
+    def session_records():
+        return [
+            feed_create_record(session, shared_state.layout_ids[session.layout],
+                               shared_state.session_blocks[session.id][0])
+            for session in sessions.values()
+        ]
+    try:
+        shared_state.compact_feed(session_records)
     except Exception as e:
-        logger.error(f"Error loading halls: {e}")
+        logger.error("Error compacting catalog feed: %s", e)
+
+def initialize_shared_state():
+    """Первый воркер: загрузить сеансы с диска и перенести их в общую память"""
+    load_sessions()
+    commit_new_sessions([sessions[session_id] for session_id in sorted(sessions)])
 
 # Загружаем данные при старте
-load_sessions()
+if shared_state is None:
+    load_sessions()
+elif not shared_state.attach(initialize_shared_state):
+    sync_catalog()
 load_halls()
 
 
+class SharedCatalogSync:
+    """ASGI middleware: перед запросом дочитать изменения каталога других воркеров"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            sync_catalog()
+        await self.app(scope, receive, send)
+
+if shared_state is not None:
+    app.add_middleware(SharedCatalogSync)
+
+# Метрики запросов: добавляется последним, чтобы учитывать остальные middleware
+request_metrics = RequestMetrics()
+app.add_middleware(RequestMetricsMiddleware, metrics=request_metrics)
+
+@app.exception_handler(SharedArenaFull)
+def shared_arena_full_handler(request, exc):
+    logger.error("Shared session state is full: %s", exc)
+    return JSONResponse(status_code=507, content={"detail": "Нет места в общей памяти под новые сеансы (SESSION_SHARED_ARENA_MB)"})
+
+
 @app.on_event("startup")
 def startup():
+    if sqlite_store is None:
+        session_journal.start_checkpointer(save_sessions, CHECKPOINT_INTERVAL)
+    if shared_state is not None:
+        seat_events.start_polling(sessions.get, SEAT_EVENTS_POLL_INTERVAL)
+    log_metrics.start()
     logger.info("Session Service started")
 
 
+@app.on_event("shutdown")
+def shutdown():
+    log_metrics.stop()
+    seat_events.stop_polling()
+    if sqlite_store is None:
+        session_journal.stop_checkpointer()
+        session_journal.checkpoint(save_sessions)
+    else:
+        sqlite_store.close()
+    logger.info("Session Service stopped")
+
+
+def cached_json_response(key, build, depends_on=None):
+    """Ответ из кэша каталога; при промахе build() возвращает (данные, заголовки)"""
+    entry = catalog_cache.get(key)
+    if entry is None:
+        generation = catalog_cache.generation
+        content, headers = build()
+        entry = catalog_cache.put(key, encode_json(content), headers, depends_on, generation)
+    return Response(content=entry.body, media_type="application/json", headers=entry.headers)
+
+
+def hall_schemas(hall_list):
+    return [
+        HallSchema(id=h.id, name=h.name, cinema_id=h.cinema_id, rows=h.rows, seats_per_row=h.seats_per_row)
+        for h in hall_list
+    ]
+
+
 # API для кинотеатров
 @app.get("/api/session/cinemas", response_model=List[CinemaSchema])
 def get_cinemas_api():
     """Получить все кинотеатры"""
     logger.info("GET /api/session/cinemas")
-    return list(cinemas.values())
+    return cached_json_response(
+        ("cinemas",),
+        lambda: ([CinemaSchema(id=c.id, name=c.name, address=c.address) for c in cinemas.values()], None)
+    )
 
 @app.get("/cinemas", response_model=List[CinemaSchema])
 def get_cinemas():
@@ -195,136 +700,310 @@ def get_cinemas():
 def get_halls_api():
     """Получить все залы"""
     logger.info("GET /api/session/halls")
-    return [
-        HallSchema(id=h.id, name=h.name, cinema_id=h.cinema_id, rows=h.rows, seats_per_row=h.seats_per_row)
-        for h in halls.values()
-    ]
+    return cached_json_response(("halls",), lambda: (hall_schemas(halls.values()), None))
 
 @app.get("/halls", response_model=List[HallSchema])
 def get_halls():
     """Получить все залы"""
     logger.info("GET /halls")
-    return [
-        HallSchema(id=h.id, name=h.name, cinema_id=h.cinema_id, rows=h.rows, seats_per_row=h.seats_per_row)
-        for h in halls.values()
-    ]
+    return hall_schemas(halls.values())
 
 @app.get("/halls/cinema/{cinema_id}", response_model=List[HallSchema])
 def get_halls_by_cinema(cinema_id: int):
     """Получить залы конкретного кинотеатра"""
-    logger.info(f"GET /halls/cinema/{cinema_id}")
-    return [
-        HallSchema(id=h.id, name=h.name, cinema_id=h.cinema_id, rows=h.rows, seats_per_row=h.seats_per_row)
-        for h in halls.values() if h.cinema_id == cinema_id
-    ]
+    logger.info("GET /halls/cinema/%s", cinema_id)
+    return cached_json_response(
+        ("halls", cinema_id),
+        lambda: (hall_schemas(halls[hall_id] for hall_id in halls_by_cinema.get(cinema_id, [])), None)
+    )
 
 
 @app.get("/api/session/sessions", response_model=List[SessionSchema])
-def get_sessions_api():
+def get_sessions_api(cinema_id: Optional[int] = None,
+                     hall_id: Optional[int] = None,
+                     date: Optional[str] = None,
+                     date_from: Optional[str] = None,
+                     date_to: Optional[str] = None,
+                     movie_title: Optional[str] = None,
+                     cursor: Optional[int] = None,
+                     limit: Optional[int] = Query(None, ge=1, le=1000)):
+    """Каталог сеансов с фильтрами и постраничной выдачей.
+
+    Без limit возвращаются все подходящие сеансы. Если страница заполнена,
+    id ее последнего сеанса приходит в заголовке X-Next-Cursor - его нужно
+    передать в cursor для следующей страницы.
+
+    Ответы кэшируются; изменение сеанса сбрасывает только страницы, в
+    диапазон id и фильтры которых он попадает.
+    """
     logger.info("GET /api/session/sessions")
-    result = []
-    for session in sessions.values():
-        result.append(SessionSchema(
-            id=session.id,
-            movie_title=session.movie_title,
-            cinema_id=session.cinema_id,
-            hall_id=session.hall_id,
-            start_time=session.start_time,
-            session_date=session.session_date,
-            price=session.price
-        ))
-    return result
+    title_key = movie_key(movie_title) if movie_title is not None else None
+    # Последний id заполненной страницы: сеансы с большим id на нее не влияют
+    last_id = None
+    
+    def build():
+        nonlocal last_id
+        page = find_sessions(
+            cinema_id=cinema_id,
+            hall_id=hall_id,
+            date=date,
+            date_from=date_from,
+            date_to=date_to,
+            movie_title=movie_title,
+            after=cursor,
+            limit=limit
+        )
+        headers = None
+        if limit is not None and len(page) == limit:
+            last_id = page[-1].id
+            headers = {"X-Next-Cursor": str(last_id)}
+        return [session_to_schema(session) for session in page], headers
+    
+    def depends_on(session):
+        return ((cursor is None or session.id > cursor)
+                and (last_id is None or session.id <= last_id)
+                and session_matches(session, cinema_id, hall_id, date, date_from, date_to, title_key))
+    
+    return cached_json_response(
+        ("sessions", cinema_id, hall_id, date, date_from, date_to, title_key, cursor, limit),
+        build,
+        depends_on
+    )
 
 @app.get("/sessions", response_model=List[SessionSchema])
 def get_sessions():
     logger.info("GET /sessions")
-    return list(sessions.values())
+    return [session_to_schema(session) for session in sessions.values()]
 
 
 @app.get("/sessions/{session_id}", response_model=SessionSchema)
 def get_session(session_id: int):
-    logger.info(f"GET /sessions/{session_id}")
+    logger.info("GET /sessions/%s", session_id)
     
     session = sessions.get(session_id)
     if not session:
-        logger.error(f"Session {session_id} not found")
+        logger.error("Session %s not found", session_id)
         raise HTTPException(status_code=404, detail="Session not found")
     
-    return session
+    return session_to_schema(session)
 
 
+def seat_map_response(session, response: Response, since: Optional[int], if_none_match: Optional[str]):
+    """Карта мест с версией в ETag: 304 если не изменилась, дельта при since"""
+    etag = f'"{session.version}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
+    if since is not None:
+        return session.changed_seats(since)
+    return session.seats
+
 @app.get("/api/session/sessions/{session_id}/seats", response_model=List[SeatSchema])
-def get_seats_api(session_id: int):
-    logger.info(f"GET /api/session/sessions/{session_id}/seats")
+def get_seats_api(session_id: int, response: Response, since: Optional[int] = None,
+                  if_none_match: Optional[str] = Header(None)):
+    logger.info("GET /api/session/sessions/%s/seats", session_id)
 
     session = sessions.get(session_id)
     if not session:
         logger.error("Session not found")
         raise HTTPException(status_code=404, detail="Session not found")
 
-    hall = halls.get(session.hall_id)
-    if not hall:
-        raise HTTPException(status_code=404, detail="Hall not found")
-    
-    return hall.seats
+    return seat_map_response(session, response, since, if_none_match)
 
 @app.get("/sessions/{session_id}/seats", response_model=List[SeatSchema])
-def get_seats(session_id: int):
-    logger.info(f"GET /sessions/{session_id}/seats")
+def get_seats(session_id: int, response: Response, since: Optional[int] = None,
+              if_none_match: Optional[str] = Header(None)):
+    logger.info("GET /sessions/%s/seats", session_id)
 
     session = sessions.get(session_id)
     if not session:
         logger.error("Session not found")
         raise HTTPException(status_code=404, detail="Session not found")
 
-    return session.seats
+    return seat_map_response(session, response, since, if_none_match)
+
+
+# Сколько мест подряд можно искать за один запрос
+BEST_SEATS_MAX_COUNT = 20
+
+@app.get("/api/session/sessions/{session_id}/seats/best", response_model=List[SeatSchema])
+def get_best_seats_api(session_id: int,
+                       count: int = Query(..., ge=1, le=BEST_SEATS_MAX_COUNT),
+                       preferred_row: Optional[str] = None,
+                       row_weight: float = Query(1.0, ge=0)):
+    """Лучший блок из count соседних свободных мест (ближе к центру зала и предпочтительному ряду).
+
+    Места не бронируются: их занимают обычным запросом с expected_available.
+    """
+    logger.info("GET /api/session/sessions/%s/seats/best - count=%s", session_id, count)
+    
+    session = sessions.get(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    seats = find_best_block(session, count, preferred_row, row_weight)
+    if seats is None:
+        raise HTTPException(status_code=404, detail=f"Нет {count} свободных мест подряд")
+    return seats
+
+
+@app.get("/api/session/sessions/{session_id}/seats/stream")
+async def stream_seats_api(session_id: int, last_event_id: Optional[int] = Header(None)):
+    """Поток изменений мест сеанса (Server-Sent Events)"""
+    logger.info("GET /api/session/sessions/%s/seats/stream", session_id)
+
+    session = sessions.get(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    # Подписываемся до чтения текущего состояния, чтобы не пропустить изменения
+    queue = seat_events.subscribe(session_id, session.version)
+    version = session.version
+    if last_event_id is None:
+        initial = format_event(version, session.seats)
+    else:
+        # Переподключение: отдаем только пропущенные изменения
+        initial = format_event(version, session.changed_seats(last_event_id))
+
+    async def events():
+        try:
+            yield initial
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield b": ping\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event
+        finally:
+            seat_events.unsubscribe(session_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/sessions/{session_id}/seats/{row}/{number}", response_model=SeatSchema)
+def get_seat(session_id: int, row: str, number: int):
+    """Получить одно место сеанса"""
+    logger.info("GET /sessions/%s/seats/%s/%s", session_id, row, number)
+
+    session = sessions.get(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    seat = session.get_seat(row, number)
+    if not seat:
+        raise HTTPException(status_code=404, detail="Seat not found")
+
+    return seat
+
+
+def seat_conflict(conflict: SeatConflict):
+    seat = conflict.seat
+    logger.warning("Seat %s%s conflict: is_available=%s", seat.row, seat.number, seat.is_available)
+    return HTTPException(status_code=409, detail={
+        "message": "Seat state changed",
+        "row": seat.row,
+        "number": seat.number,
+        "is_available": seat.is_available
+    })
+
+def change_seat(session, row: str, number: int, data: UpdateSeatSchema):
+    """Изменить место под блокировкой сеанса: проверка expected и запись атомарны"""
+    with session_lock(session.id):
+        # Сеанс могли удалить, пока запрос ждал блокировку
+        if sessions.get(session.id) is not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        try:
+            seat = session.set_seat_available(row, number, data.is_available, data.expected_available)
+        except SeatConflict as conflict:
+            raise seat_conflict(conflict)
+        if not seat:
+            raise HTTPException(status_code=404, detail="Seat not found")
+        
+        # Журнал пишется в том же порядке, в котором применяются изменения
+        journal_seat(session.id, seat)
+        seat_events.publish(session.id, session.version, [seat])
+    return seat
 
 
 @app.put("/api/session/sessions/{session_id}/seats/{row}/{number}", response_model=SeatSchema)
 def update_seat_api(session_id: int, row: str, number: int, seat_data: UpdateSeatSchema):
     """Обновить статус места"""
-    logger.info(f"PUT /api/session/sessions/{session_id}/seats/{row}/{number}")
+    logger.info("PUT /api/session/sessions/%s/seats/%s/%s", session_id, row, number)
     
     session = sessions.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Найти место в сессии
-    for seat in session.seats:
-        if seat.row == row and seat.number == number:
-            seat.is_available = seat_data.is_available
-            # Сохраняем изменения
-            save_sessions()
-            return seat
-    
-    raise HTTPException(status_code=404, detail="Seat not found")
+    return change_seat(session, row, number, seat_data)
 
 @app.put("/sessions/{session_id}/seats/{row}/{number}")
 def update_seat(session_id: int, row: str, number: int, data: UpdateSeatSchema):
     """Обновить доступность места"""
-    logger.info(f"PUT /sessions/{session_id}/seats/{row}/{number} - is_available={data.is_available}")
+    logger.info("PUT /sessions/%s/seats/%s/%s - is_available=%s", session_id, row, number, data.is_available)
     
     session = sessions.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    hall = halls.get(session.hall_id)
-    if not hall:
-        raise HTTPException(status_code=404, detail="Hall not found")
-    
-    for seat in hall.seats:
-        if seat.row == row and seat.number == number:
-            seat.is_available = data.is_available
-            logger.info(f"Seat {row}{number} updated to is_available={data.is_available}")
-            return {"status": "ok", "row": row, "number": number, "is_available": data.is_available}
+    # Места хранятся у каждого сеанса свои, а не у зала
+    change_seat(session, row, number, data)
+    logger.info("Seat %s%s updated to is_available=%s", row, number, data.is_available)
+    return {"status": "ok", "row": row, "number": number, "is_available": data.is_available}
+
+
+def update_seats_batch(session_id: int, changes: List[SeatChangeSchema]):
+    """Применить изменения мест сеанса по принципу все-или-ничего"""
+    session = sessions.get(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
     
-    raise HTTPException(status_code=404, detail="Seat not found")
+    with session_lock(session_id):
+        # Сеанс могли удалить, пока запрос ждал блокировку
+        if sessions.get(session_id) is not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        # Сначала проверяем все места, чтобы не применить изменения частично
+        for change in changes:
+            seat = session.get_seat(change.row, change.number)
+            if seat is None:
+                raise HTTPException(status_code=404, detail=f"Seat {change.row}{change.number} not found")
+            if change.expected_available is not None and seat.is_available != change.expected_available:
+                raise seat_conflict(SeatConflict(seat))
+        
+        seats = [
+            session.set_seat_available(change.row, change.number, change.is_available)
+            for change in changes
+        ]
+        # Одна запись в журнал на весь пакет
+        if seats:
+            journal_seats(session_id, seats)
+            seat_events.publish(session_id, session.version, seats)
+    return seats
+
+@app.put("/api/session/sessions/{session_id}/seats", response_model=List[SeatSchema])
+def update_seats_api(session_id: int, data: UpdateSeatsSchema):
+    """Обновить статус нескольких мест сеанса за один запрос"""
+    logger.info("PUT /api/session/sessions/%s/seats - %s мест", session_id, len(data.seats))
+    return update_seats_batch(session_id, data.seats)
+
+@app.put("/sessions/{session_id}/seats", response_model=List[SeatSchema])
+def update_seats(session_id: int, data: UpdateSeatsSchema):
+    """Обновить доступность нескольких мест сеанса за один запрос"""
+    logger.info("PUT /sessions/%s/seats - %s мест", session_id, len(data.seats))
+    return update_seats_batch(session_id, data.seats)
 
 
 @app.post("/api/session/sessions", response_model=SessionSchema)
 def create_session_api(data: CreateSessionSchema):
     """Создать новый сеанс"""
-    logger.info(f"POST /api/session/sessions - {data.movie_title} в {data.start_time}")
+    logger.info("POST /api/session/sessions - %s в %s", data.movie_title, data.start_time)
     
     if data.cinema_id not in cinemas:
         raise HTTPException(status_code=400, detail="Cinema not found")
@@ -366,55 +1045,40 @@ def create_session_api(data: CreateSessionSchema):
     if time_part not in valid_times:
         raise HTTPException(status_code=400, detail=f"Время сеанса должно быть одно из: {valid_times}")
     
-    # Проверка что в одном зале в одно время и дату нет других фильмов
-    for session in sessions.values():
-        if (session.hall_id == data.hall_id and 
-            session.start_time == data.start_time and 
-            session.session_date == session_date):
+    # Проверка слота и создание - атомарно (в режиме воркеров - для всех воркеров)
+    with catalog_change():
+        # Проверка что в одном зале в одно время и дату нет других фильмов
+        if is_slot_occupied(data.hall_id, session_date, time_part):
             raise HTTPException(status_code=400, detail="В этом зале в это время и дату уже идет фильм")
+        
+        new_id = next_session_id()
+        
+        from app.models import Session
+        session = Session(
+            id=new_id,
+            movie_title=data.movie_title,
+            cinema_id=data.cinema_id,
+            hall_id=data.hall_id,
+            start_time=time_part,  # Сохраняем только время
+            session_date=session_date,  # Сохраняем дату
+            price=data.price,
+            layout=hall.layout,  # Раскладка мест общая с залом
+            availability=hall.layout.new_availability()  # У КАЖДОГО СЕАНСА СВОЕ СОСТОЯНИЕ МЕСТ!
+        )
+        commit_new_sessions([session])
+        
+        # Сохраняем в файл
+        journal_session_created(session)
     
-    new_id = max(sessions.keys()) + 1 if sessions else 1
-    
-    # СОЗДАЕМ КОПИЮ ЗАЛА ДЛЯ ЭТОГО СЕАНСА (важное изменение!)
-    session_seats = [
-        Seat(row=seat.row, number=seat.number, is_available=True)
-        for seat in hall.seats
-    ]
-    
-    from app.models import Session
-    session = Session(
-        id=new_id,
-        movie_title=data.movie_title,
-        cinema_id=data.cinema_id,
-        hall_id=data.hall_id,
-        start_time=time_part,  # Сохраняем только время
-        session_date=session_date,  # Сохраняем дату
-        price=data.price,
-        seats=session_seats  # У КАЖДОГО СЕАНСА СВОИ МЕСТА!
-    )
-    sessions[new_id] = session
-    
-    # Сохраняем в файл
-    save_sessions()
-    
-    logger.info(f"Session created: {session}")
+    logger.info("Session created: %s", session)
     
     # Возвращаем сессию с session_date для фронтенда
-    from app.schemas import SessionSchema
-    return SessionSchema(
-        id=session.id,
-        movie_title=session.movie_title,
-        cinema_id=session.cinema_id,
-        hall_id=session.hall_id,
-        start_time=session.start_time,
-        session_date=session_date,
-        price=session.price
-    )
+    return session_to_schema(session)
 
 @app.post("/sessions", response_model=SessionSchema)
 def create_session(data: CreateSessionSchema):
     """Создать новый сеанс"""
-    logger.info(f"POST /sessions - {data.movie_title} в {data.start_time}")
+    logger.info("POST /sessions - %s в %s", data.movie_title, data.start_time)
     
     if data.cinema_id not in cinemas:
         raise HTTPException(status_code=400, detail="Cinema not found")
@@ -432,31 +1096,29 @@ def create_session(data: CreateSessionSchema):
     if data.start_time not in valid_times:
         raise HTTPException(status_code=400, detail=f"Время сеанса должно быть одно из: {valid_times}")
     
-    # Проверка что в одном зале в одно время нет других фильмов
-    for session in sessions.values():
-        if session.hall_id == data.hall_id and session.start_time == data.start_time:
-            raise HTTPException(status_code=400, detail="В этом зале в это время уже идет фильм")
-    
-    new_id = max(sessions.keys()) + 1 if sessions else 1
-    
-    # Получить места из зала
-    session_seats = [
-        Seat(row=seat.row, number=seat.number, is_available=True)
-        for seat in hall.seats
-    ]
-    
-    from app.models import Session
-    session = Session(
-        id=new_id,
-        movie_title=data.movie_title,
-        cinema_id=data.cinema_id,
-        hall_id=data.hall_id,
-        start_time=data.start_time,
-        price=data.price,
-        seats=session_seats
-    )
-    sessions[new_id] = session
-    logger.info(f"Session created: {session}")
+    # Проверка слота и создание - атомарно (в режиме воркеров - для всех воркеров)
+    with catalog_change():
+        # Проверка что в одном зале в одно время и дату нет других фильмов
+        if is_slot_occupied(data.hall_id, data.session_date, data.start_time):
+            raise HTTPException(status_code=400, detail="В этом зале в это время и дату уже идет фильм")
+        
+        new_id = next_session_id()
+        
+        from app.models import Session
+        session = Session(
+            id=new_id,
+            movie_title=data.movie_title,
+            cinema_id=data.cinema_id,
+            hall_id=data.hall_id,
+            start_time=data.start_time,
+            session_date=data.session_date,
+            price=data.price,
+            layout=hall.layout,
+            availability=hall.layout.new_availability()
+        )
+        commit_new_sessions([session])
+        journal_session_created(session)
+    logger.info("Session created: %s", session)
     
     # Логируем действие администратора
     log_action(
@@ -472,13 +1134,13 @@ def create_session(data: CreateSessionSchema):
         }
     )
     
-    return session
+    return session_to_schema(session)
 
 
 @app.post("/api/session/sessions/multiple", response_model=List[SessionSchema])
 def create_multiple_sessions_api(data: CreateMultipleSessionsSchema):
     """Создать несколько сеансов одного фильма"""
-    logger.info(f"POST /api/session/sessions/multiple - {data.movie_title}, {len(data.start_times)} сеансов")
+    logger.info("POST /api/session/sessions/multiple - %s, %s сеансов", data.movie_title, len(data.start_times))
     
     if data.cinema_id not in cinemas:
         raise HTTPException(status_code=400, detail="Cinema not found")
@@ -494,61 +1156,176 @@ def create_multiple_sessions_api(data: CreateMultipleSessionsSchema):
     # Проверка что время действительное (каждые 2 часа: 10, 12, 14, 16, 18, 20, 22)
     valid_times = ["10:00", "12:00", "14:00", "16:00", "18:00", "20:00", "22:00"]
     
-    created_sessions = []
+    session_date = data.session_date or datetime.now().strftime("%Y-%m-%d")
     
-    for start_time in data.start_times:
-        # Проверка времени
-        if start_time not in valid_times:
-            raise HTTPException(status_code=400, detail=f"Время сеанса {start_time} недействительно. Допустимые времена: {valid_times}")
-        
-        # Проверка что в одном зале в это время нет других фильмов
-        for session in sessions.values():
-            if session.hall_id == data.hall_id and session.start_time == start_time:
+    # Проверка слотов и создание - атомарно (в режиме воркеров - для всех воркеров)
+    with catalog_change():
+        # Сначала проверяем все времена, чтобы не создать сеансы частично
+        for start_time in data.start_times:
+            # Проверка времени
+            if start_time not in valid_times:
+                raise HTTPException(status_code=400, detail=f"Время сеанса {start_time} недействительно. Допустимые времена: {valid_times}")
+            
+            # Проверка что в одном зале в это время и дату нет других фильмов
+            if is_slot_occupied(data.hall_id, session_date, start_time):
                 raise HTTPException(status_code=400, detail=f"В этом зале на время {start_time} уже идет фильм")
         
-        new_id = max(sessions.keys()) + 1 if sessions else 1
+        if len(set(data.start_times)) != len(data.start_times):
+            raise HTTPException(status_code=400, detail="Время сеансов не должно повторяться")
+        
+        created_sessions = []
+        
+        for start_time in data.start_times:
+            new_id = next_session_id()
+            
+            from app.models import Session
+            session = Session(
+                id=new_id,
+                movie_title=data.movie_title,
+                cinema_id=data.cinema_id,
+                hall_id=data.hall_id,
+                start_time=start_time,
+                session_date=session_date,
+                price=data.price,
+                layout=hall.layout,
+                availability=hall.layout.new_availability()
+            )
+            created_sessions.append(session)
+        commit_new_sessions(created_sessions)
         
-        # СОЗДАЕМ КОПИЮ ЗАЛА ДЛЯ ЭТОГО СЕАНСА
-        session_seats = [
-            Seat(row=seat.row, number=seat.number, is_available=True)
-            for seat in hall.seats
+        # Сохраняем в файл
+        for session in created_sessions:
+            journal_session_created(session)
+    
+    logger.info("Created %s sessions for movie %s", len(created_sessions), data.movie_title)
+    return [session_to_schema(session) for session in created_sessions]
+
+
+# Сколько дней можно запланировать одним запросом
+SCHEDULE_MAX_DAYS = 366
+# Сколько конфликтов слотов перечислять в ошибке
+SCHEDULE_MAX_REPORTED_CONFLICTS = 20
+
+@app.post("/api/session/sessions/schedule", response_model=ScheduleCreatedSchema)
+def create_schedule_api(data: CreateScheduleSchema):
+    """Создать расписание: фильмы x залы x даты x времена.
+
+    Каждый элемент items ставит фильм во все свои залы на все свои времена
+    на каждую дату диапазона [date_from, date_to]. Все слоты проверяются
+    разом (между собой и по индексу занятых слотов), и сеансы создаются
+    только если конфликтов нет. id выдаются одним блоком, места сеансов
+    распаковываются при первом обращении, в журнал пишется одна запись.
+    """
+    logger.info("POST /api/session/sessions/schedule - %s позиций, %s..%s", len(data.items), data.date_from, data.date_to)
+    
+    if data.cinema_id not in cinemas:
+        raise HTTPException(status_code=400, detail="Cinema not found")
+    
+    try:
+        date_from = datetime.strptime(data.date_from, "%Y-%m-%d")
+        date_to = datetime.strptime(data.date_to, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Даты должны быть в формате YYYY-MM-DD")
+    days = (date_to - date_from).days + 1
+    if days < 1:
+        raise HTTPException(status_code=400, detail="date_to раньше date_from")
+    if days > SCHEDULE_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Расписание не может быть длиннее {SCHEDULE_MAX_DAYS} дней")
+    dates = [(date_from + timedelta(days=day)).strftime("%Y-%m-%d") for day in range(days)]
+    
+    valid_times = ["10:00", "12:00", "14:00", "16:00", "18:00", "20:00", "22:00"]
+    for item in data.items:
+        for hall_id in item.hall_ids:
+            hall = halls.get(hall_id)
+            if hall is None:
+                raise HTTPException(status_code=400, detail=f"Hall {hall_id} not found")
+            if hall.cinema_id != data.cinema_id:
+                raise HTTPException(status_code=400, detail=f"Hall {hall_id} does not belong to this cinema")
+        for start_time in item.start_times:
+            if start_time not in valid_times:
+                raise HTTPException(status_code=400, detail=f"Время сеанса {start_time} недействительно. Допустимые времена: {valid_times}")
+    
+    # Проверка слотов и создание - атомарно (в режиме воркеров - для всех воркеров)
+    with catalog_change():
+        # Все слоты расписания: (ключ слота, позиция)
+        slots = [
+            (slot_key(hall_id, session_date, start_time), item)
+            for item in data.items
+            for hall_id in item.hall_ids
+            for session_date in dates
+            for start_time in item.start_times
         ]
+        slot_counts = Counter(key for key, _ in slots)
+        conflicts = sorted(slot_counts.keys() & occupied_slots.keys())
+        if len(slot_counts) != len(slots):
+            conflicts += sorted(key for key, count in slot_counts.items() if count > 1)
+        if conflicts:
+            raise HTTPException(status_code=400, detail={
+                "message": "Слоты уже заняты или повторяются в расписании",
+                "conflicts": [
+                    {"hall_id": hall_id, "session_date": session_date, "start_time": start_time}
+                    for hall_id, session_date, start_time in conflicts[:SCHEDULE_MAX_REPORTED_CONFLICTS]
+                ],
+                "total_conflicts": len(conflicts)
+            })
         
         from app.models import Session
-        session = Session(
-            id=new_id,
-            movie_title=data.movie_title,
-            cinema_id=data.cinema_id,
-            hall_id=data.hall_id,
-            start_time=start_time,
-            price=data.price,
-            seats=session_seats
-        )
-        sessions[new_id] = session
-        created_sessions.append(session)
+        created_at = datetime.now().isoformat()
+        new_sessions = [
+            Session(
+                id=session_id,
+                movie_title=item.movie_title,
+                cinema_id=data.cinema_id,
+                hall_id=hall_id,
+                start_time=start_time,
+                session_date=session_date,
+                price=item.price,
+                layout=halls[hall_id].layout,
+                availability=None,  # Все места свободны, распакуются при первом обращении
+                created_at=created_at,
+                packed_seats=halls[hall_id].layout.free_seat_bits()
+            )
+            for session_id, ((hall_id, session_date, start_time), item) in zip(allocate_session_ids(len(slots)), slots)
+        ]
+        commit_new_sessions(new_sessions)
+        if new_sessions:
+            journal_schedule_created(new_sessions)
     
-    # Сохраняем в файл
-    save_sessions()
+    logger.info("Schedule created: %s sessions for cinema %s", len(new_sessions), data.cinema_id)
+    log_action(
+        action="CREATE_SCHEDULE",
+        user_id="admin",  # TODO: получить реальный user_id из аутентификации
+        details={
+            "cinema_id": data.cinema_id,
+            "date_from": data.date_from,
+            "date_to": data.date_to,
+            "created": len(new_sessions)
+        }
+    )
     
-    logger.info(f"Created {len(created_sessions)} sessions for movie {data.movie_title}")
-    return created_sessions
+    return ScheduleCreatedSchema(
+        created=len(new_sessions),
+        first_id=new_sessions[0].id if new_sessions else None,
+        last_id=new_sessions[-1].id if new_sessions else None
+    )
 
 
 @app.delete("/api/session/sessions/{session_id}")
 def delete_session_api(session_id: int):
     """Удалить сеанс"""
-    logger.info(f"DELETE /api/session/sessions/{session_id}")
+    logger.info("DELETE /api/session/sessions/%s", session_id)
     
     session = sessions.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    del sessions[session_id]
-    
-    # Сохраняем изменения
-    save_sessions()
+    with catalog_change():
+        commit_session_deleted(session_id)
+        
+        # Сохраняем изменения
+        journal_session_deleted(session_id)
     
-    logger.info(f"Session {session_id} deleted")
+    logger.info("Session %s deleted", session_id)
     
     # Логируем действие администратора
     log_action(
@@ -568,14 +1345,16 @@ def delete_session_api(session_id: int):
 @app.delete("/sessions/{session_id}")
 def delete_session(session_id: int):
     """Удалить сеанс"""
-    logger.info(f"DELETE /sessions/{session_id}")
+    logger.info("DELETE /sessions/%s", session_id)
     
     session = sessions.get(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    del sessions[session_id]
-    logger.info(f"Session {session_id} deleted")
+    with catalog_change():
+        commit_session_deleted(session_id)
+        journal_session_deleted(session_id)
+    logger.info("Session %s deleted", session_id)
     
     # Логируем действие администратора
     log_action(
@@ -592,56 +1371,62 @@ def delete_session(session_id: int):
     
     return {"status": "ok", "message": "Session deleted"}
 
+# Аналитика заполняемости: пересчет при первом запросе после изменения мест
+occupancy_analytics = OccupancyAnalytics()
+session_listeners.append(occupancy_analytics.session_changed)
+
+@app.get("/api/session/analytics/occupancy")
+def get_occupancy_analytics():
+    """Заполняемость по сеансам (колонками), кинотеатрам, фильмам и дням"""
+    logger.info("GET /api/session/analytics/occupancy")
+    report = occupancy_analytics.report(session_ids, sessions)
+    return Response(content=report.body("occupancy", lambda: report.occupancy), media_type="application/json")
+
+@app.get("/api/session/analytics/halls/{hall_id}/heatmap")
+def get_hall_heatmap(hall_id: int):
+    """Тепловая карта зала: доля сеансов, где место занято, и средний порядок продажи"""
+    logger.info("GET /api/session/analytics/halls/%s/heatmap", hall_id)
+    if hall_id not in halls:
+        raise HTTPException(status_code=404, detail="Hall not found")
+    report = occupancy_analytics.report(session_ids, sessions)
+    body = report.body(("heatmap", hall_id), lambda: report.heatmap(hall_id))
+    if body is None:
+        raise HTTPException(status_code=404, detail="No sessions in this hall")
+    return Response(content=body, media_type="application/json")
+
 # Monitoring endpoints
 LOG_DIRS = {
     "ticket": "/app/ticket-service/logs",
     "payment": "/app/payment-service/logs",
 }
+# Как часто дочитывать логи для метрик (секунды)
+METRICS_POLL_INTERVAL = float(os.getenv("METRICS_POLL_INTERVAL", "2"))
 
-@app.get("/api/monitoring/metrics")
-def get_monitoring_metrics():
-    """Получить метрики из логов"""
-    logger.info("GET /api/monitoring/metrics")
-    
-    metrics = Counter()
-    patterns = {
+log_metrics = LogMetricsTailer(
+    LOG_DIRS,
+    {
         "reserved": re.compile(r"reserved|RESERVED"),
         "sold": re.compile(r"sold|SOLD|confirmed"),
         "cancelled": re.compile(r"cancelled|CANCELLED"),
         "payment_success": re.compile(r"Payment successful|SUCCESS"),
         "payment_failed": re.compile(r"Payment failed|FAILED"),
+    },
+    METRICS_POLL_INTERVAL,
+    events={
+        "TICKET_RESERVED": "reserved",
+        "TICKET_SOLD": "sold",
+        "TICKET_CANCELLED": "cancelled",
+        "PAYMENT_SUCCESS": "payment_success",
+        "PAYMENT_FAILED": "payment_failed",
     }
+)
+
+@app.get("/api/monitoring/metrics")
+def get_monitoring_metrics():
+    """Получить метрики из логов (считаются в фоне по мере записи логов)"""
+    logger.info("GET /api/monitoring/metrics")
     
-    logger.info(f"Checking log directories: {LOG_DIRS}")
-    
-    for service, path in LOG_DIRS.items():
-        logger.info(f"Processing service: {service}, path: {path}")
-        if not os.path.exists(path):
-            logger.warning(f"Log directory does not exist: {path}")
-            continue
-            
-        logger.info(f"Log directory exists: {path}")
-        files = os.listdir(path)
-        logger.info(f"Files in directory: {files}")
-        
-        for file in files:
-            file_path = os.path.join(path, file)
-            logger.info(f"Processing file: {file_path}")
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    line_count = 0
-                    for line in f:
-                        line_count += 1
-                        for key, pattern in patterns.items():
-                            if pattern.search(line):
-                                metrics[key] += 1
-                                logger.debug(f"Found match for {key} in line: {line.strip()}")
-                    logger.info(f"Processed {line_count} lines from {file_path}")
-            except Exception as e:
-                logger.warning(f"Error reading log file {file_path}: {e}")
-                continue
-    
-    logger.info(f"Final metrics: {dict(metrics)}")
+    metrics = log_metrics.counters()
     return {
         "reserved": metrics.get("reserved", 0),
         "sold": metrics.get("sold", 0),
@@ -651,10 +1436,39 @@ def get_monitoring_metrics():
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/api/monitoring/cache")
+def get_cache_stats():
+    """Счетчики кэша ответов каталога"""
+    logger.info("GET /api/monitoring/cache")
+    return {**catalog_cache.stats(), "timestamp": datetime.now().isoformat()}
+
+@app.get("/metrics")
+async def get_request_metrics():
+    """Задержки, статусы и число выполняющихся запросов в формате Prometheus.
+
+    async: метрики обновляются в цикле событий, отдаем их оттуда же.
+    """
+    return Response(content=request_metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/logging")
+def get_logging_settings():
+    """Уровень логов, выборка частых INFO-записей и состояние очереди логов"""
+    return logging_settings()
+
+@app.put("/logging/level")
+def update_logging_level(level: str):
+    """Сменить уровень логов сервиса без перезапуска"""
+    try:
+        set_level(level)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown log level: {level}")
+    logger.warning("Log level set to %s", level.upper())
+    return logging_settings()
+
 @app.get("/api/monitoring/logs/{service}")
 def get_service_logs(service: str, lines: int = 100):
     """Получить последние строки логов для сервиса"""
-    logger.info(f"GET /api/monitoring/logs/{service}")
+    logger.info("GET /api/monitoring/logs/%s", service)
     
     if service not in LOG_DIRS:
         raise HTTPException(status_code=404, detail=f"Service {service} not found")
@@ -663,41 +1477,64 @@ def get_service_logs(service: str, lines: int = 100):
     if not os.path.exists(log_path):
         return {"logs": [], "message": f"Log directory for {service} not found"}
     
-    all_logs = []
-    for file in os.listdir(log_path):
-        file_path = os.path.join(log_path, file)
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                file_logs = f.readlines()
-                all_logs.extend(file_logs)
-        except Exception as e:
-            logger.warning(f"Error reading log file {file_path}: {e}")
-            continue
-    
-    # Возвращаем последние строки
-    recent_logs = all_logs[-lines:] if len(all_logs) > lines else all_logs
+    # Читаем файлы с конца, от новых к старым, только нужное число строк
+    file_paths = [
+        os.path.join(log_path, file) for file in os.listdir(log_path)
+        if os.path.isfile(os.path.join(log_path, file))
+    ]
+    try:
+        recent_logs = tail_lines(file_paths, lines)
+    except Exception as e:
+        logger.warning("Error reading log files in %s: %s", log_path, e)
+        recent_logs = []
     
     return {
         "service": service,
-        "logs": [log.strip() for log in recent_logs if log.strip()],
+        "logs": [log.strip() for log in recent_logs],
         "total_lines": len(recent_logs),
         "timestamp": datetime.now().isoformat()
     }
 
 @app.get("/api/monitoring/user-actions")
-def get_user_actions_logs(limit: int = 100):
-    """Получить логи действий пользователей"""
-    logger.info(f"GET /api/monitoring/user-actions")
+def get_user_actions_logs(limit: int = 100,
+                          action: Optional[str] = None,
+                          user_id: Optional[str] = None,
+                          ticket_id: Optional[int] = None,
+                          session_id: Optional[int] = None,
+                          since: Optional[str] = None,
+                          until: Optional[str] = None,
+                          cursor: Optional[str] = None):
+    """Получить логи действий пользователей.
+
+    Фильтры по action, user_id, ticket_id, session_id и диапазону времени
+    [since, until] (ISO). Страница содержит limit самых новых подходящих
+    записей (в хронологическом порядке); next_cursor передается в cursor
+    для следующей, более старой страницы.
+    """
+    logger.info("GET /api/monitoring/user-actions")
     
     try:
-        logs = get_logs(limit)
+        logs, next_cursor = query_actions(
+            action=action,
+            user_id=user_id,
+            ticket_id=ticket_id,
+            session_id=session_id,
+            since=since,
+            until=until,
+            cursor=cursor,
+            limit=limit
+        )
+        logs.reverse()
         return {
             "logs": logs,
             "total_lines": len(logs),
+            "next_cursor": next_cursor,
             "timestamp": datetime.now().isoformat()
         }
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректные since, until или cursor")
     except Exception as e:
-        logger.error(f"Error getting user actions logs: {e}")
+        logger.error("Error getting user actions logs: %s", e)
         return {
             "logs": [],
             "total_lines": 0,
@@ -711,12 +1548,12 @@ def clear_user_logs():
     logger.info("DELETE /api/monitoring/user-actions/clear")
     
     try:
-        if LOG_FILE.exists():
-            LOG_FILE.unlink()
+        # Удаляются сегменты всех сервисов и старый общий файл
+        if clear_logs():
             logger.info("User action logs cleared")
             return {"status": "ok", "message": "Логи успешно очищены"}
         else:
             return {"status": "ok", "message": "Файл логов не найден"}
     except Exception as e:
-        logger.error(f"Error clearing logs: {e}")
+        logger.error("Error clearing logs: %s", e)
         raise HTTPException(status_code=500, detail="Ошибка при очистке логов")
\ No newline at end of file
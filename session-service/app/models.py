@@ -1,7 +1,27 @@
+import itertools
+import threading
+import time
+from array import array
 from dataclasses import dataclass, field
-from typing import List
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
 from datetime import datetime
 
+# Версии карт мест общие для всех сеансов и начинаются с текущего времени в
+# микросекундах, чтобы не повторяться после перезапуска сервиса
+_seat_map_versions = itertools.count(time.time_ns() // 1000)
+
+
+# Распаковка карты мест сеанса выполняется один раз, даже из разных потоков
+_unpack_lock = threading.Lock()
+
+
+class SeatConflict(Exception):
+    """Место не в ожидаемом состоянии (например, его уже заняли)"""
+
+    def __init__(self, seat: "Seat"):
+        super().__init__(f"Seat {seat.row}{seat.number} is_available={seat.is_available}")
+        self.seat = seat
+
 
 @dataclass
 class Cinema:
@@ -17,6 +37,106 @@ class Seat:
     is_available: bool = True
 
 
+class SeatLayout:
+    """Неизменяемая раскладка мест зала, общая для всех сеансов в этом зале.
+
+    Состояние мест сеанса хранится отдельно - в bytearray, где байт с
+    индексом i относится к месту layout.seats[i] (1 - свободно, 0 - занято).
+    """
+
+    __slots__ = ("seats", "_positions", "_free_bits", "_rows")
+
+    # Одинаковые раскладки переиспользуются всеми залами и сеансами
+    _interned: Dict[Tuple[Tuple[str, int], ...], "SeatLayout"] = {}
+
+    def __init__(self, seats: Tuple[Tuple[str, int], ...]):
+        self.seats = seats
+        self._positions = {seat: i for i, seat in enumerate(seats)}
+        self._free_bits = None
+        self._rows = None
+
+    @classmethod
+    def intern(cls, seats) -> "SeatLayout":
+        """Получить общую раскладку для списка пар (ряд, номер)"""
+        key = tuple((row, number) for row, number in seats)
+        layout = cls._interned.get(key)
+        if layout is None:
+            layout = cls._interned[key] = cls(key)
+        return layout
+
+    def __len__(self):
+        return len(self.seats)
+
+    def position(self, row: str, number: int) -> Optional[int]:
+        """Индекс места в раскладке за O(1)"""
+        return self._positions.get((row, number))
+
+    def new_availability(self) -> bytearray:
+        """Состояние мест нового сеанса - все свободны"""
+        return bytearray(b"\x01") * len(self.seats)
+
+    def free_seat_bits(self) -> bytes:
+        """Упакованная карта мест нового сеанса (для Session.packed_seats).
+
+        Одна на раскладку: сеанс распаковывает ее в свой bytearray только
+        при первом обращении к местам.
+        """
+        if self._free_bits is None:
+            self._free_bits = pack_seat_bits(self.new_availability())
+        return self._free_bits
+
+    def rows(self) -> List["RowSpan"]:
+        """Ряды в порядке раскладки (от первого к последнему), считаются один раз"""
+        if self._rows is None:
+            numbers_by_row: Dict[str, List[Tuple[int, int]]] = {}
+            for position, (row, number) in enumerate(self.seats):
+                numbers_by_row.setdefault(row, []).append((number, position))
+            rows = []
+            for row, numbered in numbers_by_row.items():
+                numbered.sort()
+                first = numbered[0][0]
+                start = numbered[0][1]
+                if all(number == first + i and position == start + i for i, (number, position) in enumerate(numbered)):
+                    # Обычный случай: места ряда идут подряд и в раскладке
+                    positions = slice(start, start + len(numbered))
+                else:
+                    # Пропуски в номерах (проходы) - позиция -1, такие места всегда заняты
+                    by_number = dict(numbered)
+                    positions = tuple(by_number.get(number, -1) for number in range(first, numbered[-1][0] + 1))
+                rows.append(RowSpan(row, first, positions))
+            self._rows = rows
+        return self._rows
+
+
+class RowSpan(NamedTuple):
+    """Ряд раскладки: места с номерами first, first + 1, ... и их позиции"""
+    row: str
+    first: int
+    # slice - места ряда подряд в раскладке, иначе позиция каждого номера (-1 - нет места)
+    positions: Union[slice, Tuple[int, ...]]
+
+
+# Байт упакованной битовой карты -> 8 байт состояния мест (младший бит первый)
+_BITS_TO_BYTES = [bytes((value >> bit) & 1 for bit in range(8)) for value in range(256)]
+_BYTES_TO_BITS = {expanded: value for value, expanded in enumerate(_BITS_TO_BYTES)}
+
+
+def pack_seat_bits(availability) -> bytes:
+    """Упаковать состояние мест (байт на место) в битовую карту"""
+    data = bytes(availability)
+    tail = len(data) % 8
+    if tail:
+        data += bytes(8 - tail)
+    return bytes(_BYTES_TO_BITS[data[i:i + 8]] for i in range(0, len(data), 8))
+
+
+def unpack_seat_bits(packed, count: int) -> bytearray:
+    """Распаковать битовую карту в состояние мест (байт на место)"""
+    availability = bytearray(b"".join(map(_BITS_TO_BYTES.__getitem__, packed)))
+    del availability[count:]
+    return availability
+
+
 @dataclass
 class Hall:
     id: int
@@ -26,8 +146,11 @@ class Hall:
     seats_per_row: int = 10
     seats: List[Seat] = field(default_factory=list)
 
+    def __post_init__(self):
+        self.layout = SeatLayout.intern((seat.row, seat.number) for seat in self.seats)
 
-@dataclass
+
+@dataclass(slots=True)
 class Session:
     id: int
     movie_title: str
@@ -35,6 +158,101 @@ class Session:
     hall_id: int
     start_time: str
     session_date: str
+    layout: SeatLayout = field(repr=False)
+    availability: Optional[bytearray] = field(repr=False)
     price: float = 250.0
-    seats: List[Seat] = field(default_factory=list)
-    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
\ No newline at end of file
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    # Битовая карта мест из бинарного снапшота, распаковывается при первом обращении
+    packed_seats: Optional[memoryview] = field(default=None, repr=False, compare=False)
+    # Версия карты мест растет при каждом изменении места
+    local_version: int = field(default=0, compare=False)
+    # Версия на момент создания/загрузки сеанса: о более ранних изменениях ничего не известно
+    base_version: int = field(default=0, repr=False, compare=False)
+    # Версия последнего изменения каждого места, создается при первом изменении
+    seat_versions: Optional[array] = field(default=None, repr=False, compare=False)
+    # В режиме нескольких воркеров: [версия, базовая версия] в общей памяти
+    shared_versions: Optional[memoryview] = field(default=None, repr=False, compare=False)
+
+    def __post_init__(self):
+        if not self.local_version:
+            self.local_version = self.base_version = next(_seat_map_versions)
+
+    @property
+    def version(self) -> int:
+        """Текущая версия карты мест"""
+        if self.shared_versions is not None:
+            return self.shared_versions[0]
+        return self.local_version
+
+    def seat_states(self) -> bytearray:
+        """Состояние мест: байт на место в порядке layout.seats (1 - свободно)"""
+        if self.availability is None:
+            packed = self.packed_seats
+            if packed is not None:
+                availability = unpack_seat_bits(packed, len(self.layout))
+                with _unpack_lock:
+                    # Другой поток мог распаковать раньше и уже изменить места
+                    if self.availability is None:
+                        self.availability = availability
+                        self.packed_seats = None
+        return self.availability
+
+    @property
+    def seats(self) -> List[Seat]:
+        """Места сеанса для ответов API"""
+        return [
+            Seat(row=row, number=number, is_available=bool(available))
+            for (row, number), available in zip(self.layout.seats, self.seat_states())
+        ]
+
+    def get_seat(self, row: str, number: int) -> Optional[Seat]:
+        """Найти место за O(1)"""
+        position = self.layout.position(row, number)
+        if position is None:
+            return None
+        return Seat(row=row, number=number, is_available=bool(self.seat_states()[position]))
+
+    def set_seat_available(self, row: str, number: int, is_available: bool,
+                           expected: Optional[bool] = None) -> Optional[Seat]:
+        """Изменить доступность места, вернуть его новое состояние.
+
+        С expected это compare-and-set: если место сейчас не в состоянии
+        expected, ничего не меняется и выбрасывается SeatConflict. Атомарность
+        обеспечивает вызывающий, держа блокировку сеанса.
+        """
+        position = self.layout.position(row, number)
+        if position is None:
+            return None
+        states = self.seat_states()
+        if expected is not None and states[position] != expected:
+            raise SeatConflict(Seat(row=row, number=number, is_available=bool(states[position])))
+        if states[position] != is_available:
+            states[position] = is_available
+            if self.shared_versions is not None:
+                # Счетчики версий у воркеров свои - берем не меньше предыдущей + 1
+                version = max(next(_seat_map_versions), self.shared_versions[0] + 1)
+                self.seat_versions[position] = version
+                self.shared_versions[0] = version
+            else:
+                self.local_version = next(_seat_map_versions)
+                if self.seat_versions is None:
+                    self.seat_versions = array("Q", [self.base_version]) * len(self.layout)
+                self.seat_versions[position] = self.local_version
+        return Seat(row=row, number=number, is_available=is_available)
+
+    def changed_seats(self, since: int) -> List[Seat]:
+        """Места, изменившиеся после версии since.
+
+        Если since старше версии загрузки сеанса, возвращается вся карта -
+        клиент применяет ее так же, как дельту.
+        """
+        if since >= self.version:
+            return []
+        if since < self.base_version or self.seat_versions is None:
+            return self.seats
+        states = self.seat_states()
+        return [
+            Seat(row=row, number=number, is_available=bool(states[position]))
+            for position, (row, number) in enumerate(self.layout.seats)
+            if self.seat_versions[position] > since
+        ]
\ No newline at end of file
@@ -0,0 +1,101 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+
+def encode_json(content) -> bytes:
+    """JSON-тело ответа в том же виде, что отдает JSONResponse"""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+
+
+class CachedResponse:
+    """Готовое тело ответа, его заголовки и от каких сеансов оно зависит"""
+
+    __slots__ = ("body", "headers", "depends_on")
+
+    def __init__(self, body: bytes, headers: Dict[str, str], depends_on: Optional[Callable]):
+        self.body = body
+        self.headers = headers
+        self.depends_on = depends_on
+
+
+class ResponseCache:
+    """Кэш закодированных JSON-ответов по ключу (эндпоинт, параметры запроса).
+
+    Первый элемент ключа - группа ответов (например, "halls"), ее можно
+    сбросить целиком. Ответы с сеансами хранят предикат depends_on: при
+    изменении сеанса сбрасываются только ответы, в которые он мог попасть.
+    Кэш ограничен max_entries, вытесняются давно не читавшиеся ответы.
+
+    Ответ, собранный во время изменения данных, мог устареть: put с
+    generation, прочитанным до сборки, не сохраняет его, если с тех пор
+    что-то сбрасывалось.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, body: bytes, headers: Dict[str, str] = None,
+            depends_on: Callable = None, generation: int = None) -> CachedResponse:
+        entry = CachedResponse(body, headers or {}, depends_on)
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, group: str):
+        """Сбросить все ответы группы"""
+        with self._lock:
+            self._drop([key for key in self._entries if key[0] == group])
+
+    def session_changed(self, session):
+        """Сбросить ответы, на которые влияет сеанс (None - все сеансы сразу)"""
+        with self._lock:
+            self._drop([
+                key for key, entry in self._entries.items()
+                if entry.depends_on is not None and (session is None or entry.depends_on(session))
+            ])
+
+    def _drop(self, keys):
+        self.generation += 1
+        for key in keys:
+            del self._entries[key]
+        self.invalidations += len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations
+            }
@@ -16,6 +16,19 @@ class SeatSchema(BaseModel):
 
 class UpdateSeatSchema(BaseModel):
     is_available: bool
+    # Если задано - менять, только если место сейчас в этом состоянии (иначе 409)
+    expected_available: Optional[bool] = None
+
+
+class SeatChangeSchema(BaseModel):
+    row: str
+    number: int
+    is_available: bool
+    expected_available: Optional[bool] = None
+
+
+class UpdateSeatsSchema(BaseModel):
+    seats: List[SeatChangeSchema]  # Изменения мест одного сеанса
 
 
 class HallSchema(BaseModel):
@@ -51,6 +64,27 @@ class CreateMultipleSessionsSchema(BaseModel):
     hall_id: int
     start_times: List[str]  # Список времен сеансов
     price: float
+    session_date: Optional[str] = None  # По умолчанию - сегодня
+
+
+class ScheduleItemSchema(BaseModel):
+    movie_title: str
+    hall_ids: List[int]
+    start_times: List[str]  # Времена сеансов в каждом из залов на каждую дату
+    price: float
+
+
+class CreateScheduleSchema(BaseModel):
+    cinema_id: int
+    date_from: str  # YYYY-MM-DD, включительно
+    date_to: str  # YYYY-MM-DD, включительно
+    items: List[ScheduleItemSchema]
+
+
+class ScheduleCreatedSchema(BaseModel):
+    created: int
+    first_id: Optional[int] = None  # id новых сеансов идут подряд
+    last_id: Optional[int] = None
 
 
 class UpdateSessionSchema(BaseModel):
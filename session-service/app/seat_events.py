@@ -0,0 +1,131 @@
+import asyncio
+import json
+import threading
+from typing import Callable, Dict, List, Optional, Set
+
+from app.logger import logger
+from app.models import Seat
+
+# Сколько событий может накопиться у медленного клиента до отключения
+SUBSCRIBER_QUEUE_SIZE = 256
+# Комментарий-пинг, чтобы прокси не закрывали простаивающее соединение
+HEARTBEAT_INTERVAL = 15
+
+
+def format_event(version: int, seats: List[Seat]) -> bytes:
+    """Событие SSE с изменившимися местами; id - версия карты мест"""
+    data = json.dumps({
+        "version": version,
+        "seats": [
+            {"row": seat.row, "number": seat.number, "is_available": seat.is_available}
+            for seat in seats
+        ]
+    }, ensure_ascii=False)
+    return f"id: {version}\nevent: seats\ndata: {data}\n\n".encode("utf-8")
+
+
+class SeatEventBroker:
+    """Рассылка изменений мест подписчикам SSE.
+
+    publish вызывается из обработчиков в пуле потоков: событие кодируется
+    один раз и передается в event loop без ожидания, раздача по очередям
+    подписчиков идет уже в loop.
+
+    Когда места меняют и другие процессы (несколько воркеров), publish не
+    используется: start_polling следит за версиями сеансов с подписчиками
+    и рассылает изменения с последней разосланной версии.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        # Последняя разосланная версия по сеансам с подписчиками
+        self._versions: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def subscribe(self, session_id: int, version: int) -> asyncio.Queue:
+        """Подписаться на изменения после версии version"""
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(session_id, set()).add(queue)
+            self._versions.setdefault(session_id, version)
+        return queue
+
+    def unsubscribe(self, session_id: int, queue: asyncio.Queue):
+        with self._lock:
+            queues = self._subscribers.get(session_id)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[session_id]
+                    self._versions.pop(session_id, None)
+
+    def publish(self, session_id: int, version: int, seats: List[Seat]):
+        """Отправить изменение мест всем подписчикам сеанса, не блокируя писателя"""
+        if self._thread is not None or session_id not in self._subscribers or self._loop is None:
+            return
+        self._send(session_id, format_event(version, seats))
+
+    def _send(self, session_id: int, event: bytes):
+        try:
+            self._loop.call_soon_threadsafe(self._fan_out, session_id, event)
+        except RuntimeError:
+            # Event loop уже остановлен
+            pass
+
+    def _fan_out(self, session_id: int, event: bytes):
+        with self._lock:
+            queues = list(self._subscribers.get(session_id, ()))
+        for queue in queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Клиент не успевает читать: закрываем его поток (None), после
+                # переподключения с Last-Event-ID он получит дельту
+                logger.warning("Dropping slow seat stream subscriber for session %s", session_id)
+                self.unsubscribe(session_id, queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def poll(self, get_session: Callable[[int], Optional[object]]):
+        """Разослать изменения сеансов с подписчиками, сделанные после прошлой рассылки"""
+        with self._lock:
+            watched = list(self._versions.items())
+        for session_id, sent in watched:
+            session = get_session(session_id)
+            if session is None:
+                continue
+            version = session.version
+            if version == sent:
+                continue
+            seats = session.changed_seats(sent)
+            with self._lock:
+                if session_id in self._versions:
+                    self._versions[session_id] = version
+            self._send(session_id, format_event(version, seats))
+
+    def start_polling(self, get_session: Callable[[int], Optional[object]], interval: float):
+        """Следить за версиями сеансов в фоновом потоке вместо publish"""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.poll(get_session)
+                except Exception as e:
+                    logger.error("Error polling seat changes: %s", e)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="seat-events-poller", daemon=True)
+        self._thread.start()
+
+    def stop_polling(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+seat_events = SeatEventBroker()
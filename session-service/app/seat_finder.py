@@ -0,0 +1,103 @@
+"""Поиск лучшего блока из N соседних свободных мест.
+
+Ряд представлен целым числом: бит i - место с номером first + i (1 -
+свободно). Битовая карта ряда строится без цикла по местам: байты
+состояния переводятся в строку цифр '0'/'1' и разбираются int(..., 2).
+Начала блоков из N свободных мест подряд находятся сдвигами и AND за
+O(log N) операций над целым рядом, ближайший к центру ряда блок - по
+младшему/старшему установленному биту.
+"""
+from typing import List, Optional, Tuple
+
+from app.models import Seat, RowSpan
+
+# Байт состояния места -> ASCII-цифра для int(..., 2)
+_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+_OCCUPIED_DIGIT = ord("0")
+
+
+def row_bits(digits: bytes, span: RowSpan) -> Tuple[int, int]:
+    """Битовая карта свободных мест ряда и его ширина (в номерах)"""
+    if isinstance(span.positions, slice):
+        row_digits = digits[span.positions]
+    else:
+        row_digits = bytes(digits[position] if position >= 0 else _OCCUPIED_DIGIT for position in span.positions)
+    if not row_digits:
+        return 0, 0
+    # Первое место ряда - младший бит
+    return int(row_digits[::-1], 2), len(row_digits)
+
+
+def block_starts(free: int, count: int) -> int:
+    """Биты i, с которых начинаются count свободных мест подряд.
+
+    После каждого шага бит i означает "span мест начиная с i свободны";
+    AND со сдвигом на step <= span удлиняет отрезки до span + step.
+    """
+    starts = free
+    span = 1
+    while span < count:
+        step = min(span, count - span)
+        starts &= starts >> step
+        span += step
+    return starts
+
+
+def nearest_start(starts: int, ideal: float) -> int:
+    """Установленный бит, ближайший к ideal (starts != 0)"""
+    pivot = max(int(ideal), 0)
+    best = None
+    high = starts >> pivot
+    if high:
+        best = pivot + (high & -high).bit_length() - 1
+    low = starts & ((1 << (pivot + 1)) - 1)
+    if low:
+        below = low.bit_length() - 1
+        if best is None or abs(below - ideal) < abs(best - ideal):
+            best = below
+    return best
+
+
+def find_best_block(session, count: int, preferred_row: Optional[str] = None,
+                    row_weight: float = 1.0) -> Optional[List[Seat]]:
+    """Лучший блок из count соседних свободных мест или None.
+
+    Оценка блока - расстояние от его середины до середины ряда (в местах)
+    плюс row_weight за каждый ряд от предпочтительного (по умолчанию -
+    центрального ряда зала). Ряды перебираются от предпочтительного, перебор
+    останавливается, когда штраф за ряд уже не меньше лучшей оценки.
+    """
+    rows = session.layout.rows()
+    if not rows or count < 1:
+        return None
+    target = len(rows) // 2
+    if preferred_row is not None:
+        target = next((i for i, span in enumerate(rows) if span.row == preferred_row), target)
+
+    digits = bytes(session.seat_states()).translate(_DIGITS)
+    best = None
+    best_score = float("inf")
+    for index in sorted(range(len(rows)), key=lambda i: abs(i - target)):
+        row_penalty = abs(index - target) * row_weight
+        if row_penalty >= best_score:
+            break
+        free, width = row_bits(digits, rows[index])
+        if width < count:
+            continue
+        starts = block_starts(free, count)
+        if not starts:
+            continue
+        ideal = (width - count) / 2
+        start = nearest_start(starts, ideal)
+        score = row_penalty + abs(start - ideal)
+        if score < best_score:
+            best_score = score
+            best = (rows[index], start)
+
+    if best is None:
+        return None
+    span, start = best
+    return [
+        Seat(row=span.row, number=span.first + start + i, is_available=True)
+        for i in range(count)
+    ]
@@ -0,0 +1,322 @@
+"""Общее состояние сеансов для нескольких воркеров uvicorn.
+
+Карты мест и их версии лежат в файле в общей памяти (mmap), поэтому любое
+изменение места сразу видно всем воркерам. Изменения выполняет один писатель
+за раз: блокировка записи - это lockf на файле блокировок плюс блокировка
+потоков внутри процесса.
+
+Каталог (какие сеансы есть и где в общей памяти их места) у каждого воркера
+свой, в обычных словарях storage. Создание и удаление сеансов дописывается
+в ленту каталога, остальные воркеры дочитывают ее перед запросами.
+
+Блок удаленного сеанса попадает в список свободных (по размеру блока) и
+отдается следующему сеансу с тем же размером. Когда лента вырастает вдвое,
+ее сжимают (compact_feed): текущий каталог пишется в файл следующего
+поколения, и новые воркеры читают только его.
+
+Файлы в directory:
+    seats.shm        - заголовок и блоки сеансов: версия, базовая версия,
+                       версии мест (u64), затем состояние мест (байт на место)
+    catalog.N.feed   - лента каталога поколения N, JSON по строке на запись
+    state.lock       - байт 0 - блокировка записи, байт 1 - "воркеры живы",
+                       байт 2 - чекпоинт журнала
+"""
+import glob
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+from app.logger import logger
+from app.models import SeatLayout
+
+MAGIC = b"CSHM"
+# магия, pid инициализировавшего процесса, конец занятой области, длина ленты,
+# поколение ленты, длина ленты после последнего сжатия
+HEADER = struct.Struct("<4sIQQQQ")
+DATA_OFFSET = 64
+# Ленту сжимаем, когда она выросла вдвое с прошлого сжатия, но не меньше этого
+FEED_COMPACT_MIN_BYTES = 256 * 1024
+
+WRITE_LOCK_BYTE = 0
+ALIVE_LOCK_BYTE = 1
+CHECKPOINT_LOCK_BYTE = 2
+
+
+class SharedArenaFull(Exception):
+    """В общей памяти нет места под карту мест нового сеанса"""
+
+
+def block_size(count: int) -> int:
+    """Размер блока сеанса с count местами (выровнен на 8 байт)"""
+    return (16 + 9 * count + 7) // 8 * 8
+
+
+class SharedState:
+
+    def __init__(self, directory: str, arena_size: int):
+        self.directory = directory
+        self.arena_size = arena_size
+        self.feed_position = 0
+        # Поколение прочитанной ленты; None - лента еще не читалась
+        self.generation = None
+        # Блоки сеансов (id -> смещение, размер) и свободные блоки (размер -> смещения)
+        self.session_blocks: Dict[int, Tuple[int, int]] = {}
+        self.free_blocks: Dict[int, List[int]] = {}
+        # Раскладки, уже записанные в ленту: раскладка -> id и обратно
+        self.layout_ids: Dict[SeatLayout, int] = {}
+        self.layouts: Dict[int, SeatLayout] = {}
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._sync_lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(directory, "state.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        fd = os.open(os.path.join(directory, "seats.shm"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < arena_size:
+                os.ftruncate(fd, arena_size)
+            self._mmap = mmap.mmap(fd, arena_size)
+        finally:
+            os.close(fd)
+        self._view = memoryview(self._mmap)
+
+    @contextmanager
+    def write_lock(self):
+        """Единственный писатель среди всех воркеров (повторный вход разрешен)"""
+        with self._thread_lock:
+            if self._depth == 0:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, WRITE_LOCK_BYTE)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, WRITE_LOCK_BYTE)
+
+    @contextmanager
+    def checkpoint_lock(self):
+        """Чекпоинт журнала делает один воркер за раз"""
+        with self._checkpoint_lock:
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_EX, 1, CHECKPOINT_LOCK_BYTE)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_UN, 1, CHECKPOINT_LOCK_BYTE)
+
+    def attach(self, initialize: Callable[[], None]) -> bool:
+        """Подключить процесс к общему состоянию.
+
+        Если живых воркеров нет (первый запуск или все перезапустились),
+        общая память сбрасывается и вызывается initialize() - он загружает
+        сеансы с диска и публикует их. Возвращает True, если инициализировал
+        этот процесс.
+        """
+        with self.write_lock():
+            try:
+                fcntl.lockf(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, ALIVE_LOCK_BYTE)
+                alone = True
+            except OSError:
+                alone = False
+
+            if alone:
+                logger.info("Initializing shared session state in %s", self.directory)
+                for path in glob.glob(os.path.join(self.directory, "catalog.*feed*")):
+                    os.remove(path)
+                HEADER.pack_into(self._view, 0, MAGIC, os.getpid(), DATA_OFFSET, 0, 0, 0)
+                open(self.feed_path(0), "wb").close()
+                self.feed_position = 0
+                self.generation = 0
+                self.session_blocks.clear()
+                self.free_blocks.clear()
+                initialize()
+            # Пока процесс жив, он держит разделяемую блокировку "воркеры живы"
+            fcntl.lockf(self._lock_fd, fcntl.LOCK_SH, 1, ALIVE_LOCK_BYTE)
+            return alone
+
+    def feed_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f"catalog.{generation}.feed")
+
+    def _header(self):
+        magic, owner, next_free, feed_length, generation, compacted_length = HEADER.unpack_from(self._view, 0)
+        if magic != MAGIC:
+            raise RuntimeError(f"Shared session state in {self.directory} is not initialized")
+        return owner, next_free, feed_length, generation, compacted_length
+
+    def feed_length(self) -> int:
+        return HEADER.unpack_from(self._view, 0)[3]
+
+    def allocate(self, session, records: List[dict]) -> int:
+        """Перенести карту мест сеанса в общую память (под блокировкой записи).
+
+        Берется свободный блок того же размера, если он есть, иначе - место
+        в конце занятой области. Запись о блоке добавляется в records.
+        """
+        owner, next_free, feed_length, generation, compacted_length = self._header()
+        count = len(session.layout)
+        size = block_size(count)
+        free = self.free_blocks.get(size)
+        if free:
+            offset = free.pop()
+        else:
+            if next_free + size > self.arena_size:
+                raise SharedArenaFull(f"Shared seat arena is full ({self.arena_size} bytes)")
+            offset = next_free
+            HEADER.pack_into(self._view, 0, MAGIC, owner, next_free + size, feed_length, generation, compacted_length)
+
+        version = session.version
+        struct.pack_into(f"<{2 + count}Q", self._view, offset, version, version, *([version] * count))
+        start = offset + 8 * (2 + count)
+        self._view[start:start + count] = bytes(session.seat_states())
+        self.bind(session, offset)
+        self.session_blocks[session.id] = (offset, size)
+        records.append({"op": "block", "session_id": session.id, "offset": offset, "size": size})
+        return offset
+
+    def free(self, session, records: List[dict]):
+        """Вернуть блок удаленного сеанса в список свободных (под блокировкой записи)"""
+        block = self.session_blocks.pop(session.id, None)
+        if block is None:
+            return
+        offset, size = block
+        self.free_blocks.setdefault(size, []).append(offset)
+        records.append({"op": "free", "session_id": session.id, "offset": offset, "size": size})
+
+    def bind(self, session, offset: int):
+        """Привязать места сеанса к его блоку в общей памяти"""
+        count = len(session.layout)
+        words = self._view[offset:offset + 8 * (2 + count)].cast("Q")
+        session.shared_versions = words[:2]
+        session.base_version = words[1]
+        session.seat_versions = words[2:]
+        start = offset + 8 * (2 + count)
+        session.availability = self._view[start:start + count]
+        session.packed_seats = None
+
+    def publish(self, records: List[dict]):
+        """Дописать записи в ленту каталога (под блокировкой записи)"""
+        owner, next_free, feed_length, generation, compacted_length = self._header()
+        if self.feed_position != feed_length or self.generation != generation:
+            raise RuntimeError("Catalog feed must be synced before publishing")
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        with open(self.feed_path(generation), "r+b") as f:
+            f.seek(feed_length)
+            f.write(data)
+            f.flush()
+        # Длина в заголовке меняется последней: читатели видят только целые записи
+        HEADER.pack_into(self._view, 0, MAGIC, owner, next_free, feed_length + len(data), generation, compacted_length)
+        self.feed_position = feed_length + len(data)
+
+    def compact_feed(self, session_records: Callable[[], List[dict]]) -> bool:
+        """Сжать ленту, если она выросла вдвое с прошлого сжатия (под блокировкой
+        записи, каталог дочитан).
+
+        Новая лента - раскладки, блоки и свободные блоки из состояния этого
+        воркера и session_records() - записи создания всех текущих сеансов.
+        Она пишется в файл следующего поколения, старый файл удаляется.
+        """
+        owner, next_free, feed_length, generation, compacted_length = self._header()
+        if self.feed_position != feed_length or self.generation != generation:
+            raise RuntimeError("Catalog feed must be synced before compaction")
+        if feed_length < max(FEED_COMPACT_MIN_BYTES, 2 * compacted_length):
+            return False
+
+        records = [{"op": "layout", "id": layout_id, "seats": layout.seats}
+                   for layout_id, layout in sorted(self.layouts.items())]
+        records.extend(
+            {"op": "block", "session_id": session_id, "offset": offset, "size": size}
+            for session_id, (offset, size) in self.session_blocks.items()
+        )
+        records.extend(session_records())
+        records.extend(
+            {"op": "free", "session_id": None, "offset": offset, "size": size}
+            for size, offsets in self.free_blocks.items() for offset in offsets
+        )
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        path = self.feed_path(generation + 1)
+        with open(path, "wb") as f:
+            f.write(data)
+            f.flush()
+        HEADER.pack_into(self._view, 0, MAGIC, owner, next_free, len(data), generation + 1, len(data))
+        self.generation = generation + 1
+        self.feed_position = len(data)
+        os.remove(self.feed_path(generation))
+        logger.info("Catalog feed compacted: %s -> %s bytes", feed_length, len(data))
+        return True
+
+    def layout_record(self, layout: SeatLayout, records: List[dict]) -> int:
+        """id раскладки в ленте; новая раскладка добавляется в records"""
+        layout_id = self.layout_ids.get(layout)
+        if layout_id is None:
+            layout_id = len(self.layouts)
+            self._remember_layout(layout_id, layout)
+            records.append({"op": "layout", "id": layout_id, "seats": layout.seats})
+        return layout_id
+
+    def _remember_layout(self, layout_id: int, layout: SeatLayout):
+        self.layout_ids[layout] = layout_id
+        self.layouts[layout_id] = layout
+
+    def _apply_block_record(self, record: dict):
+        if record["op"] == "block":
+            offsets = self.free_blocks.get(record["size"])
+            if offsets and record["offset"] in offsets:
+                offsets.remove(record["offset"])
+            self.session_blocks[record["session_id"]] = (record["offset"], record["size"])
+        else:
+            self.session_blocks.pop(record["session_id"], None)
+            self.free_blocks.setdefault(record["size"], []).append(record["offset"])
+
+    def sync(self, apply: Callable[[dict], None], reload: Callable[[List[dict], set], None]):
+        """Применить записи ленты, добавленные другими воркерами.
+
+        Если ленту сжали (сменилось поколение) или воркер читает ее впервые,
+        лента читается с начала и вызывается reload(записи каталога, id
+        сеансов, чей блок не изменился) - каталог приводится к ее содержимому.
+        """
+        owner, next_free, feed_length, generation, compacted_length = self._header()
+        if feed_length == self.feed_position and generation == self.generation:
+            return
+        with self._sync_lock:
+            owner, next_free, feed_length, generation, compacted_length = self._header()
+            reloading = generation != self.generation
+            position = 0 if reloading else self.feed_position
+            if feed_length == position and not reloading:
+                return
+            try:
+                with open(self.feed_path(generation), "rb") as f:
+                    f.seek(position)
+                    data = f.read(feed_length - position)
+            except FileNotFoundError:
+                # Ленту сжали между чтением заголовка и открытием файла
+                return
+            if len(data) != feed_length - position:
+                return
+
+            previous_blocks = self.session_blocks
+            if reloading:
+                self.session_blocks = {}
+                self.free_blocks = {}
+            catalog_records = []
+            for line in data.splitlines():
+                record = json.loads(line)
+                if record["op"] == "layout":
+                    self._remember_layout(record["id"], SeatLayout.intern(record["seats"]))
+                elif record["op"] in ("block", "free"):
+                    self._apply_block_record(record)
+                elif reloading:
+                    catalog_records.append(record)
+                else:
+                    apply(record)
+            if reloading:
+                unchanged = {session_id for session_id, block in self.session_blocks.items()
+                             if previous_blocks.get(session_id) == block}
+                reload(catalog_records, unchanged)
+                self.generation = generation
+            self.feed_position = feed_length
@@ -0,0 +1,170 @@
+"""Бинарный снапшот сеансов для быстрого холодного старта.
+
+Формат (little-endian):
+    заголовок   - магия, версия, количества и смещения секций
+    строки      - таблица смещений u32 и utf-8 данные (названия фильмов,
+                  даты, время, ряды)
+    раскладки   - для каждой: u32 число мест, затем пары (u32 ряд, u32 номер)
+    сеансы      - записи фиксированной длины SESSION_RECORD
+    битовые карты мест - упакованы по 8 мест в байт
+
+Файл читается через mmap: записи сеансов разбираются сразу, а битовые карты
+мест остаются ссылками на mmap до первого обращения к местам сеанса.
+"""
+import mmap
+import os
+import struct
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
+
+from app.models import Session, SeatLayout, pack_seat_bits
+
+MAGIC = b"CSNP"
+VERSION = 1
+
+HEADER = struct.Struct("<4sHHIIIQQQQ")
+# id, cinema_id, hall_id, название, дата, время, раскладка, цена, смещение карты мест
+SESSION_RECORD = struct.Struct("<IIIIIIIdQ")
+U32 = struct.Struct("<I")
+SEAT = struct.Struct("<II")
+
+
+class StringTable:
+    """Таблица строк: каждая уникальная строка хранится один раз"""
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def add(self, value: str) -> int:
+        string_id = self._ids.get(value)
+        if string_id is None:
+            string_id = self._ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def encode(self) -> bytes:
+        blobs = [value.encode("utf-8") for value in self.strings]
+        offsets = [0]
+        for blob in blobs:
+            offsets.append(offsets[-1] + len(blob))
+        return struct.pack(f"<{len(offsets)}I", *offsets) + b"".join(blobs)
+
+
+def write_snapshot(path: str, sessions: Iterable[Session]):
+    """Записать сеансы в бинарный снапшот"""
+    strings = StringTable()
+    layout_ids: Dict[int, int] = {}
+    layouts: List[bytes] = []
+    records: List[bytes] = []
+    bitmaps: List[bytes] = []
+    bitmap_offset = 0
+
+    for session in sessions:
+        layout_id = layout_ids.get(id(session.layout))
+        if layout_id is None:
+            layout_id = layout_ids[id(session.layout)] = len(layouts)
+            layouts.append(U32.pack(len(session.layout)) + b"".join(
+                SEAT.pack(strings.add(row), number) for row, number in session.layout.seats
+            ))
+
+        # Нераспакованную карту мест можно скопировать как есть (сама она не
+        # меняется, сеанс при распаковке только перестает на нее ссылаться)
+        packed_seats = session.packed_seats
+        if session.availability is None and packed_seats is not None:
+            packed = bytes(packed_seats)
+        else:
+            packed = pack_seat_bits(session.seat_states())
+
+        records.append(SESSION_RECORD.pack(
+            session.id,
+            session.cinema_id,
+            session.hall_id,
+            strings.add(session.movie_title),
+            strings.add(session.session_date),
+            strings.add(session.start_time),
+            layout_id,
+            session.price,
+            bitmap_offset,
+        ))
+        bitmaps.append(packed)
+        bitmap_offset += len(packed)
+
+    strings_data = strings.encode()
+    layouts_data = b"".join(layouts)
+    strings_offset = HEADER.size
+    layouts_offset = strings_offset + len(strings_data)
+    records_offset = layouts_offset + len(layouts_data)
+    bitmaps_offset = records_offset + SESSION_RECORD.size * len(records)
+
+    header = HEADER.pack(
+        MAGIC, VERSION, 0,
+        len(strings.strings), len(layouts), len(records),
+        strings_offset, layouts_offset, records_offset, bitmaps_offset,
+    )
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(strings_data)
+        f.write(layouts_data)
+        f.writelines(records)
+        f.writelines(bitmaps)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Iterator[Session]:
+    """Прочитать сеансы из бинарного снапшота.
+
+    Места сеансов не распаковываются: Session.packed_seats ссылается на
+    mmap, который живет, пока на него есть ссылки.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        data = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    (magic, version, _, string_count, layout_count, session_count,
+     strings_offset, layouts_offset, records_offset, bitmaps_offset) = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"Unsupported sessions snapshot format in {path}")
+
+    offsets = struct.unpack_from(f"<{string_count + 1}I", data, strings_offset)
+    blob_offset = strings_offset + 4 * (string_count + 1)
+    strings = [
+        str(data[blob_offset + start:blob_offset + end], "utf-8")
+        for start, end in zip(offsets, offsets[1:])
+    ]
+
+    layouts = []
+    offset = layouts_offset
+    for _ in range(layout_count):
+        (seat_count,) = U32.unpack_from(data, offset)
+        offset += U32.size
+        seats = [
+            (strings[row_id], number)
+            for row_id, number in SEAT.iter_unpack(data[offset:offset + SEAT.size * seat_count])
+        ]
+        offset += SEAT.size * seat_count
+        layouts.append(SeatLayout.intern(seats))
+
+    # created_at в снапшот не пишется (как и в sessions.json)
+    loaded_at = datetime.now().isoformat()
+    records = data[records_offset:records_offset + SESSION_RECORD.size * session_count]
+    for (session_id, cinema_id, hall_id, title_id, date_id, time_id,
+         layout_id, price, bitmap_offset) in SESSION_RECORD.iter_unpack(records):
+        layout = layouts[layout_id]
+        start = bitmaps_offset + bitmap_offset
+        yield Session(
+            id=session_id,
+            movie_title=strings[title_id],
+            cinema_id=cinema_id,
+            hall_id=hall_id,
+            start_time=strings[time_id],
+            session_date=strings[date_id],
+            price=price,
+            layout=layout,
+            availability=None,
+            created_at=loaded_at,
+            packed_seats=data[start:start + (len(layout) + 7) // 8],
+        )
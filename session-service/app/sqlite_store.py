@@ -0,0 +1,205 @@
+"""Хранилище сеансов и залов в SQLite (STORAGE_BACKEND=sqlite).
+
+Словари storage остаются основным представлением данных в памяти, база
+только сохраняет изменения: каждое изменение мест - одна транзакция с
+UPDATE по индексу (session_id, row, number), без перезаписи файлов целиком.
+
+База работает в режиме WAL: запись не блокирует чтение, несколько
+процессов (воркеров) могут писать в одну базу по очереди.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+from app.models import Hall, Seat, SeatLayout, Session
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS halls (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    cinema_id INTEGER NOT NULL,
+    rows INTEGER NOT NULL,
+    seats_per_row INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hall_seats (
+    hall_id INTEGER NOT NULL REFERENCES halls(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    row TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    PRIMARY KEY (hall_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    movie_title TEXT NOT NULL,
+    cinema_id INTEGER NOT NULL,
+    hall_id INTEGER NOT NULL,
+    start_time TEXT NOT NULL,
+    session_date TEXT NOT NULL,
+    price REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_hall_date ON sessions (hall_id, session_date);
+CREATE INDEX IF NOT EXISTS sessions_by_date ON sessions (session_date);
+CREATE TABLE IF NOT EXISTS seats (
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    row TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    is_available INTEGER NOT NULL,
+    PRIMARY KEY (session_id, position)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX IF NOT EXISTS seats_by_place ON seats (session_id, row, number);
+"""
+
+INSERT_HALL = "INSERT OR REPLACE INTO halls (id, name, cinema_id, rows, seats_per_row) VALUES (?, ?, ?, ?, ?)"
+INSERT_HALL_SEAT = "INSERT INTO hall_seats (hall_id, position, row, number) VALUES (?, ?, ?, ?)"
+INSERT_SESSION = (
+    "INSERT OR REPLACE INTO sessions (id, movie_title, cinema_id, hall_id, start_time, session_date, price, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+INSERT_SEAT = "INSERT INTO seats (session_id, position, row, number, is_available) VALUES (?, ?, ?, ?, ?)"
+UPDATE_SEAT = "UPDATE seats SET is_available = ? WHERE session_id = ? AND row = ? AND number = ?"
+DELETE_SESSION = "DELETE FROM sessions WHERE id = ?"
+DELETE_SESSION_SEATS = "DELETE FROM seats WHERE session_id = ?"
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Соединение с базой в режиме WAL"""
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # В WAL при synchronous=NORMAL коммит не ждет fsync, база при сбое не портится
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    return connection
+
+
+class SqliteSessionStore:
+    """Сеансы, их места и залы в SQLite.
+
+    Запросы - постоянные строки с параметрами: sqlite3 кэширует
+    подготовленные выражения соединения и не разбирает SQL повторно.
+    Соединение одно на процесс, запись идет под блокировкой.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = connect(path)
+        self._connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT под блокировкой; при ошибке - ROLLBACK"""
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def is_empty(self) -> bool:
+        """В базе еще нет ни сеансов, ни залов (нужна миграция из JSON)"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT EXISTS (SELECT 1 FROM sessions) OR EXISTS (SELECT 1 FROM halls)"
+            ).fetchone()
+        return not row[0]
+
+    def add_sessions(self, new_sessions: Iterable[Session]):
+        """Сохранить сеансы вместе с местами одной транзакцией"""
+        with self._transaction() as connection:
+            for session in new_sessions:
+                connection.execute(DELETE_SESSION_SEATS, (session.id,))
+                connection.execute(INSERT_SESSION, (
+                    session.id, session.movie_title, session.cinema_id, session.hall_id,
+                    session.start_time, session.session_date, session.price, session.created_at
+                ))
+                connection.executemany(INSERT_SEAT, (
+                    (session.id, position, row, number, available)
+                    for position, ((row, number), available) in enumerate(zip(session.layout.seats, session.seat_states()))
+                ))
+
+    def update_seats(self, session_id: int, seats: List[Seat]):
+        """Сохранить новое состояние мест сеанса (все места - одна транзакция)"""
+        with self._transaction() as connection:
+            connection.executemany(UPDATE_SEAT, (
+                (int(seat.is_available), session_id, seat.row, seat.number)
+                for seat in seats
+            ))
+
+    def delete_session(self, session_id: int):
+        with self._transaction() as connection:
+            connection.execute(DELETE_SESSION_SEATS, (session_id,))
+            connection.execute(DELETE_SESSION, (session_id,))
+
+    def load_sessions(self) -> List[Session]:
+        """Прочитать все сеансы с местами"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, movie_title, cinema_id, hall_id, start_time, session_date, price, created_at "
+                "FROM sessions ORDER BY id"
+            ).fetchall()
+            seat_rows = self._connection.execute(
+                "SELECT session_id, row, number, is_available FROM seats ORDER BY session_id, position"
+            )
+            seats_by_session = {}
+            for session_id, row, number, available in seat_rows:
+                seats_by_session.setdefault(session_id, []).append((row, number, available))
+
+        loaded = []
+        for session_id, movie_title, cinema_id, hall_id, start_time, session_date, price, created_at in rows:
+            session_seats = seats_by_session.get(session_id, [])
+            loaded.append(Session(
+                id=session_id,
+                movie_title=movie_title,
+                cinema_id=cinema_id,
+                hall_id=hall_id,
+                start_time=start_time,
+                session_date=session_date,
+                price=price,
+                created_at=created_at,
+                layout=SeatLayout.intern((row, number) for row, number, _ in session_seats),
+                availability=bytearray(available for _, _, available in session_seats)
+            ))
+        return loaded
+
+    def save_halls(self, hall_list: Iterable[Hall]):
+        """Сохранить залы (заменяет сохраненные раньше)"""
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM hall_seats")
+            connection.execute("DELETE FROM halls")
+            for hall in hall_list:
+                connection.execute(INSERT_HALL, (hall.id, hall.name, hall.cinema_id, hall.rows, hall.seats_per_row))
+                connection.executemany(INSERT_HALL_SEAT, (
+                    (hall.id, position, seat.row, seat.number)
+                    for position, seat in enumerate(hall.seats)
+                ))
+
+    def load_halls(self) -> Optional[List[Hall]]:
+        """Прочитать залы; None - залы в базу еще не сохранялись"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, name, cinema_id, rows, seats_per_row FROM halls ORDER BY id"
+            ).fetchall()
+            seat_rows = self._connection.execute(
+                "SELECT hall_id, row, number FROM hall_seats ORDER BY hall_id, position"
+            ).fetchall()
+        if not rows:
+            return None
+
+        seats_by_hall = {}
+        for hall_id, row, number in seat_rows:
+            seats_by_hall.setdefault(hall_id, []).append(Seat(row=row, number=number))
+        return [
+            Hall(id=hall_id, name=name, cinema_id=cinema_id, rows=hall_rows,
+                 seats_per_row=seats_per_row, seats=seats_by_hall.get(hall_id, []))
+            for hall_id, name, cinema_id, hall_rows, seats_per_row in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
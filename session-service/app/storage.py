@@ -1,3 +1,7 @@
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+
 from app.models import Seat, Hall, Session, Cinema
 
 # Инициализация кинотеатров
@@ -86,8 +90,207 @@ halls = {
     )
 }
 
+# Залы по кинотеатрам (cinema_id -> список id залов)
+halls_by_cinema = {}
+
+
+def reindex_halls():
+    """Перестроить индекс залов по кинотеатрам"""
+    halls_by_cinema.clear()
+    for hall in halls.values():
+        halls_by_cinema.setdefault(hall.cinema_id, []).append(hall.id)
+
+
+reindex_halls()
+
 # Инициализация сессий - пустая, будут создаваться через API
 sessions = {}
 
-# Отслеживание занятых временных слотов (зал -> время -> True)
-occupied_slots = {}
\ No newline at end of file
+# Вторичные индексы каталога сеансов: значение -> отсортированный список id
+session_ids = []
+sessions_by_cinema = {}
+sessions_by_hall = {}
+sessions_by_date = {}
+sessions_by_movie = {}
+# Даты, на которые есть сеансы, по возрастанию (для фильтра по диапазону)
+session_dates = []
+
+# Отслеживание занятых временных слотов ((зал, дата, время) -> id сеанса)
+occupied_slots = {}
+
+# Следующий свободный id сеанса
+session_id_seq = 1
+
+# Кому сообщать об изменении каталога: вызывается с сеансом (None - все сеансы)
+session_listeners = []
+
+
+def _notify_session_changed(session):
+    for listener in session_listeners:
+        listener(session)
+
+
+def slot_key(hall_id, session_date, start_time):
+    """Ключ слота зала в индексе occupied_slots"""
+    return (hall_id, session_date, start_time)
+
+
+def is_slot_occupied(hall_id, session_date, start_time):
+    """Проверить за O(1), что в зале в это время и дату уже идет фильм"""
+    return slot_key(hall_id, session_date, start_time) in occupied_slots
+
+
+def next_session_id():
+    """Выдать id для нового сеанса"""
+    global session_id_seq
+    new_id = session_id_seq
+    session_id_seq += 1
+    return new_id
+
+
+def allocate_session_ids(count):
+    """Выдать блок из count идущих подряд id"""
+    global session_id_seq
+    first = session_id_seq
+    session_id_seq += count
+    return range(first, first + count)
+
+
+def movie_key(movie_title):
+    """Ключ фильма в индексе: без учета регистра и пробелов по краям"""
+    return movie_title.strip().casefold()
+
+
+def _index_add(index, key, session_id):
+    ids = index.get(key)
+    if ids is None:
+        index[key] = [session_id]
+        return True
+    insort(ids, session_id)
+    return False
+
+
+def _index_remove(index, key, session_id):
+    ids = index.get(key)
+    if ids is None:
+        return False
+    position = bisect_left(ids, session_id)
+    if position < len(ids) and ids[position] == session_id:
+        del ids[position]
+    if ids:
+        return False
+    del index[key]
+    return True
+
+
+def add_session(session):
+    """Добавить сеанс, занять его слот в зале и обновить индексы каталога"""
+    _index_session(session)
+    _notify_session_changed(session)
+
+
+def add_sessions(new_sessions):
+    """Добавить пачку сеансов; подписчики получают одно уведомление на всех"""
+    for session in new_sessions:
+        _index_session(session)
+    _notify_session_changed(None)
+
+
+def _index_session(session):
+    global session_id_seq
+    remove_session(session.id)
+    sessions[session.id] = session
+    occupied_slots[slot_key(session.hall_id, session.session_date, session.start_time)] = session.id
+    session_id_seq = max(session_id_seq, session.id + 1)
+    
+    insort(session_ids, session.id)
+    _index_add(sessions_by_cinema, session.cinema_id, session.id)
+    _index_add(sessions_by_hall, session.hall_id, session.id)
+    _index_add(sessions_by_movie, movie_key(session.movie_title), session.id)
+    if _index_add(sessions_by_date, session.session_date, session.id):
+        insort(session_dates, session.session_date)
+
+
+def remove_session(session_id):
+    """Удалить сеанс, освободить его слот и убрать из индексов"""
+    session = sessions.pop(session_id, None)
+    if session:
+        key = slot_key(session.hall_id, session.session_date, session.start_time)
+        if occupied_slots.get(key) == session_id:
+            del occupied_slots[key]
+        
+        del session_ids[bisect_left(session_ids, session_id)]
+        _index_remove(sessions_by_cinema, session.cinema_id, session_id)
+        _index_remove(sessions_by_hall, session.hall_id, session_id)
+        _index_remove(sessions_by_movie, movie_key(session.movie_title), session_id)
+        if _index_remove(sessions_by_date, session.session_date, session_id):
+            del session_dates[bisect_left(session_dates, session.session_date)]
+        _notify_session_changed(session)
+    return session
+
+
+def clear_sessions():
+    """Удалить все сеансы вместе с индексами"""
+    global session_id_seq
+    sessions.clear()
+    occupied_slots.clear()
+    session_ids.clear()
+    sessions_by_cinema.clear()
+    sessions_by_hall.clear()
+    sessions_by_date.clear()
+    sessions_by_movie.clear()
+    session_dates.clear()
+    session_id_seq = 1
+    _notify_session_changed(None)
+
+
+def session_matches(session, cinema_id=None, hall_id=None, date=None, date_from=None,
+                    date_to=None, title_key=None):
+    """Подходит ли сеанс под фильтры каталога (title_key - результат movie_key)"""
+    return ((cinema_id is None or session.cinema_id == cinema_id)
+            and (hall_id is None or session.hall_id == hall_id)
+            and (date is None or session.session_date == date)
+            and (date_from is None or session.session_date >= date_from)
+            and (date_to is None or session.session_date <= date_to)
+            and (title_key is None or movie_key(session.movie_title) == title_key))
+
+
+def find_sessions(cinema_id=None, hall_id=None, date=None, date_from=None, date_to=None,
+                  movie_title=None, after=None, limit=None):
+    """Найти сеансы по фильтрам в порядке id, начиная после id after.
+
+    Перебирается самый короткий подходящий индекс с позиции курсора,
+    остальные фильтры проверяются на самих сеансах, поэтому стоимость
+    зависит от размера страницы, а не от числа сеансов в каталоге.
+    """
+    title_key = movie_key(movie_title) if movie_title is not None else None
+    
+    # Кандидаты: (размер, отсортированные списки id) для каждого фильтра
+    candidates = [(len(session_ids), [session_ids])]
+    for index, key in ((sessions_by_cinema, cinema_id), (sessions_by_hall, hall_id),
+                       (sessions_by_date, date), (sessions_by_movie, title_key)):
+        if key is not None:
+            ids = index.get(key, [])
+            candidates.append((len(ids), [ids]))
+    if date_from is not None or date_to is not None:
+        low = bisect_left(session_dates, date_from) if date_from is not None else 0
+        high = bisect_right(session_dates, date_to) if date_to is not None else len(session_dates)
+        lists = [sessions_by_date.get(day, []) for day in session_dates[low:high]]
+        candidates.append((sum(len(ids) for ids in lists), lists))
+    
+    _, lists = min(candidates, key=lambda candidate: candidate[0])
+    start = [bisect_right(ids, after) if after is not None else 0 for ids in lists]
+    if len(lists) == 1:
+        driver = islice(lists[0], start[0], None)
+    else:
+        driver = heapq.merge(*(islice(ids, position, None) for ids, position in zip(lists, start)))
+    
+    result = []
+    for session_id in driver:
+        # Индексы читаются без блокировки: сеанс мог быть удален после снимка индекса
+        session = sessions.get(session_id)
+        if session is not None and session_matches(session, cinema_id, hall_id, date, date_from, date_to, title_key):
+            result.append(session)
+            if limit is not None and len(result) >= limit:
+                break
+    return result
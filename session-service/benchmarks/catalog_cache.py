@@ -0,0 +1,107 @@
+"""Бенчмарк кэша ответов каталога: попадание в ResponseCache против сборки ответа.
+
+Запуск из каталога session-service:
+    python -m benchmarks.catalog_cache [--sessions 20000] [--limit 100]
+
+Каталог сеансов строится в app.storage. Для страниц /api/session/sessions
+с разными фильтрами сравнивается:
+  miss - путь без кэша: find_sessions, SessionSchema на каждый сеанс и
+         encode_json (как build в get_sessions_api);
+  hit  - ResponseCache.get по ключу запроса и готовое тело.
+Затем создается один сеанс и показывается, сколько закэшированных страниц
+сбросил session_changed (только те, в которые сеанс мог попасть).
+"""
+import argparse
+import time
+
+from app import storage
+from app.models import Session
+from app.response_cache import ResponseCache, encode_json
+from app.schemas import SessionSchema
+
+TIMES = ["10:00", "12:00", "14:00", "16:00", "18:00", "20:00", "22:00"]
+
+
+def fill_catalog(count: int):
+    storage.clear_sessions()
+    halls = list(storage.halls.values())
+    new_sessions = []
+    for session_id in range(1, count + 1):
+        hall = halls[session_id % len(halls)]
+        slot = session_id // len(halls)
+        new_sessions.append(Session(
+            id=session_id, movie_title=f"Фильм {session_id % 40}", cinema_id=hall.cinema_id, hall_id=hall.id,
+            start_time=TIMES[slot % len(TIMES)],
+            session_date=f"2030-{slot // len(TIMES) // 28 % 12 + 1:02d}-{slot // len(TIMES) % 28 + 1:02d}",
+            layout=hall.layout, availability=None, packed_seats=memoryview(hall.layout.free_seat_bits())
+        ))
+    storage.add_sessions(new_sessions)
+
+
+def build_page(filters: dict, limit: int) -> bytes:
+    page = storage.find_sessions(limit=limit, **filters)
+    return encode_json([
+        SessionSchema(id=s.id, movie_title=s.movie_title, cinema_id=s.cinema_id, hall_id=s.hall_id,
+                      start_time=s.start_time, session_date=s.session_date, price=s.price)
+        for s in page
+    ])
+
+
+def measure(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    fill_catalog(args.sessions)
+    cache = ResponseCache(1024)
+    storage.session_listeners.append(cache.session_changed)
+    queries = {
+        "все": {},
+        "кинотеатр": {"cinema_id": 2},
+        "зал и дата": {"hall_id": 3, "date": "2030-01-05"},
+        "фильм": {"movie_title": "Фильм 7"},
+        "диапазон дат": {"date_from": "2030-02-01", "date_to": "2030-02-10"},
+    }
+
+    print(f"сеансов: {args.sessions}, страница: {args.limit}")
+    print(f"{'запрос':>13} {'miss, мкс':>10} {'hit, мкс':>9} {'быстрее в':>10}")
+    for name, filters in queries.items():
+        key = ("sessions", name)
+        body = build_page(filters, args.limit)
+        page_ids = {s.id for s in storage.find_sessions(limit=args.limit, **filters)}
+        last_id = max(page_ids) if len(page_ids) == args.limit else None
+        cache.put(key, body, depends_on=lambda session, filters=filters, last_id=last_id: (
+            (last_id is None or session.id <= last_id) and storage.session_matches(
+                session, filters.get("cinema_id"), filters.get("hall_id"), filters.get("date"),
+                filters.get("date_from"), filters.get("date_to"),
+                storage.movie_key(filters["movie_title"]) if "movie_title" in filters else None)
+        ))
+        assert cache.get(key).body == body
+
+        miss = measure(lambda: build_page(filters, args.limit), max(args.repeat // 10, 1))
+        hit = measure(lambda: cache.get(key).body, args.repeat * 100)
+        print(f"{name:>13} {miss * 1e6:>10.1f} {hit * 1e6:>9.2f} {miss / hit:>9.0f}x")
+
+    # Новый сеанс в зале 3 на 2030-01-05: сбрасываются только страницы, куда он попадает
+    hall = storage.halls[3]
+    storage.add_session(Session(
+        id=args.sessions + 1, movie_title="Новый фильм", cinema_id=hall.cinema_id, hall_id=hall.id,
+        start_time="23:00", session_date="2030-01-05",
+        layout=hall.layout, availability=hall.layout.new_availability()
+    ))
+    stats = cache.stats()
+    print(f"новый сеанс: сброшено страниц {stats['invalidations']} из {len(queries)}, "
+          f"осталось в кэше {stats['entries']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Бенчмарк накладных расходов middleware на запрос: RequestMetricsMiddleware и JsonCharset.
+
+Запуск из каталога session-service:
+    python -m benchmarks.middleware_overhead [--requests 200000] [--repeat 5]
+
+Голое ASGI-приложение отвечает JSON (http.response.start и
+http.response.body) и, как роутер, кладет маршрут в scope["route"].
+Запросы вызываются напрямую в цикле событий, без сервера и сети, поэтому
+видна только цена самих middleware:
+  bare    - приложение без middleware;
+  charset - JsonCharset (app.main);
+  metrics - RequestMetricsMiddleware (app.request_metrics);
+  both    - оба, как в session-service: метрики снаружи.
+Для каждого варианта берется лучший из --repeat прогонов; накладные
+расходы - разница с bare, цель - меньше 20 мкс на запрос.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from app.request_metrics import RequestMetrics, RequestMetricsMiddleware
+
+TARGET_US = 20.0
+
+ROUTE = SimpleNamespace(path="/api/session/sessions/{session_id}")
+BODY = b'{"id":1,"movie_title":"Bench","cinema_id":1,"hall_id":1}'
+
+
+async def bare_app(scope, receive, send):
+    scope["route"] = ROUTE
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-length", str(len(BODY)).encode()),
+        (b"content-type", b"application/json"),
+    ]})
+    await send({"type": "http.response.body", "body": BODY})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def measure(app, requests: int) -> float:
+    """Среднее время запроса (секунды)"""
+    started = time.perf_counter()
+    for _ in range(requests):
+        scope = {"type": "http", "method": "GET", "path": "/api/session/sessions/1", "headers": []}
+        await app(scope, receive, send)
+    return (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # JsonCharset живет в app.main; данные сервиса - во временном каталоге
+    os.environ["SESSION_DATA_DIR"] = tempfile.mkdtemp(prefix="middleware-overhead-")
+    from app.main import JsonCharset, set_level
+    set_level("WARNING")
+
+    variants = {
+        "bare": bare_app,
+        "charset": JsonCharset(bare_app),
+        "metrics": RequestMetricsMiddleware(bare_app, metrics=RequestMetrics()),
+        "both": RequestMetricsMiddleware(JsonCharset(bare_app), metrics=RequestMetrics()),
+    }
+
+    async def run():
+        results = {name: float("inf") for name in variants}
+        # Варианты чередуются, чтобы дрейф частоты процессора не доставался одному
+        for _ in range(args.repeat):
+            for name, app in variants.items():
+                results[name] = min(results[name], await measure(app, args.requests))
+        return results
+
+    results = asyncio.run(run())
+    bare = results["bare"]
+    print(f"запросов: {args.requests}, прогонов: {args.repeat}")
+    print(f"{'вариант':>8} {'мкс/запрос':>11} {'накладные, мкс':>15}")
+    for name, elapsed in results.items():
+        print(f"{name:>8} {elapsed * 1e6:>11.2f} {(elapsed - bare) * 1e6:>15.2f}")
+    overhead = (results["both"] - bare) * 1e6
+    print(f"оба middleware: {overhead:.2f} мкс на запрос, цель < {TARGET_US:.0f} мкс - "
+          f"{'выполнена' if overhead < TARGET_US else 'не выполнена'}")
+
+
+if __name__ == "__main__":
+    main()
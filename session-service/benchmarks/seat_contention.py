@@ -0,0 +1,347 @@
+"""Стресс-тест брони мест: тысячи параллельных попыток занять одни и те же места.
+
+Запуск из каталога session-service:
+    python -m benchmarks.seat_contention [--threads 64] [--attempts 20000] [--rounds 20]
+    python -m benchmarks.seat_contention --url http://localhost:8000 --session-id 1
+
+Без --url сценарии вызывают обработчики app.main в этом процессе:
+update_seat (change_seat) и update_seats (update_seats_batch) - с их
+блокировкой сеанса, compare-and-set и журналом. Данные сервиса (журнал)
+пишутся во временный каталог (SESSION_DATA_DIR), на каждый раунд создается
+новый сеанс. С --url те же сценарии идут HTTP-запросами к запущенному
+session-service; занятые тестом места в конце освобождаются.
+
+Сценарии:
+  одно место  - все потоки занимают одно место: в каждой волне ровно один
+                победитель;
+  пакеты      - потоки занимают пересекающиеся пакеты мест (все или ничего):
+                ни одно место не досталось двоим, занято ровно столько мест,
+                сколько в выигравших пакетах;
+  разные места - каждый поток занимает свое место: ни одно изменение не
+                потеряно, у каждого места своя версия.
+Первые два сценария идут волнами по --threads попыток: после каждой волны
+результат проверяется и места освобождаются.
+
+--no-lock подменяет session_lock в app.main на пустой (только без --url)
+и показывает, что без блокировки места продаются дважды.
+
+Бронь билета через Ticket Service (reserve_ticket_api) проверяет
+ticket-service/benchmarks/reserve_contention.py.
+"""
+import argparse
+import os
+import random
+import shutil
+import string
+import sys
+import tempfile
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, List, Tuple
+
+import requests
+from fastapi import HTTPException
+
+from app.models import SeatLayout, Session
+from app.schemas import SeatChangeSchema, UpdateSeatSchema, UpdateSeatsSchema
+
+SeatKey = Tuple[str, int]
+
+
+def make_session(session_id: int, rows: int, seats_per_row: int) -> Session:
+    layout = SeatLayout.intern(
+        (string.ascii_uppercase[row], number)
+        for row in range(rows) for number in range(1, seats_per_row + 1)
+    )
+    return Session(id=session_id, movie_title="Bench", cinema_id=1, hall_id=1, start_time="10:00",
+                   session_date="2030-01-01", layout=layout, availability=layout.new_availability())
+
+
+class AppSeats:
+    """Места сеанса в этом процессе: запросы идут в обработчики app.main.
+
+    Одиночное место - update_seat (change_seat), пакет - update_seats
+    (update_seats_batch); 409 обработчика - проигранная попытка.
+    """
+
+    def __init__(self, main, session_id: int):
+        self.main = main
+        self.session = make_session(session_id, 20, 50)
+        main.add_session(self.session)
+
+    def seats(self) -> List[SeatKey]:
+        return list(self.session.layout.seats)
+
+    def _attempt(self, change: Callable) -> bool:
+        try:
+            change()
+            return True
+        except HTTPException as e:
+            if e.status_code == 409:
+                return False
+            raise
+
+    def reserve(self, seat: SeatKey) -> bool:
+        return self._attempt(lambda: self.main.update_seat(
+            self.session.id, seat[0], seat[1], UpdateSeatSchema(is_available=False, expected_available=True)
+        ))
+
+    def reserve_batch(self, seats: List[SeatKey]) -> bool:
+        return self._attempt(lambda: self.main.update_seats(self.session.id, UpdateSeatsSchema(seats=[
+            SeatChangeSchema(row=row, number=number, is_available=False, expected_available=True)
+            for row, number in seats
+        ])))
+
+    def taken(self) -> List[SeatKey]:
+        states = self.session.seat_states()
+        return [seat for position, seat in enumerate(self.session.layout.seats) if not states[position]]
+
+    def versions(self, seats: List[SeatKey]) -> List[int]:
+        return [self.session.seat_versions[self.session.layout.position(*seat)] for seat in seats]
+
+    def release(self, seats: List[SeatKey]):
+        if seats:
+            self.main.update_seats(self.session.id, UpdateSeatsSchema(seats=[
+                SeatChangeSchema(row=row, number=number, is_available=True) for row, number in seats
+            ]))
+
+
+def load_app(no_lock: bool):
+    """Импортировать app.main с данными во временном каталоге"""
+    os.environ["SESSION_DATA_DIR"] = tempfile.mkdtemp(prefix="seat-contention-")
+    from app import main
+    # Каждая попытка пишет в лог сервиса, а проигравшие - предупреждение о 409
+    main.set_level("ERROR")
+    if no_lock:
+        main.session_lock = lambda session_id: nullcontext()
+    return main
+
+
+class RemoteSeats:
+    """Места сеанса в запущенном session-service"""
+
+    def __init__(self, url: str, session_id: int):
+        self.url = f"{url.rstrip('/')}/sessions/{session_id}/seats"
+        self.http = threading.local()
+
+    def _client(self) -> requests.Session:
+        client = getattr(self.http, "client", None)
+        if client is None:
+            client = self.http.client = requests.Session()
+        return client
+
+    def _states(self) -> List[dict]:
+        response = self._client().get(self.url, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def seats(self) -> List[SeatKey]:
+        return [(seat["row"], seat["number"]) for seat in self._states() if seat["is_available"]]
+
+    def reserve(self, seat: SeatKey) -> bool:
+        response = self._client().put(
+            f"{self.url}/{seat[0]}/{seat[1]}",
+            json={"is_available": False, "expected_available": True},
+            timeout=10
+        )
+        if response.status_code == 409:
+            return False
+        response.raise_for_status()
+        return True
+
+    def reserve_batch(self, seats: List[SeatKey]) -> bool:
+        response = self._client().put(self.url, json={"seats": [
+            {"row": row, "number": number, "is_available": False, "expected_available": True}
+            for row, number in seats
+        ]}, timeout=10)
+        if response.status_code == 409:
+            return False
+        response.raise_for_status()
+        return True
+
+    def taken(self) -> List[SeatKey]:
+        return [(seat["row"], seat["number"]) for seat in self._states() if not seat["is_available"]]
+
+    def versions(self, seats: List[SeatKey]) -> None:
+        # Версии мест наружу не отдаются
+        return None
+
+    def release(self, seats: List[SeatKey]):
+        for start in range(0, len(seats), 500):
+            self._client().put(self.url, json={"seats": [
+                {"row": row, "number": number, "is_available": True}
+                for row, number in seats[start:start + 500]
+            ]}, timeout=10).raise_for_status()
+
+
+def run_threads(threads: int, attempts: int, attempt: Callable[[int], bool]) -> Tuple[List[int], float]:
+    """attempts попыток в threads потоках; все потоки стартуют одновременно.
+
+    Возвращает номера успешных попыток и время.
+    """
+    winners = []
+    winners_lock = threading.Lock()
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(first: int):
+        barrier.wait()
+        mine = [i for i in range(first, attempts, threads) if attempt(i)]
+        with winners_lock:
+            winners.extend(mine)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return winners, time.perf_counter() - started
+
+
+def run_waves(threads: int, attempts: int, attempt: Callable[[int], bool],
+              after_wave: Callable[[List[int]], None]) -> Tuple[List[int], float]:
+    """attempts попыток волнами по threads: в каждой волне потоки делают по
+    попытке одновременно, затем after_wave(выигравшие попытки волны)
+    проверяет результат и освобождает места.
+
+    Одна общая волна гонку почти не показывает: места разбирают первые
+    попытки, остальные сразу получают 409. Поэтому места освобождаются после
+    каждой волны, и борьба за них повторяется attempts / threads раз.
+    """
+    waves = max(attempts // threads, 1)
+    winners: List[int] = []
+    wave_winners: List[int] = []
+    winners_lock = threading.Lock()
+
+    def finish_wave():
+        after_wave(sorted(wave_winners))
+        winners.extend(wave_winners)
+        wave_winners.clear()
+
+    start = threading.Barrier(threads + 1)
+    wave_done = threading.Barrier(threads, action=finish_wave)
+
+    def worker(index: int):
+        start.wait()
+        for wave in range(waves):
+            i = wave * threads + index
+            if attempt(i):
+                with winners_lock:
+                    wave_winners.append(i)
+            wave_done.wait()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return winners, time.perf_counter() - started
+
+
+def one_seat(seats, free: List[SeatKey], args) -> List[str]:
+    seat = free[0]
+    errors = []
+
+    def after_wave(wave_winners: List[int]):
+        taken = [key for key in seats.taken() if key == seat]
+        if len(wave_winners) != 1 or taken != [seat]:
+            errors.append(f"одно место: {len(wave_winners)} победителей в волне")
+        seats.release(taken)
+
+    winners, elapsed = run_waves(args.threads, args.attempts, lambda i: seats.reserve(seat), after_wave)
+    print(f"одно место:   {args.attempts} попыток, волн: {max(args.attempts // args.threads, 1)}, "
+          f"побед: {len(winners)}, {elapsed:.2f} с")
+    return errors[:5]
+
+
+def batches(seats, free: List[SeatKey], args) -> List[str]:
+    # Пакеты соседних мест, сдвинутые на случайный шаг: соседние пакеты пересекаются
+    pool = free[:args.batch * 8]
+    pool_seats = set(pool)
+    rng = random.Random(args.seed)
+    starts = [rng.randrange(len(pool) - args.batch + 1) for _ in range(args.attempts)]
+    requested = [pool[start:start + args.batch] for start in starts]
+    errors = []
+    taken_total = 0
+
+    def after_wave(wave_winners: List[int]):
+        nonlocal taken_total
+        owners = {}
+        for i in wave_winners:
+            for seat in requested[i]:
+                if seat in owners:
+                    errors.append(f"пакеты: место {seat[0]}{seat[1]} продано пакетам {owners[seat]} и {i}")
+                owners[seat] = i
+        taken = [seat for seat in seats.taken() if seat in pool_seats]
+        if len(taken) != sum(len(requested[i]) for i in wave_winners):
+            errors.append(f"пакеты: занято {len(taken)} мест, в выигравших пакетах "
+                          f"{sum(len(requested[i]) for i in wave_winners)}")
+        taken_total += len(taken)
+        seats.release(taken)
+
+    winners, elapsed = run_waves(args.threads, args.attempts, lambda i: seats.reserve_batch(requested[i]), after_wave)
+    print(f"пакеты по {args.batch}: {args.attempts} попыток, побед: {len(winners)}, "
+          f"занято мест: {taken_total}, {elapsed:.2f} с")
+    return errors[:5]
+
+
+def distinct_seats(seats, free: List[SeatKey], args) -> List[str]:
+    targets = free[:min(args.attempts, len(free))]
+    winners, elapsed = run_threads(args.threads, len(targets), lambda i: seats.reserve(targets[i]))
+    errors = []
+    taken = set(seats.taken()) & set(targets)
+    if len(winners) != len(targets) or len(taken) != len(targets):
+        errors.append(f"разные места: успешно {len(winners)}, занято {len(taken)} из {len(targets)}")
+    versions = seats.versions(targets)
+    if versions is not None and len(set(versions)) != len(targets):
+        errors.append(f"разные места: версий {len(set(versions))} на {len(targets)} изменений")
+    seats.release(list(taken))
+    print(f"разные места: {len(targets)} мест, занято: {len(taken)}, {elapsed:.2f} с")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--attempts", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=4, help="мест в пакете")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="адрес запущенного session-service")
+    parser.add_argument("--session-id", type=int, default=1)
+    parser.add_argument("--no-lock", action="store_true", help="без блокировки сеанса (только без --url)")
+    args = parser.parse_args()
+
+    main_module = None if args.url else load_app(args.no_lock)
+    # Переключать потоки как можно чаще, чтобы гонки проявлялись
+    sys.setswitchinterval(1e-6)
+    errors = []
+    for round_number in range(args.rounds):
+        if args.url:
+            seats = RemoteSeats(args.url, args.session_id)
+        else:
+            seats = AppSeats(main_module, round_number + 1)
+        free = seats.seats()
+        if len(free) < args.batch * 8:
+            parser.error(f"в сеансе {len(free)} свободных мест, нужно хотя бы {args.batch * 8}")
+        print(f"раунд {round_number + 1}, потоков: {args.threads}")
+        for scenario in (one_seat, batches, distinct_seats):
+            errors.extend(scenario(seats, free, args))
+        args.seed += 1
+    if main_module is not None:
+        shutil.rmtree(main_module.DATA_DIR, ignore_errors=True)
+
+    if errors:
+        print("ОШИБКИ:")
+        for error in errors:
+            print(" ", error)
+        sys.exit(1)
+    print("двойных продаж и потерянных изменений нет")
+
+
+if __name__ == "__main__":
+    main()
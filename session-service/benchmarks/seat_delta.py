@@ -0,0 +1,86 @@
+"""Бенчмарк опроса карты мест: полный ответ, дельта ?since и 304 по ETag.
+
+Запуск из каталога session-service:
+    python -m benchmarks.seat_delta [--seats 500] [--polls 200]
+
+Клиент опрашивает карту мест сеанса, между опросами меняется k мест
+(k = 0 - зал не продается). Для каждого k сравнивается, сколько байт и
+времени сервера уходит на ответ:
+  full  - прежний ответ: вся карта мест;
+  delta - ?since=<версия прошлого ответа>: только изменившиеся места, а при
+          k = 0 - 304 без тела (If-None-Match с ETag прошлого ответа).
+Первый опрос delta - тоже полная карта (версии у клиента еще нет). Клиент
+собирает карту из дельт, и после каждого опроса она сверяется с полной.
+Тела кодируются encode_json, как ответы каталога.
+"""
+import argparse
+import random
+import string
+import time
+
+from app.models import SeatLayout, Session
+from app.response_cache import encode_json
+
+
+def make_session(seat_count: int) -> Session:
+    seats_per_row = 20
+    rows = (seat_count + seats_per_row - 1) // seats_per_row
+    layout = SeatLayout.intern(
+        (string.ascii_uppercase[i // seats_per_row], i % seats_per_row + 1) for i in range(rows * seats_per_row)
+    )
+    return Session(id=1, movie_title="Bench", cinema_id=1, hall_id=1, start_time="10:00",
+                   session_date="2030-01-01", layout=layout, availability=layout.new_availability())
+
+
+def seat_map_body(session: Session, since, etag_seen):
+    """Тело ответа как у seat_map_response; None - 304"""
+    if etag_seen == f'"{session.version}"':
+        return None
+    seats = session.seats if since is None else session.changed_seats(since)
+    return encode_json(seats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seats", type=int, default=500)
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"мест в зале: {args.seats}, опросов: {args.polls}")
+    print(f"{'k':>4} {'full, байт':>11} {'delta, байт':>12} {'full, мкс':>10} {'delta, мкс':>11} {'меньше в':>9}")
+    rng = random.Random(args.seed)
+    for changes in (0, 1, 5, 20, 100):
+        session = make_session(args.seats)
+        seats = session.layout.seats
+        client = {}
+        version = etag = None
+        full_bytes = delta_bytes = 0
+        full_time = delta_time = 0.0
+        for _ in range(args.polls):
+            for row, number in rng.sample(seats, changes):
+                current = session.get_seat(row, number)
+                session.set_seat_available(row, number, not current.is_available)
+
+            started = time.perf_counter()
+            full = seat_map_body(session, None, None)
+            full_time += time.perf_counter() - started
+            full_bytes += len(full)
+
+            started = time.perf_counter()
+            delta = seat_map_body(session, version, etag)
+            delta_time += time.perf_counter() - started
+            if delta is not None:
+                delta_bytes += len(delta)
+                for seat in session.changed_seats(version) if version is not None else session.seats:
+                    client[(seat.row, seat.number)] = seat.is_available
+            version, etag = session.version, f'"{session.version}"'
+            assert client == {(seat.row, seat.number): seat.is_available for seat in session.seats}
+
+        print(f"{changes:>4} {full_bytes // args.polls:>11} {delta_bytes // args.polls:>12} "
+              f"{full_time / args.polls * 1e6:>10.1f} {delta_time / args.polls * 1e6:>11.1f} "
+              f"{full_bytes / max(delta_bytes, 1):>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Бенчмарк поиска блока соседних мест: зал на 5000 мест, занято 90%.
+
+Запуск из каталога session-service:
+    python -m benchmarks.seat_finder [--seats-per-row 100] [--occupancy 0.9]
+
+Сравнивает find_best_block с простым перебором мест во вложенных циклах и
+проверяет, что оба находят блок с одинаковой оценкой.
+"""
+import argparse
+import random
+import string
+import time
+
+from app.models import Session, SeatLayout
+from app.seat_finder import find_best_block
+
+
+def make_session(rows: int, seats_per_row: int, occupancy: float, seed: int) -> Session:
+    row_names = [
+        string.ascii_uppercase[i] if i < 26 else string.ascii_uppercase[i // 26 - 1] + string.ascii_uppercase[i % 26]
+        for i in range(rows)
+    ]
+    layout = SeatLayout.intern((row, number) for row in row_names for number in range(1, seats_per_row + 1))
+    rng = random.Random(seed)
+    availability = bytearray(rng.random() >= occupancy for _ in range(len(layout)))
+    return Session(id=1, movie_title="Bench", cinema_id=1, hall_id=1, start_time="10:00",
+                   session_date="2030-01-01", layout=layout, availability=availability)
+
+
+def naive_best_block(session: Session, count: int, row_weight: float = 1.0):
+    """Перебор: каждый ряд, каждое начало, каждое место блока"""
+    rows = session.layout.rows()
+    target = len(rows) // 2
+    states = session.seat_states()
+    best, best_score = None, float("inf")
+    for index, span in enumerate(rows):
+        positions = list(range(len(states))[span.positions]) if isinstance(span.positions, slice) else span.positions
+        width = len(positions)
+        ideal = (width - count) / 2
+        for start in range(width - count + 1):
+            if all(positions[start + i] >= 0 and states[positions[start + i]] for i in range(count)):
+                score = abs(index - target) * row_weight + abs(start - ideal)
+                if score < best_score:
+                    best, best_score = (span.row, span.first + start), score
+    return best, best_score
+
+
+def score_of(session: Session, seats, row_weight: float = 1.0) -> float:
+    rows = session.layout.rows()
+    index = next(i for i, span in enumerate(rows) if span.row == seats[0].row)
+    span = rows[index]
+    width = span.positions.stop - span.positions.start
+    return abs(index - len(rows) // 2) * row_weight + abs(seats[0].number - span.first - (width - len(seats)) / 2)
+
+
+def measure(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seats-per-row", type=int, default=100)
+    parser.add_argument("--seats", type=int, default=5000)
+    parser.add_argument("--occupancy", type=float, default=0.9)
+    parser.add_argument("--halls", type=int, default=20, help="сколько случайных залов проверить")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rows = args.seats // args.seats_per_row
+    print(f"{rows} рядов x {args.seats_per_row} мест, занято {args.occupancy:.0%}, залов: {args.halls}")
+    print(f"{'N':>3} {'найдено':>8} {'bitmap, мкс':>12} {'перебор, мкс':>13} {'ускорение':>10}")
+    for count in (1, 2, 3, 4, 6, 8):
+        fast_total = naive_total = 0.0
+        found = 0
+        for seed in range(args.halls):
+            session = make_session(rows, args.seats_per_row, args.occupancy, seed)
+            seats = find_best_block(session, count)
+            expected, expected_score = naive_best_block(session, count)
+            if seats is None:
+                assert expected is None, (count, seed)
+            else:
+                found += 1
+                assert abs(score_of(session, seats) - expected_score) < 1e-9, (count, seed, seats, expected)
+            fast_total += measure(lambda: find_best_block(session, count), args.repeat)
+            naive_total += measure(lambda: naive_best_block(session, count), max(args.repeat // 10, 1))
+        fast = fast_total / args.halls * 1e6
+        naive = naive_total / args.halls * 1e6
+        print(f"{count:>3} {found:>5}/{args.halls:<2} {fast:>12.1f} {naive:>13.1f} {naive / fast:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
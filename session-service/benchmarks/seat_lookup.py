@@ -0,0 +1,82 @@
+"""Бенчмарк изменения места: залы от 30 до 5000 мест.
+
+Запуск из каталога session-service:
+    python -m benchmarks.seat_lookup [--sizes 30,500,1000,5000] [--repeat 2000]
+
+Сравнивает Session.set_seat_available (позиция места по индексу раскладки)
+с прежним путем обработчиков update_seat_api / update_seat - перебором
+списка Seat до нужного ряда и номера. Время изменения по индексу не
+должно зависеть от размера зала.
+"""
+import argparse
+import random
+import string
+import time
+from typing import List
+
+from app.models import Seat, SeatLayout, Session
+
+
+def row_names(count: int) -> List[str]:
+    return [
+        string.ascii_uppercase[i] if i < 26 else string.ascii_uppercase[i // 26 - 1] + string.ascii_uppercase[i % 26]
+        for i in range(count)
+    ]
+
+
+def make_hall(seat_count: int) -> List[tuple]:
+    seats_per_row = 10 if seat_count <= 100 else 50
+    rows = row_names((seat_count + seats_per_row - 1) // seats_per_row)
+    return [(rows[i // seats_per_row], i % seats_per_row + 1) for i in range(seat_count)]
+
+
+def scan_update(seats: List[Seat], row: str, number: int, is_available: bool):
+    """Прежний обработчик: перебор мест сеанса"""
+    for seat in seats:
+        if seat.row == row and seat.number == number:
+            seat.is_available = is_available
+            return seat
+    return None
+
+
+def measure(function, targets, repeat: int) -> float:
+    started = time.perf_counter()
+    for i in range(repeat):
+        row, number = targets[i % len(targets)]
+        function(row, number, i & 1 == 0)
+    return (time.perf_counter() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="30,100,500,1000,2000,5000")
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'мест':>6} {'индекс, мкс':>12} {'перебор, мкс':>13} {'перебор до последнего, мкс':>27} {'ускорение':>10}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        hall = make_hall(size)
+        layout = SeatLayout.intern(hall)
+        session = Session(id=1, movie_title="Bench", cinema_id=1, hall_id=1, start_time="10:00",
+                          session_date="2030-01-01", layout=layout, availability=layout.new_availability())
+        seats = [Seat(row=row, number=number) for row, number in hall]
+        rng = random.Random(args.seed)
+        targets = [hall[rng.randrange(size)] for _ in range(256)]
+
+        # Оба пути меняют одно и то же место
+        for row, number in targets[:16]:
+            assert session.set_seat_available(row, number, False) == scan_update(seats, row, number, False)
+            assert session.get_seat(row, number) == next(s for s in seats if (s.row, s.number) == (row, number))
+
+        indexed = measure(session.set_seat_available, targets, args.repeat)
+        scanned = measure(lambda row, number, value: scan_update(seats, row, number, value),
+                          targets, max(args.repeat // 10, 1))
+        last = measure(lambda row, number, value: scan_update(seats, row, number, value),
+                       [hall[-1]], max(args.repeat // 10, 1))
+        print(f"{size:>6} {indexed * 1e6:>12.2f} {scanned * 1e6:>13.1f} {last * 1e6:>27.1f} "
+              f"{scanned / indexed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
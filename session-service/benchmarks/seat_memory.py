@@ -0,0 +1,106 @@
+"""Бенчмарк памяти мест: 50 000 сеансов, прежний список Seat против общей раскладки.
+
+Запуск из каталога session-service:
+    python -m benchmarks.seat_memory [--sessions 50000] [--halls 10]
+
+Каждый вариант строится в отдельном процессе, и сравнивается прирост
+резидентной памяти (RSS) процесса:
+  seat-list - как было: у каждого сеанса свой список Seat (копия зала);
+  layout    - Session: одна SeatLayout на зал и bytearray с байтом на место.
+Залы - от 8x10 до 17x19 мест, как у залов по умолчанию и больших залов.
+"""
+import argparse
+import gc
+import json
+import resource
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import List
+
+from app.models import Seat, SeatLayout, Session
+
+
+@dataclass
+class SeatListSession:
+    """Сеанс в прежнем виде: места зала скопированы в список Seat"""
+    id: int
+    movie_title: str
+    cinema_id: int
+    hall_id: int
+    start_time: str
+    session_date: str
+    price: float = 250.0
+    seats: List[Seat] = field(default_factory=list)
+
+
+def hall_seats(hall_id: int) -> List[tuple]:
+    rows, seats_per_row = 8 + hall_id, 10 + hall_id
+    return [(chr(ord("A") + row), number) for row in range(rows) for number in range(1, seats_per_row + 1)]
+
+
+def rss_bytes() -> int:
+    """Текущий RSS процесса (Linux); иначе - пиковый"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def build(variant: str, sessions: int, halls: int) -> dict:
+    """Построить сеансы варианта и вернуть прирост RSS"""
+    layouts = {hall_id: hall_seats(hall_id) for hall_id in range(halls)}
+    gc.collect()
+    before = rss_bytes()
+    result = {}
+    seat_total = 0
+    for session_id in range(1, sessions + 1):
+        hall_id = session_id % halls
+        if variant == "seat-list":
+            session = SeatListSession(
+                id=session_id, movie_title=f"Movie {session_id % 50}", cinema_id=hall_id // 3, hall_id=hall_id,
+                start_time="10:00", session_date="2030-01-01",
+                seats=[Seat(row=row, number=number) for row, number in layouts[hall_id]]
+            )
+        else:
+            layout = SeatLayout.intern(layouts[hall_id])
+            session = Session(
+                id=session_id, movie_title=f"Movie {session_id % 50}", cinema_id=hall_id // 3, hall_id=hall_id,
+                start_time="10:00", session_date="2030-01-01",
+                layout=layout, availability=layout.new_availability()
+            )
+        result[session_id] = session
+        seat_total += len(layouts[hall_id])
+    gc.collect()
+    return {"rss": rss_bytes() - before, "seats": seat_total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--halls", type=int, default=10)
+    parser.add_argument("--variant", choices=("seat-list", "layout"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(build(args.variant, args.sessions, args.halls)))
+        return
+
+    print(f"сеансов: {args.sessions}, залов: {args.halls}")
+    print(f"{'вариант':>10} {'RSS, МБ':>9} {'байт на место':>14}")
+    results = {}
+    for variant in ("seat-list", "layout"):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.seat_memory", "--variant", variant,
+             "--sessions", str(args.sessions), "--halls", str(args.halls)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[variant] = json.loads(output.strip().splitlines()[-1])
+        rss, seats = results[variant]["rss"], results[variant]["seats"]
+        print(f"{variant:>10} {rss / 2 ** 20:>9.1f} {rss / seats:>14.1f}")
+    print(f"меньше в {results['seat-list']['rss'] / max(results['layout']['rss'], 1):.1f} раза")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Бенчмарк холодного старта: загрузка сеансов из sessions.json и sessions.bin.
+
+Запуск из каталога session-service:
+    python -m benchmarks.snapshot_load [--sessions 10000] [--repeat 2]
+
+Снапшоты пишутся во временный каталог. JSON читается так же, как
+load_sessions с SESSIONS_SNAPSHOT_FORMAT=json: json.load и сборка Session
+с раскладкой и состоянием мест из списка мест каждого сеанса. Бинарный
+снапшот читается read_snapshot через mmap; места распаковываются при
+первом обращении, поэтому отдельно измерено "загрузка + все места".
+Оба варианта проверяются на совпадение состояния мест.
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from app.models import SeatLayout, Session
+from app.snapshot import read_snapshot, write_snapshot
+
+
+def make_sessions(count: int, halls: int, seed: int):
+    rng = random.Random(seed)
+    layouts = [
+        SeatLayout.intern((chr(ord("A") + row), number)
+                          for row in range(8 + hall_id) for number in range(1, 11 + hall_id))
+        for hall_id in range(halls)
+    ]
+    result = []
+    for session_id in range(1, count + 1):
+        hall_id = session_id % halls
+        layout = layouts[hall_id]
+        availability = bytearray(rng.random() >= 0.3 for _ in range(len(layout)))
+        result.append(Session(
+            id=session_id, movie_title=f"Фильм {session_id % 200}", cinema_id=hall_id // 3 + 1,
+            hall_id=hall_id + 1, start_time=f"{10 + 2 * (session_id % 7)}:00",
+            session_date=f"2030-{session_id % 12 + 1:02d}-{session_id % 28 + 1:02d}",
+            price=250.0, layout=layout, availability=availability
+        ))
+    return result
+
+
+def session_to_dict(session: Session) -> dict:
+    """Запись сеанса в sessions.json (как session_to_dict в app.main)"""
+    states = session.seat_states()
+    return {
+        "id": session.id,
+        "movie_title": session.movie_title,
+        "cinema_id": session.cinema_id,
+        "hall_id": session.hall_id,
+        "start_time": session.start_time,
+        "session_date": session.session_date,
+        "price": session.price,
+        "seats": [
+            {"row": row, "number": number, "is_available": bool(states[position])}
+            for position, (row, number) in enumerate(session.layout.seats)
+        ]
+    }
+
+
+def read_json_snapshot(path: str):
+    """JSON-путь load_sessions: json.load и сборка сеансов"""
+    with open(path, "r", encoding="utf-8") as f:
+        sessions_data = json.load(f)
+    result = []
+    for session_data in sessions_data.values():
+        seats_data = session_data["seats"]
+        layout = SeatLayout.intern((seat["row"], seat["number"]) for seat in seats_data)
+        result.append(Session(
+            id=session_data["id"], movie_title=session_data["movie_title"],
+            cinema_id=session_data.get("cinema_id", 1), hall_id=session_data["hall_id"],
+            start_time=session_data["start_time"], session_date=session_data["session_date"],
+            price=session_data["price"], layout=layout,
+            availability=bytearray(bool(seat["is_available"]) for seat in seats_data)
+        ))
+    return result
+
+
+def best_of(function, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--halls", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    sessions = make_sessions(args.sessions, args.halls, args.seed)
+    with tempfile.TemporaryDirectory() as directory:
+        json_file = os.path.join(directory, "sessions.json")
+        bin_file = os.path.join(directory, "sessions.bin")
+        with open(json_file, "w", encoding="utf-8") as f:
+            json.dump({session.id: session_to_dict(session) for session in sessions}, f, ensure_ascii=False)
+        write_snapshot(bin_file, sessions)
+
+        json_time, from_json = best_of(lambda: read_json_snapshot(json_file), args.repeat)
+        bin_time, _ = best_of(lambda: list(read_snapshot(bin_file)), args.repeat)
+
+        def load_and_touch():
+            loaded = list(read_snapshot(bin_file))
+            for session in loaded:
+                session.seat_states()
+            return loaded
+        touch_time, from_bin = best_of(load_and_touch, args.repeat)
+
+        expected = {session.id: bytes(session.seat_states()) for session in sessions}
+        assert {session.id: bytes(session.seat_states()) for session in from_json} == expected
+        assert {session.id: bytes(session.seat_states()) for session in from_bin} == expected
+
+        print(f"сеансов: {args.sessions}, мест: {sum(len(session.layout) for session in sessions)}")
+        print(f"{'снапшот':>24} {'размер, МБ':>11} {'загрузка, мс':>13}")
+        print(f"{'sessions.json':>24} {os.path.getsize(json_file) / 2 ** 20:>11.1f} {json_time * 1000:>13.1f}")
+        print(f"{'sessions.bin':>24} {os.path.getsize(bin_file) / 2 ** 20:>11.1f} {bin_time * 1000:>13.1f}")
+        print(f"{'sessions.bin + все места':>24} {'':>11} {touch_time * 1000:>13.1f}")
+        print(f"старт быстрее в {json_time / bin_time:.1f} раза")
+
+
+if __name__ == "__main__":
+    main()
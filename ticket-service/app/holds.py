@@ -0,0 +1,78 @@
+import heapq
+import threading
+import time
+from typing import Callable, List, Tuple
+
+from app.logger import logger
+
+
+class HoldExpiry:
+    """Сроки брони билетов: куча (срок, id билета) и фоновый поток.
+
+    Поток просыпается раз в interval и снимает с вершины кучи только
+    истекшие брони, поэтому стоимость не зависит от числа билетов:
+    O(log n) на добавление и на каждую истекшую бронь. Подтвержденные и
+    отмененные билеты из кучи не удаляются - expire проверяет, что билет
+    все еще в брони и его срок (билета, а не записи в куче) прошел, и
+    пропускает остальные.
+
+    expire получает пачки до batch_size билетов и возвращает id билетов,
+    которые не удалось освободить (например, Session Service недоступен):
+    они встают в очередь снова через retry_delay.
+    """
+
+    def __init__(self, expire: Callable[[List[int]], List[int]],
+                 interval: float, batch_size: int, retry_delay: float):
+        self._expire = expire
+        self.interval = interval
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+        self._heap: List[Tuple[float, int]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def add(self, ticket_id: int, deadline: float):
+        with self._lock:
+            heapq.heappush(self._heap, (deadline, ticket_id))
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._heap)
+
+    def due(self, now: float) -> List[int]:
+        """Снять с кучи до batch_size истекших броней"""
+        batch = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now and len(batch) < self.batch_size:
+                batch.append(heapq.heappop(heap)[1])
+        return batch
+
+    def run_once(self, now: float = None):
+        """Обработать все брони, истекшие к now"""
+        now = time.time() if now is None else now
+        while True:
+            batch = self.due(now)
+            if not batch:
+                return
+            for ticket_id in self._expire(batch):
+                self.add(ticket_id, now + self.retry_delay)
+
+    def start(self):
+        def run():
+            while not self._stop.wait(self.interval):
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error("Error expiring ticket holds: %s", e)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="hold-expiry", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,49 +1,614 @@
+import atexit
+import hashlib
+import heapq
 import os
 import json
+import queue
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 
 LOG_DIR = Path("/app/logs")
 LOG_DIR.mkdir(exist_ok=True)
+# Общий файл, в который раньше писали все сервисы; теперь только читается
 LOG_FILE = LOG_DIR / "user_actions.log"
+# Сегменты журнала: у каждого процесса свои файлы, по одному на окно времени
+SEGMENTS_DIR = LOG_DIR / "user_actions"
+SEGMENT_SECONDS = int(os.getenv("USER_ACTIONS_SEGMENT_SECONDS", "3600"))
+PROCESS_ID = f"{socket.gethostname()}.{os.getpid()}"
+
+# Размер очереди записей; при переполнении записи отбрасываются
+LOG_QUEUE_SIZE = int(os.getenv("USER_ACTIONS_QUEUE_SIZE", "10000"))
+# Запись в файл пачками: по количеству записей или по времени (секунды)
+LOG_FLUSH_BATCH = int(os.getenv("USER_ACTIONS_FLUSH_BATCH", "500"))
+LOG_FLUSH_INTERVAL = float(os.getenv("USER_ACTIONS_FLUSH_INTERVAL", "0.5"))
+
+
+# Файл-индекс рядом с сегментом: по строке на запись сегмента
+INDEX_SUFFIX = ".idx"
+# Сколько индексов сегментов держать в памяти; давно не запрашивавшиеся
+# вытесняются и при следующем запросе строятся заново из .idx. Запросы по
+# ключу к закрытым сегментам идут в файлы .keys и этот кэш не используют
+INDEX_CACHE_SIZE = int(os.getenv("USER_ACTIONS_INDEX_CACHE_SIZE", "48"))
+
+# Списки записей по ключу для закрытого сегмента (little-endian):
+#     заголовок - магия, версия, размер .idx, по которому построен файл,
+#                 число ключей
+#     каталог   - по записи на ключ, отсортирован по хэшу ключа:
+#                 хэш u64, смещение и длина списка
+#     списки    - JSON [поле, значение, [[timestamp, смещение, длина], ...]]
+POSTINGS_SUFFIX = ".keys"
+POSTINGS_MAGIC = b"UAPK"
+POSTINGS_VERSION = 1
+POSTINGS_HEADER = struct.Struct("<4sHQI")
+POSTINGS_ENTRY = struct.Struct("<QQI")
+
+
+def index_record(offset: int, length: int, entry: dict) -> dict:
+    """Строка индекса для записи: где она лежит в сегменте и ее ключи"""
+    details = entry.get("details") or {}
+    ticket_ids = details.get("ticket_ids")
+    if ticket_ids is None:
+        ticket_ids = [] if details.get("ticket_id") is None else [details["ticket_id"]]
+    return {
+        "o": offset,
+        "n": length,
+        "t": entry.get("timestamp"),
+        "a": entry.get("action"),
+        "u": entry.get("user_id"),
+        "s": details.get("session_id"),
+        "k": ticket_ids
+    }
+
+
+class ActionLogWriter:
+    """Фоновая запись действий пользователей пачками.
+
+    Обработчики запросов только кладут запись в очередь и не ждут диска.
+    Если писатель не успевает и очередь заполнена, запись отбрасывается и
+    учитывается в счетчике dropped.
+
+    Записи попадают в сегменты этого процесса: файл
+    {начало окна}-{конец окна}-{процесс}.log в SEGMENTS_DIR, где окно -
+    интервал в segment_seconds секунд по времени записи. Разные процессы
+    никогда не пишут в один файл. Когда окно сегмента закончилось, рядом
+    с ним пишется файл .keys со списками записей по ключу.
+    """
+
+    def __init__(self, directory: Path, segment_seconds: int, queue_size: int,
+                 batch_size: int, flush_interval: float):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        # Сегменты, в которые писал поток и для которых еще нет .keys: {путь: конец окна}
+        self._open_segments = {}
+
+    def submit(self, created: float, entry: dict):
+        """Поставить запись (время создания, запись) в очередь без ожидания"""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait((created, entry))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="user-actions-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+            if batch:
+                self._write(batch)
+            # Окно сегмента закончилось и его записи дописаны - строим .keys;
+            # при остановке закрываются все сегменты
+            self._seal_segments(float("inf") if stopping else time.time() - self.flush_interval)
+
+    def segment_path(self, created: float) -> Path:
+        """Файл сегмента этого процесса для записи, созданной в момент created"""
+        start = int(created // self.segment_seconds) * self.segment_seconds
+        return self.directory / f"{start}-{start + self.segment_seconds}-{PROCESS_ID}.log"
+
+    def _write(self, batch: list):
+        dropped = self.dropped - self._reported_dropped
+        if dropped:
+            self._reported_dropped += dropped
+            print(f"Очередь логов переполнена, отброшено записей: {dropped}")
+        
+        # Внутри сегмента записи идут по времени - на этом строится слияние при чтении
+        segments = {}
+        for created, entry in sorted(batch, key=lambda item: item[0]):
+            path = self.segment_path(created)
+            segments.setdefault(path, []).append(entry)
+            self._open_segments[path] = (created // self.segment_seconds + 1) * self.segment_seconds
+        try:
+            # Убеждаемся, что директория существует
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Файл открывается на каждую пачку: логи могут очистить
+            for path, entries in segments.items():
+                with open(path, "ab") as f:
+                    offset = f.tell()
+                    lines = []
+                    index_lines = []
+                    for entry in entries:
+                        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+                        index_lines.append(json.dumps(index_record(offset, len(line), entry), ensure_ascii=False) + "\n")
+                        lines.append(line)
+                        offset += len(line)
+                    f.writelines(lines)
+                # Индекс дописывается после данных и никогда не ссылается на незаписанное
+                with open(path.with_suffix(INDEX_SUFFIX), "a", encoding="utf-8") as f:
+                    f.writelines(index_lines)
+        except Exception as e:
+            print(f"Ошибка при логировании: {e}")
+
+    def _seal_segments(self, before: float):
+        """Записать .keys для сегментов, окно которых закончилось до before"""
+        for path, end in list(self._open_segments.items()):
+            if end > before:
+                continue
+            del self._open_segments[path]
+            try:
+                write_postings(path)
+            except OSError as e:
+                print(f"Ошибка при записи индекса {path.name}: {e}")
+
+    def close(self):
+        """Дописать все накопленные записи и остановить поток"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+
+action_log_writer = ActionLogWriter(SEGMENTS_DIR, SEGMENT_SECONDS, LOG_QUEUE_SIZE, LOG_FLUSH_BATCH, LOG_FLUSH_INTERVAL)
+# Дописываем очередь при остановке сервиса
+atexit.register(action_log_writer.close)
 
 
 def log_action(action: str, user_id: str, details: dict = None, ip: str = None):
-    """Логирует действия пользователей в файл"""
+    """Логирует действия пользователей в файл (через фоновый писатель)"""
+    created = time.time()
     log_entry = {
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.fromtimestamp(created).isoformat(),
         "action": action,
         "user_id": user_id,
         "ip": ip,
         "details": details or {}
     }
+    action_log_writer.submit(created, log_entry)
+
+
+def _reverse_lines(path, block_size: int = 64 * 1024):
+    """Строки файла с конца: читаем блоками от конца файла к началу"""
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        tail = b""
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + tail).split(b"\n")
+            # Первая строка блока может начинаться в предыдущем блоке
+            tail = lines.pop(0)
+            yield from reversed(lines)
+        yield tail
+
+
+def tail_lines(paths, limit: int) -> list:
+    """Последние limit непустых строк из файлов (в том числе ротированных).
+
+    Файлы читаются от самого нового по mtime к старым, каждый - с конца,
+    поэтому память и время зависят от limit, а не от размера логов.
+    """
+    lines = []
+    if limit <= 0:
+        return lines
     
-    try:
-        # Убеждаемся, что директория существует
-        LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
-        # Открываем файл в режиме добавления
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
-    except Exception as e:
-        print(f"Ошибка при логировании: {e}")
+    for path in sorted(paths, key=os.path.getmtime, reverse=True):
+        for line in _reverse_lines(path):
+            if not line.strip():
+                continue
+            lines.append(line.decode("utf-8", errors="replace"))
+            if len(lines) >= limit:
+                return lines[::-1]
+    return lines[::-1]
 
 
-def get_logs(limit: int = 100) -> list:
-    """Возвращает последние логи"""
-    try:
-        if not LOG_FILE.exists():
-            return []
+def _segment_windows() -> dict:
+    """Файлы журнала по окнам времени: {(начало, конец): [пути]}"""
+    windows = {}
+    if SEGMENTS_DIR.exists():
+        for path in SEGMENTS_DIR.glob("*.log"):
+            try:
+                start, end, _ = path.stem.split("-", 2)
+                window = (int(start), int(end))
+            except ValueError:
+                continue
+            windows.setdefault(window, []).append(path)
+    
+    # Старый общий файл (и его ротированные копии) старше всех сегментов
+    legacy = [path for path in LOG_DIR.glob(f"{LOG_FILE.name}*") if path.is_file()]
+    if legacy:
+        windows[(0, float("inf"))] = legacy
+    return windows
+
+
+def _read_segment_reversed(path):
+    """Записи файла журнала от новых к старым"""
+    for line in _reverse_lines(path):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except:
+            pass
+
+
+def _entry_timestamp(entry) -> str:
+    return entry.get("timestamp") or ""
+
+
+def read_actions(since: str = None, until: str = None):
+    """Записи журнала от новых к старым по всем процессам.
+
+    Окна времени перебираются от нового к старому, сегменты одного окна
+    сливаются k-way слиянием по timestamp. Окна вне диапазона [since, until]
+    (ISO-строки) не открываются.
+    """
+    since_epoch = datetime.fromisoformat(since).timestamp() if since else None
+    until_epoch = datetime.fromisoformat(until).timestamp() if until else None
+    
+    for (start, end), paths in sorted(_segment_windows().items(), reverse=True):
+        if until_epoch is not None and start > until_epoch:
+            continue
+        if since_epoch is not None and end <= since_epoch:
+            return
         
-        with open(LOG_FILE, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+        merged = heapq.merge(
+            *(_read_segment_reversed(path) for path in paths),
+            key=_entry_timestamp,
+            reverse=True
+        )
+        for entry in merged:
+            timestamp = _entry_timestamp(entry)
+            if until is not None and timestamp > until:
+                continue
+            if since is not None and timestamp < since:
+                return
+            yield entry
+
+
+class _SegmentIndex:
+    """Индекс одного файла журнала в памяти читателя.
+
+    records - (timestamp, смещение, длина, action, user_id, session_id,
+    ticket_ids) в порядке записи; postings - номера записей по ключу
+    (поле, значение). Индекс дочитывается с последней позиции: сегменты -
+    из файла .idx, старый общий файл (у него индекса нет) - из самих записей.
+    """
+
+    __slots__ = ("path", "source", "from_log", "position", "records", "postings")
+
+    def __init__(self, path: Path, from_log: bool):
+        self.path = path
+        self.from_log = from_log
+        self.source = path if from_log else path.with_suffix(INDEX_SUFFIX)
+        self.position = 0
+        self.records = []
+        self.postings = {}
+
+    def refresh(self):
+        try:
+            with open(self.source, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < self.position:
+                    # Файл обрезали - строим индекс заново
+                    self.position = 0
+                    self.records = []
+                    self.postings = {}
+                if size == self.position:
+                    return
+                f.seek(self.position)
+                data = f.read(size - self.position)
+        except FileNotFoundError:
+            return
         
-        logs = []
-        for line in lines[-limit:]:
+        # Последняя строка может быть еще не дописана
+        end = data.rfind(b"\n") + 1
+        offset = self.position
+        for line in data[:end].splitlines(keepends=True):
             try:
-                logs.append(json.loads(line))
-            except:
+                if self.from_log:
+                    item = index_record(offset, len(line), json.loads(line))
+                else:
+                    item = json.loads(line)
+                self._add(item)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                # Битая строка (например, после сбоя посреди записи) пропускается
                 pass
+            offset += len(line)
+        self.position += end
+
+    def _add(self, item: dict):
+        record_id = len(self.records)
+        session_id = None if item.get("s") is None else str(item["s"])
+        ticket_ids = tuple(str(ticket_id) for ticket_id in item.get("k") or ())
+        self.records.append((
+            item.get("t") or "", item["o"], item["n"],
+            item.get("a"), item.get("u"), session_id, ticket_ids
+        ))
+        keys = [("action", item.get("a")), ("user_id", item.get("u")), ("session_id", session_id)]
+        keys.extend(("ticket_id", ticket_id) for ticket_id in ticket_ids)
+        for key in keys:
+            if key[1] is not None:
+                self.postings.setdefault(key, []).append(record_id)
+
+    def matches(self, filters: dict) -> list:
+        """Записи, подходящие под все фильтры {поле: строка}"""
+        if not filters:
+            return self.records
+        # Перебираем самый короткий список, остальные ключи проверяем по записи
+        shortest = min(
+            (self.postings.get(key, ()) for key in filters.items()),
+            key=len
+        )
+        result = []
+        for record_id in shortest:
+            record = self.records[record_id]
+            if all(_record_value_matches(record, field, value) for field, value in filters.items()):
+                result.append(record)
+        return result
+
+
+_RECORD_FIELDS = {"action": 3, "user_id": 4, "session_id": 5}
+
+
+def _record_value_matches(record: tuple, field: str, value: str) -> bool:
+    if field == "ticket_id":
+        return value in record[6]
+    return record[_RECORD_FIELDS[field]] == value
+
+
+def _key_hash(field: str, value: str) -> int:
+    digest = hashlib.blake2b(f"{field}\0{value}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def write_postings(path: Path):
+    """Построить файл .keys закрытого сегмента из его .idx.
+
+    Файл пишется во временный и заменяет прежний, поэтому читатель видит
+    либо старый, либо новый файл целиком. Если в сегмент потом допишут
+    записи, .keys устареет: читатель сверяет размер .idx и в этом случае
+    пользуется индексом в памяти.
+    """
+    index = _SegmentIndex(path, from_log=False)
+    index.refresh()
+    blocks = []
+    for (field, value), record_ids in index.postings.items():
+        postings = [index.records[record_id][:3] for record_id in record_ids]
+        blocks.append((_key_hash(field, value), json.dumps(
+            [field, value, postings], ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")))
+    blocks.sort(key=lambda block: block[0])
+    
+    offset = POSTINGS_HEADER.size + POSTINGS_ENTRY.size * len(blocks)
+    directory = []
+    for key_hash, block in blocks:
+        directory.append(POSTINGS_ENTRY.pack(key_hash, offset, len(block)))
+        offset += len(block)
+    
+    target = path.with_suffix(POSTINGS_SUFFIX)
+    temporary = target.with_name(f"{target.name}.tmp")
+    with open(temporary, "wb") as f:
+        f.write(POSTINGS_HEADER.pack(POSTINGS_MAGIC, POSTINGS_VERSION, index.position, len(blocks)))
+        f.writelines(directory)
+        f.writelines(block for _, block in blocks)
+    os.replace(temporary, target)
+
+
+def _read_postings(f, count: int, field: str, value: str) -> list:
+    """Список (timestamp, смещение, длина) ключа: двоичный поиск по каталогу"""
+    key_hash = _key_hash(field, value)
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        f.seek(POSTINGS_HEADER.size + POSTINGS_ENTRY.size * middle)
+        if POSTINGS_ENTRY.unpack(f.read(POSTINGS_ENTRY.size))[0] < key_hash:
+            low = middle + 1
+        else:
+            high = middle
+    # У разных ключей может совпасть хэш - сверяем сам ключ
+    for position in range(low, count):
+        f.seek(POSTINGS_HEADER.size + POSTINGS_ENTRY.size * position)
+        entry_hash, offset, length = POSTINGS_ENTRY.unpack(f.read(POSTINGS_ENTRY.size))
+        if entry_hash != key_hash:
+            break
+        f.seek(offset)
+        block_field, block_value, postings = json.loads(f.read(length))
+        if block_field == field and block_value == value:
+            return postings
+    return []
+
+
+def _segment_postings(path: Path, filters: dict):
+    """Записи сегмента по фильтрам из файла .keys.
+
+    Читаются только каталог и списки запрошенных ключей; записи, подходящие
+    под все фильтры, - пересечение списков по смещению. None, если .keys
+    нет или он построен по другому размеру .idx (сегмент еще пишется).
+    """
+    try:
+        with open(path.with_suffix(POSTINGS_SUFFIX), "rb") as f:
+            magic, version, index_size, count = POSTINGS_HEADER.unpack(f.read(POSTINGS_HEADER.size))
+            if magic != POSTINGS_MAGIC or version != POSTINGS_VERSION:
+                return None
+            if os.path.getsize(path.with_suffix(INDEX_SUFFIX)) != index_size:
+                return None
+            lists = [_read_postings(f, count, field, value) for field, value in filters.items()]
+    except (OSError, ValueError, struct.error):
+        return None
+    
+    lists.sort(key=len)
+    result = lists[0]
+    for other in lists[1:]:
+        offsets = {posting[1] for posting in other}
+        result = [posting for posting in result if posting[1] in offsets]
+    return result
+
+
+# Индексы в порядке последнего запроса (LRU), не больше INDEX_CACHE_SIZE
+_segment_indexes: "OrderedDict[Path, _SegmentIndex]" = OrderedDict()
+_segment_indexes_lock = threading.Lock()
+
+
+def _segment_index(path: Path) -> _SegmentIndex:
+    """Индекс файла журнала, дочитанный до текущего конца"""
+    with _segment_indexes_lock:
+        index = _segment_indexes.get(path)
+        if index is None:
+            index = _segment_indexes[path] = _SegmentIndex(path, from_log=path.parent != SEGMENTS_DIR)
+        else:
+            _segment_indexes.move_to_end(path)
+        while len(_segment_indexes) > INDEX_CACHE_SIZE:
+            _segment_indexes.popitem(last=False)
+        index.refresh()
+        return index
+
+
+def _read_record(path: Path, offset: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return json.loads(f.read(length))
+
+
+def _parse_cursor(cursor: str) -> tuple:
+    timestamp, name, offset = cursor.rsplit("|", 2)
+    return (timestamp, name, int(offset))
+
+
+def query_actions(action: str = None, user_id: str = None, ticket_id=None, session_id=None,
+                  since: str = None, until: str = None, cursor: str = None,
+                  limit: int = 100) -> tuple:
+    """Записи журнала по фильтрам, от новых к старым, и курсор следующей страницы.
+
+    Окна времени вне [since, until] и старше курсора пропускаются целиком,
+    внутри окна кандидаты берутся из индекса по ключу (у закрытых сегментов -
+    из файла .keys, только списки запрошенных ключей), а с диска читаются
+    только попавшие на страницу записи. Курсор - строка
+    "timestamp|файл|смещение" последней возвращенной записи; None, если
+    записей больше нет.
+    """
+    filters = {
+        field: str(value)
+        for field, value in (("action", action), ("user_id", user_id),
+                             ("ticket_id", ticket_id), ("session_id", session_id))
+        if value is not None
+    }
+    after = _parse_cursor(cursor) if cursor else None
+    since_epoch = datetime.fromisoformat(since).timestamp() if since else None
+    # Окна новее курсора уже выданы на прошлых страницах
+    newest = until
+    if after is not None and (newest is None or after[0] < newest):
+        newest = after[0]
+    newest_epoch = datetime.fromisoformat(newest).timestamp() if newest else None
+    
+    page = []
+    if limit <= 0:
+        return page, None
+    
+    for (start, end), paths in sorted(_segment_windows().items(), reverse=True):
+        if newest_epoch is not None and start > newest_epoch:
+            continue
+        if since_epoch is not None and end <= since_epoch:
+            break
         
+        candidates = []
+        for path in paths:
+            records = None
+            if filters and path.parent == SEGMENTS_DIR:
+                records = _segment_postings(path, filters)
+            if records is None:
+                records = _segment_index(path).matches(filters)
+            for record in records:
+                timestamp = record[0]
+                if until is not None and timestamp > until:
+                    continue
+                if since is not None and timestamp < since:
+                    continue
+                key = (timestamp, path.name, record[1])
+                if after is not None and key >= after:
+                    continue
+                candidates.append((key, path, record[2]))
+        
+        for key, path, length in heapq.nlargest(limit - len(page), candidates):
+            try:
+                entry = _read_record(path, key[2], length)
+            except (OSError, ValueError):
+                continue
+            page.append((key, entry))
+        if len(page) >= limit:
+            break
+    
+    next_cursor = None
+    if len(page) >= limit:
+        timestamp, name, offset = page[-1][0]
+        next_cursor = f"{timestamp}|{name}|{offset}"
+    return [entry for _, entry in page], next_cursor
+
+
+def clear_logs() -> int:
+    """Удалить все файлы журнала действий, вернуть их количество"""
+    removed = 0
+    for paths in _segment_windows().values():
+        for path in paths:
+            path.unlink(missing_ok=True)
+            path.with_suffix(INDEX_SUFFIX).unlink(missing_ok=True)
+            path.with_suffix(POSTINGS_SUFFIX).unlink(missing_ok=True)
+            removed += 1
+    with _segment_indexes_lock:
+        _segment_indexes.clear()
+    return removed
+
+
+def get_logs(limit: int = 100) -> list:
+    """Возвращает последние логи"""
+    try:
+        if limit <= 0:
+            return []
+        logs = list(islice(read_actions(), limit))
+        logs.reverse()
         return logs
     except Exception as e:
         print(f"Ошибка при чтении логов: {e}")
@@ -1,14 +1,21 @@
+import itertools
 import json
 import os
-from fastapi import FastAPI, HTTPException
+import threading
+import time
+from fastapi import FastAPI, HTTPException, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.logger import logger
+from app.logger import logger, set_level, logging_settings, elapsed_ms
 from app.schemas import ReserveTicketRequest, TicketResponse, GetTicketsBySessionRequest
 from app.models import Ticket, TicketStatus
 from app.storage import tickets
-from app.session_client import check_seat_available, mark_seat_as_reserved, mark_seat_as_available
+from app.session_client import mark_seat_as_reserved, mark_seat_as_available, release_seats
+from app.locks import StripedLock
+from app.sqlite_store import SqliteTicketStore
+from app.holds import HoldExpiry
 from app.logging_service import log_action
-from typing import List
+from app.request_metrics import RequestMetrics, RequestMetricsMiddleware, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from typing import List, Optional
 
 app = FastAPI(
     title="Ticket Service",
@@ -26,34 +33,98 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Метрики запросов: добавляется последним, чтобы учитывать остальные middleware
+request_metrics = RequestMetrics()
+app.add_middleware(RequestMetricsMiddleware, metrics=request_metrics)
+
 # Файловое хранилище
-DATA_DIR = "/app/data"
+DATA_DIR = os.getenv("TICKET_DATA_DIR", "/app/data")
 TICKETS_FILE = f"{DATA_DIR}/tickets.json"
+TICKETS_DB_FILE = f"{DATA_DIR}/tickets.db"
+# Где хранятся билеты: json (tickets.json) или sqlite (tickets.db)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
 
 def ensure_data_dir():
     """Создать директорию для данных если не существует"""
     os.makedirs(DATA_DIR, exist_ok=True)
 
+if STORAGE_BACKEND == "sqlite":
+    ensure_data_dir()
+    sqlite_store = SqliteTicketStore(TICKETS_DB_FILE)
+else:
+    sqlite_store = None
+
+# Файл билетов пишется одним потоком за раз
+tickets_file_lock = threading.Lock()
+# Изменения билетов одного сеанса выполняются по очереди
+TICKET_LOCK_STRIPES = int(os.getenv("TICKET_LOCK_STRIPES", "64"))
+session_locks = StripedLock(TICKET_LOCK_STRIPES)
+
+# Сколько держится бронь до оплаты (секунды); 0 - бронь без срока
+TICKET_HOLD_TTL = float(os.getenv("TICKET_HOLD_TTL", "900"))
+# Как часто проверяются истекшие брони и сколько билетов освобождается за раз
+HOLD_EXPIRY_INTERVAL = float(os.getenv("HOLD_EXPIRY_INTERVAL", "1"))
+HOLD_EXPIRY_BATCH = int(os.getenv("HOLD_EXPIRY_BATCH", "1000"))
+# Через сколько повторить, если Session Service не освободил места
+HOLD_RETRY_DELAY = float(os.getenv("HOLD_RETRY_DELAY", "30"))
+
 def save_tickets():
     """Сохранить билеты в файл"""
     ensure_data_dir()
-    tickets_data = {}
-    for ticket_id, ticket in tickets.items():
-        tickets_data[ticket_id] = {
-            "id": ticket.id,
-            "session_id": ticket.session_id,
-            "row": ticket.row,
-            "number": ticket.number,
-            "status": ticket.status.value,
-            "price": ticket.price,
-            "email": ticket.email
-        }
-    
-    with open(TICKETS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(tickets_data, f, ensure_ascii=False, indent=2)
-    logger.info(f"Tickets saved to {TICKETS_FILE}")
+    # Снимок берется под блокировкой, чтобы старый снимок не перезаписал новый
+    with tickets_file_lock:
+        tickets_data = {}
+        for ticket_id, ticket in list(tickets.items()):
+            tickets_data[ticket_id] = {
+                "id": ticket.id,
+                "session_id": ticket.session_id,
+                "row": ticket.row,
+                "number": ticket.number,
+                "status": ticket.status.value,
+                "price": ticket.price,
+                "email": ticket.email,
+                "expires_at": ticket.expires_at
+            }
+        
+        with open(TICKETS_FILE, 'w', encoding='utf-8') as f:
+            json.dump(tickets_data, f, ensure_ascii=False, indent=2)
+    logger.info("Tickets saved to %s", TICKETS_FILE)
+
+def save_ticket(ticket: Ticket):
+    """Сохранить изменения билета (в SQLite - только этот билет)"""
+    if sqlite_store is not None:
+        sqlite_store.save_ticket(ticket)
+    else:
+        save_tickets()
+
+def save_ticket_batch(ticket_list):
+    """Сохранить изменения нескольких билетов (в SQLite - одной транзакцией)"""
+    if sqlite_store is not None:
+        sqlite_store.save_tickets(ticket_list)
+    else:
+        save_tickets()
 
 def load_tickets():
+    """Загрузить билеты из выбранного хранилища"""
+    if sqlite_store is None:
+        load_tickets_from_file()
+        return
+    
+    try:
+        if sqlite_store.is_empty():
+            # Миграция: билеты из tickets.json - в пустую базу (файл остается)
+            load_tickets_from_file()
+            sqlite_store.save_tickets(tickets.values())
+            logger.info("Migrated %s tickets to %s", len(tickets), TICKETS_DB_FILE)
+            return
+        tickets.clear()
+        for ticket in sqlite_store.load_tickets():
+            tickets[ticket.id] = ticket
+        logger.info("Loaded %s tickets from %s", len(tickets), TICKETS_DB_FILE)
+    except Exception as e:
+        logger.error("Error loading tickets: %s", e)
+
+def load_tickets_from_file():
     """Загрузить билеты из файла"""
     if not os.path.exists(TICKETS_FILE):
         logger.info("Tickets file not found, using default data")
@@ -72,25 +143,142 @@ def load_tickets():
                 number=ticket_data["number"],
                 status=TicketStatus(ticket_data["status"]),
                 price=ticket_data["price"],
-                email=ticket_data.get("email", "")
+                email=ticket_data.get("email", ""),
+                expires_at=ticket_data.get("expires_at")
             )
             tickets[int(ticket_id)] = ticket
         
-        logger.info(f"Loaded {len(tickets)} tickets from file")
+        logger.info("Loaded %s tickets from file", len(tickets))
     except Exception as e:
-        logger.error(f"Error loading tickets: {e}")
+        logger.error("Error loading tickets: %s", e)
+
+# Версии списков билетов по сеансам для ETag. Начинаются с текущего времени
+# в микросекундах, чтобы не повторяться после перезапуска сервиса
+_ticket_list_versions = itertools.count(time.time_ns() // 1000)
+tickets_loaded_version = next(_ticket_list_versions)
+session_ticket_versions = {}
+
+def touch_session_tickets(session_id: int):
+    """Отметить, что список билетов сеанса изменился"""
+    session_ticket_versions[session_id] = next(_ticket_list_versions)
+
+def expire_holds(ticket_ids):
+    """Снять истекшие брони: места освобождаются одним запросом на сеанс.
+
+    Билет помечается EXPIRED, только если его место освобождено или сеанса
+    больше нет. Возвращает id билетов, места которых освободить не удалось.
+    """
+    now = time.time()
+    held_by_session = {}
+    for ticket_id in ticket_ids:
+        ticket = tickets.get(ticket_id)
+        if (ticket is not None and ticket.status == TicketStatus.RESERVED
+                and ticket.expires_at is not None and ticket.expires_at <= now):
+            held_by_session.setdefault(ticket.session_id, []).append(ticket)
+    
+    failed = []
+    expired = []
+    for session_id, held in held_by_session.items():
+        with session_locks(session_id):
+            # Пока ждали блокировку, билет могли оплатить или отменить
+            held = [ticket for ticket in held if ticket.status == TicketStatus.RESERVED]
+            if not held:
+                continue
+            status = release_seats(session_id, [(ticket.row, ticket.number) for ticket in held])
+            if status == 503:
+                failed.extend(ticket.id for ticket in held)
+                continue
+            if status == 400:
+                # Пакет отклонен целиком - освобождаем места по одному; бронь
+                # снимается только с тех, чье место действительно освободилось
+                released = []
+                for ticket in held:
+                    if mark_seat_as_available(session_id, ticket.row, ticket.number):
+                        released.append(ticket)
+                    else:
+                        failed.append(ticket.id)
+                held = released
+                if not held:
+                    continue
+            for ticket in held:
+                ticket.status = TicketStatus.EXPIRED
+            touch_session_tickets(session_id)
+        
+        expired.extend(held)
+        logger.info("Expired %s ticket holds of session %s", len(held), session_id,
+                    extra={"event": "TICKET_HOLDS_EXPIRED", "session_id": session_id})
+        log_action(
+            action="EXPIRE_TICKETS",
+            user_id="system",
+            details={
+                "session_id": session_id,
+                "ticket_ids": [ticket.id for ticket in held],
+                "seats": [f"{ticket.row}{ticket.number}" for ticket in held]
+            }
+        )
+    
+    # Одно сохранение на всю пачку
+    if expired:
+        save_ticket_batch(expired)
+    return failed
+
+hold_expiry = HoldExpiry(expire_holds, HOLD_EXPIRY_INTERVAL, HOLD_EXPIRY_BATCH, HOLD_RETRY_DELAY)
+
+def hold_ticket(ticket: Ticket):
+    """Поставить срок брони новому билету"""
+    if TICKET_HOLD_TTL > 0:
+        ticket.expires_at = time.time() + TICKET_HOLD_TTL
+        hold_expiry.add(ticket.id, ticket.expires_at)
+
+def hold_expired(ticket: Ticket) -> bool:
+    """Бронь истекла (даже если поток еще не успел освободить место)"""
+    if ticket.status == TicketStatus.EXPIRED:
+        return True
+    return (ticket.status == TicketStatus.RESERVED and ticket.expires_at is not None
+            and ticket.expires_at <= time.time())
+
+def schedule_loaded_holds():
+    """Брони из хранилища: сроки продолжают идти, у старых броней без срока он начинается сейчас"""
+    for ticket in tickets.values():
+        if ticket.status == TicketStatus.RESERVED:
+            if ticket.expires_at is None and TICKET_HOLD_TTL > 0:
+                ticket.expires_at = time.time() + TICKET_HOLD_TTL
+            if ticket.expires_at is not None:
+                hold_expiry.add(ticket.id, ticket.expires_at)
 
 # Загружаем данные при старте
 load_tickets()
+schedule_loaded_holds()
 
-ticket_id_seq = 1
+# id новых билетов продолжают загруженные; next() атомарен для потоков
+ticket_ids = itertools.count(max(tickets, default=0) + 1)
+
+
+def reserve_seat_or_fail(request: ReserveTicketRequest):
+    """Занять место в Session Service атомарно или ответить ошибкой"""
+    status = mark_seat_as_reserved(request.session_id, request.row, request.number)
+    if status == 409:
+        raise HTTPException(status_code=409, detail="Seat not available")
+    if status == 404:
+        raise HTTPException(status_code=400, detail="Seat not available")
+    if status != 200:
+        raise HTTPException(status_code=503, detail="Session Service unavailable")
 
 
 @app.on_event("startup")
 def startup():
+    hold_expiry.start()
     logger.info("Ticket Service started")
 
 
+@app.on_event("shutdown")
+def shutdown():
+    hold_expiry.stop()
+    if sqlite_store is not None:
+        sqlite_store.close()
+    logger.info("Ticket Service stopped")
+
+
 @app.get("/tickets", response_model=List[TicketResponse])
 def get_all_tickets():
     """Получить все билеты"""
@@ -99,9 +287,17 @@ def get_all_tickets():
 
 
 @app.get("/tickets/session/{session_id}", response_model=List[TicketResponse])
-def get_tickets_by_session(session_id: int):
+def get_tickets_by_session(session_id: int, response: Response,
+                           if_none_match: Optional[str] = Header(None)):
     """Получить все билеты для конкретного сеанса"""
-    logger.info(f"GET /tickets/session/{session_id}")
+    logger.info("GET /tickets/session/%s", session_id)
+    
+    # Список не изменился - клиент может использовать закэшированный
+    etag = f'"{session_ticket_versions.get(session_id, tickets_loaded_version)}"'
+    if if_none_match == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    
     result = [t for t in tickets.values() if t.session_id == session_id]
     return result
 
@@ -109,16 +305,16 @@ def get_tickets_by_session(session_id: int):
 @app.post("/api/ticket/tickets/reserve", response_model=TicketResponse)
 def reserve_ticket_api(request: ReserveTicketRequest):
     """Забронировать билет"""
-    logger.info(f"POST /api/ticket/tickets/reserve - session {request.session_id}, seat {request.row}{request.number}")
+    started = time.perf_counter()
+    logger.info("POST /api/ticket/tickets/reserve - session %s, seat %s%s", request.session_id, request.row, request.number)
     
-    # Проверяем доступность места
-    if not check_seat_available(request.session_id, request.row, request.number):
-        raise HTTPException(status_code=400, detail="Seat not available")
+    # Проверка и занятие места - одна атомарная операция в Session Service,
+    # поэтому два запроса не могут занять одно место
+    reserve_seat_or_fail(request)
     
     # Создаем билет
-    global ticket_id_seq
     ticket = Ticket(
-        id=ticket_id_seq,
+        id=next(ticket_ids),
         session_id=request.session_id,
         row=request.row,
         number=request.number,
@@ -126,16 +322,17 @@ def reserve_ticket_api(request: ReserveTicketRequest):
         price=request.price,
         email=request.email
     )
-    tickets[ticket_id_seq] = ticket
-    ticket_id_seq += 1
-    
-    # Помечаем место как занято
-    mark_seat_as_reserved(request.session_id, request.row, request.number)
+    tickets[ticket.id] = ticket
+    hold_ticket(ticket)
+    touch_session_tickets(ticket.session_id)
     
     # Сохраняем в файл
-    save_tickets()
+    save_ticket(ticket)
     
-    logger.info(f"Ticket {ticket.id} reserved successfully")
+    logger.info("Ticket %s reserved successfully", ticket.id, extra={
+        "event": "TICKET_RESERVED", "ticket_id": ticket.id, "session_id": ticket.session_id,
+        "latency_ms": elapsed_ms(started)
+    })
     
     # Логируем действие пользователя
     log_action(
@@ -157,18 +354,15 @@ def reserve_ticket_api(request: ReserveTicketRequest):
 @app.post("/tickets/reserve", response_model=TicketResponse)
 def reserve_ticket(request: ReserveTicketRequest):
     """Забронировать билет"""
-    global ticket_id_seq
+    started = time.perf_counter()
+    logger.info("Reserve ticket request: %s", request)
 
-    logger.info(f"Reserve ticket request: {request}")
-
-    # Проверить доступность места
-    if not check_seat_available(request.session_id, request.row, request.number):
-        logger.warning(f"Seat {request.row}{request.number} not available")
-        raise HTTPException(status_code=400, detail="Seat not available")
+    # Занять место (только если оно свободно)
+    reserve_seat_or_fail(request)
 
     # Создать билет
     ticket = Ticket(
-        id=ticket_id_seq,
+        id=next(ticket_ids),
         session_id=request.session_id,
         row=request.row,
         number=request.number,
@@ -176,20 +370,21 @@ def reserve_ticket(request: ReserveTicketRequest):
         status=TicketStatus.RESERVED,
         email=request.email
     )
-    tickets[ticket_id_seq] = ticket
-    ticket_id_seq += 1
-
-    # Пометить место как занятое
-    mark_seat_as_reserved(request.session_id, request.row, request.number)
+    tickets[ticket.id] = ticket
+    hold_ticket(ticket)
+    touch_session_tickets(ticket.session_id)
 
-    logger.info(f"Ticket reserved: {ticket}")
+    logger.info("Ticket reserved: %s", ticket, extra={
+        "event": "TICKET_RESERVED", "ticket_id": ticket.id, "session_id": ticket.session_id,
+        "latency_ms": elapsed_ms(started)
+    })
     return ticket
 
 
 @app.get("/tickets/{ticket_id}", response_model=TicketResponse)
 def get_ticket(ticket_id: int):
     """Получить информацию о билете"""
-    logger.info(f"GET /tickets/{ticket_id}")
+    logger.info("GET /tickets/%s", ticket_id)
     
     ticket = tickets.get(ticket_id)
     if not ticket:
@@ -201,18 +396,31 @@ def get_ticket(ticket_id: int):
 @app.post("/tickets/confirm/{ticket_id}", response_model=TicketResponse)
 def confirm_ticket(ticket_id: int):
     """Подтвердить билет (оплачен)"""
-    logger.info(f"POST /tickets/confirm/{ticket_id}")
+    started = time.perf_counter()
+    logger.info("POST /tickets/confirm/%s", ticket_id)
     
     ticket = tickets.get(ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
-    ticket.status = TicketStatus.SOLD
+    with session_locks(ticket.session_id):
+        # Место отмененного билета уже освобождено и могло уйти другому
+        if ticket.status == TicketStatus.CANCELLED:
+            raise HTTPException(status_code=409, detail="Ticket is cancelled")
+        # Место истекшей брони освобождено (или вот-вот будет)
+        if hold_expired(ticket):
+            raise HTTPException(status_code=409, detail="Ticket hold expired")
+        ticket.status = TicketStatus.SOLD
+        ticket.expires_at = None
+        touch_session_tickets(ticket.session_id)
     
     # Сохраняем изменения
-    save_tickets()
+    save_ticket(ticket)
     
-    logger.info(f"Ticket sold: {ticket}")
+    logger.info("Ticket sold: %s", ticket, extra={
+        "event": "TICKET_SOLD", "ticket_id": ticket.id, "session_id": ticket.session_id,
+        "latency_ms": elapsed_ms(started)
+    })
     
     # Логируем действие пользователя
     log_action(
@@ -234,21 +442,30 @@ def confirm_ticket(ticket_id: int):
 @app.post("/tickets/cancel/{ticket_id}", response_model=TicketResponse)
 def cancel_ticket(ticket_id: int):
     """Отменить билет"""
-    logger.info(f"POST /tickets/cancel/{ticket_id}")
+    started = time.perf_counter()
+    logger.info("POST /tickets/cancel/%s", ticket_id)
     
     ticket = tickets.get(ticket_id)
     if not ticket:
         raise HTTPException(status_code=404, detail="Ticket not found")
 
-    ticket.status = TicketStatus.CANCELLED
-    
-    # Освобождаем место
-    mark_seat_as_available(ticket.session_id, ticket.row, ticket.number)
+    with session_locks(ticket.session_id):
+        # Повторная отмена не должна освобождать место, которое уже занял другой
+        if ticket.status in (TicketStatus.CANCELLED, TicketStatus.EXPIRED):
+            return ticket
+        ticket.status = TicketStatus.CANCELLED
+        touch_session_tickets(ticket.session_id)
+        
+        # Освобождаем место
+        mark_seat_as_available(ticket.session_id, ticket.row, ticket.number)
     
     # Сохраняем изменения
-    save_tickets()
+    save_ticket(ticket)
     
-    logger.info(f"Ticket cancelled: {ticket}")
+    logger.info("Ticket cancelled: %s", ticket, extra={
+        "event": "TICKET_CANCELLED", "ticket_id": ticket.id, "session_id": ticket.session_id,
+        "latency_ms": elapsed_ms(started)
+    })
     
     # Логируем действие пользователя
     log_action(
@@ -264,4 +481,30 @@ def cancel_ticket(ticket_id: int):
         }
     )
     
-    return ticket
\ No newline at end of file
+    return ticket
+
+
+@app.get("/metrics")
+async def get_request_metrics():
+    """Задержки, статусы и число выполняющихся запросов в формате Prometheus.
+
+    async: метрики обновляются в цикле событий, отдаем их оттуда же.
+    """
+    return Response(content=request_metrics.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/logging")
+def get_logging_settings():
+    """Уровень логов, выборка частых INFO-записей и состояние очереди логов"""
+    return logging_settings()
+
+
+@app.put("/logging/level")
+def update_logging_level(level: str):
+    """Сменить уровень логов сервиса без перезапуска"""
+    try:
+        set_level(level)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown log level: {level}")
+    logger.warning("Log level set to %s", level.upper())
+    return logging_settings()
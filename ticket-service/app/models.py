@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 from enum import Enum
+from typing import Optional
 
 
 class TicketStatus(str, Enum):
@@ -7,6 +8,7 @@ class TicketStatus(str, Enum):
     RESERVED = "RESERVED"
     SOLD = "SOLD"
     CANCELLED = "CANCELLED"
+    EXPIRED = "EXPIRED"
 
 
 @dataclass
@@ -17,4 +19,6 @@ class Ticket:
     number: int
     status: TicketStatus
     price: float = 250.0
-    email: str = ""
\ No newline at end of file
+    email: str = ""
+    # Когда истекает бронь (unix time); None - билет не в брони
+    expires_at: Optional[float] = None
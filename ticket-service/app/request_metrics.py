@@ -0,0 +1,130 @@
+"""Метрики запросов в формате Prometheus.
+
+RequestMetrics - чистое ASGI middleware (без BaseHTTPMiddleware): на запрос
+два вызова perf_counter, поиск ряда в словаре и bisect по границам
+корзин. Ряд - метод и шаблон маршрута (/api/tickets/{ticket_id}, а не
+путь с id), поэтому число рядов не растет с числом объектов.
+
+Метрики живут в процессе: при нескольких воркерах каждый отдает свои,
+Prometheus различает их по instance.
+"""
+from bisect import bisect_left
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+# Границы корзин гистограммы задержки (секунды)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Запросы, не попавшие ни в один маршрут (404 роутера)
+UNMATCHED_ROUTE = "<unmatched>"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Series:
+    """Гистограмма задержки и счетчики статусов одного маршрута"""
+
+    __slots__ = ("buckets", "total", "count", "statuses")
+
+    def __init__(self):
+        # Последняя корзина - больше последней границы (+Inf)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.statuses: Dict[int, int] = {}
+
+
+def route_label(scope) -> str:
+    """Шаблон маршрута, который обработал запрос"""
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", UNMATCHED_ROUTE)
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", UNMATCHED_ROUTE)
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RequestMetrics:
+    """Задержка, статусы и число выполняющихся запросов по маршрутам.
+
+    Обновляется только из цикла событий воркера, поэтому без блокировок;
+    render тоже вызывается из цикла (async-обработчик /metrics).
+    """
+
+    def __init__(self):
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self.in_progress = 0
+
+    def observe(self, method: str, route: str, status: int, elapsed: float):
+        series = self._series.get((method, route))
+        if series is None:
+            series = self._series[(method, route)] = _Series()
+        series.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+        series.total += elapsed
+        series.count += 1
+        series.statuses[status] = series.statuses.get(status, 0) + 1
+
+    def render(self) -> str:
+        """Текстовый формат Prometheus"""
+        lines: List[str] = [
+            "# HELP http_request_duration_seconds Request latency by route.",
+            "# TYPE http_request_duration_seconds histogram"
+        ]
+        bounds = [repr(bound) for bound in LATENCY_BUCKETS] + ["+Inf"]
+        series_list = sorted(self._series.items())
+        for (method, route), series in series_list:
+            labels = f'method="{method}",route="{_label(route)}"'
+            cumulative = 0
+            for bound, count in zip(bounds, series.buckets):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {series.total}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {series.count}")
+
+        lines.append("# HELP http_requests_total Requests by route and status code.")
+        lines.append("# TYPE http_requests_total counter")
+        for (method, route), series in series_list:
+            labels = f'method="{method}",route="{_label(route)}"'
+            for status, count in sorted(series.statuses.items()):
+                lines.append(f'http_requests_total{{{labels},status="{status}"}} {count}')
+
+        lines.append("# HELP http_requests_in_progress Requests being processed.")
+        lines.append("# TYPE http_requests_in_progress gauge")
+        lines.append(f"http_requests_in_progress {self.in_progress}")
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware: замер задержки и статуса каждого HTTP-запроса.
+
+    Добавляется последним, чтобы быть внешним и учитывать время остальных
+    middleware. Для потоковых ответов (SSE) задержка - время до конца потока.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_progress += 1
+        start = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - start
+            metrics.in_progress -= 1
+            metrics.observe(scope["method"], route_label(scope), status, elapsed)
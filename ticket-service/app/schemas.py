@@ -1,5 +1,7 @@
 from pydantic import BaseModel, EmailStr
 from enum import Enum
+from datetime import datetime
+from typing import Optional
 
 
 class TicketStatus(str, Enum):
@@ -7,6 +9,7 @@ class TicketStatus(str, Enum):
     RESERVED = "RESERVED"
     SOLD = "SOLD"
     CANCELLED = "CANCELLED"
+    EXPIRED = "EXPIRED"
 
 
 class ReserveTicketRequest(BaseModel):
@@ -25,6 +28,8 @@ class TicketResponse(BaseModel):
     status: TicketStatus
     price: float
     email: str = None
+    # Когда истекает бронь (для билетов в статусе RESERVED)
+    expires_at: Optional[datetime] = None
 
 
 class GetTicketsBySessionRequest(BaseModel):
@@ -1,4 +1,5 @@
 import requests
+from typing import List, Tuple
 from app.logger import logger
 
 SESSION_SERVICE_URL = "http://session-service:8000"
@@ -7,37 +8,41 @@ SESSION_SERVICE_URL = "http://session-service:8000"
 def check_seat_available(session_id: int, row: str, number: int) -> bool:
     """Проверить доступность места"""
     try:
-        url = f"{SESSION_SERVICE_URL}/sessions/{session_id}/seats"
+        url = f"{SESSION_SERVICE_URL}/sessions/{session_id}/seats/{row}/{number}"
         response = requests.get(url, timeout=3)
+        if response.status_code == 404:
+            return False
         response.raise_for_status()
-        seats = response.json()
-
-        for seat in seats:
-            if seat["row"] == row and seat["number"] == number:
-                return seat["is_available"]
-
-        return False
+        return response.json()["is_available"]
 
     except Exception as e:
-        logger.error(f"Session Service unavailable: {e}")
+        logger.error("Session Service unavailable: %s", e)
         return False
 
 
-def mark_seat_as_reserved(session_id: int, row: str, number: int) -> bool:
-    """Отметить место как зарезервированное"""
+def mark_seat_as_reserved(session_id: int, row: str, number: int) -> int:
+    """Занять место, только если оно сейчас свободно (compare-and-set).
+
+    Возвращает код ответа Session Service: 200 - место занято для нас,
+    409 - его уже заняли, 404 - нет сеанса или места; 503 - сервис
+    недоступен.
+    """
     try:
         url = f"{SESSION_SERVICE_URL}/sessions/{session_id}/seats/{row}/{number}"
         response = requests.put(
             url,
-            json={"is_available": False},
+            json={"is_available": False, "expected_available": True},
             timeout=3
         )
+        if response.status_code in (404, 409):
+            logger.warning("Seat %s%s not reserved: %s", row, number, response.status_code)
+            return response.status_code
         response.raise_for_status()
-        logger.info(f"Seat {row}{number} marked as reserved")
-        return True
+        logger.info("Seat %s%s marked as reserved", row, number)
+        return 200
     except Exception as e:
-        logger.error(f"Failed to mark seat as reserved: {e}")
-        return False
+        logger.error("Failed to mark seat as reserved: %s", e)
+        return 503
 
 
 def mark_seat_as_available(session_id: int, row: str, number: int) -> bool:
@@ -50,8 +55,41 @@ def mark_seat_as_available(session_id: int, row: str, number: int) -> bool:
             timeout=3
         )
         response.raise_for_status()
-        logger.info(f"Seat {row}{number} marked as available")
+        logger.info("Seat %s%s marked as available", row, number)
         return True
     except Exception as e:
-        logger.error(f"Failed to mark seat as available: {e}")
-        return False
\ No newline at end of file
+        logger.error("Failed to mark seat as available: %s", e)
+        return False
+
+
+def release_seats(session_id: int, seats: List[Tuple[str, int]]) -> int:
+    """Освободить несколько мест сеанса одним запросом.
+
+    Пакет применяется по принципу все-или-ничего. Возвращает: 200 - места
+    свободны, 404 - нет сеанса (освобождать нечего), 400 - пакет отклонен
+    целиком (например, одного из мест нет) и ни одно место не освобождено;
+    503 - сервис недоступен.
+    """
+    try:
+        url = f"{SESSION_SERVICE_URL}/sessions/{session_id}/seats"
+        response = requests.put(
+            url,
+            json={"seats": [
+                {"row": row, "number": number, "is_available": True}
+                for row, number in seats
+            ]},
+            timeout=5
+        )
+        if response.status_code == 404 and response.json().get("detail") == "Session not found":
+            logger.warning("Seats of session %s not released: session not found", session_id)
+            return 404
+        if 400 <= response.status_code < 500:
+            logger.warning("Seats of session %s not released: %s %s",
+                           session_id, response.status_code, response.text)
+            return 400
+        response.raise_for_status()
+        logger.info("Released %s seats of session %s", len(seats), session_id)
+        return 200
+    except Exception as e:
+        logger.error("Failed to release seats of session %s: %s", session_id, e)
+        return 503
@@ -0,0 +1,106 @@
+"""Хранилище билетов в SQLite (STORAGE_BACKEND=sqlite).
+
+Словарь storage.tickets остается основным представлением в памяти, база
+сохраняет каждый измененный билет отдельной транзакцией вместо перезаписи
+tickets.json целиком. База работает в режиме WAL.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterable, List
+
+from app.models import Ticket, TicketStatus
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL,
+    row TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    price REAL NOT NULL,
+    email TEXT NOT NULL DEFAULT '',
+    expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS tickets_by_place ON tickets (session_id, row, number);
+CREATE INDEX IF NOT EXISTS tickets_by_email ON tickets (email);
+"""
+
+SAVE_TICKET = (
+    "INSERT OR REPLACE INTO tickets (id, session_id, row, number, status, price, email, expires_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    """Соединение с базой в режиме WAL"""
+    connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # В WAL при synchronous=NORMAL коммит не ждет fsync, база при сбое не портится
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def ticket_row(ticket: Ticket) -> tuple:
+    return (ticket.id, ticket.session_id, ticket.row, ticket.number,
+            ticket.status.value, ticket.price, ticket.email, ticket.expires_at)
+
+
+class SqliteTicketStore:
+    """Билеты в SQLite.
+
+    Индекс (session_id, row, number) служит и для выборки билетов сеанса,
+    индекс email - для поиска билетов покупателя. Соединение одно на
+    процесс, запись идет под блокировкой.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = connect(path)
+        self._connection.executescript(SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(tickets)")}
+        if "expires_at" not in columns:
+            # База, созданная до появления сроков брони
+            self._connection.execute("ALTER TABLE tickets ADD COLUMN expires_at REAL")
+
+    @contextmanager
+    def _transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT под блокировкой; при ошибке - ROLLBACK"""
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def is_empty(self) -> bool:
+        """В базе еще нет билетов (нужна миграция из JSON)"""
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM tickets LIMIT 1").fetchone() is None
+
+    def save_ticket(self, ticket: Ticket):
+        with self._transaction() as connection:
+            connection.execute(SAVE_TICKET, ticket_row(ticket))
+
+    def save_tickets(self, ticket_list: Iterable[Ticket]):
+        """Сохранить билеты одной транзакцией"""
+        with self._transaction() as connection:
+            connection.executemany(SAVE_TICKET, map(ticket_row, ticket_list))
+
+    def load_tickets(self) -> List[Ticket]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, session_id, row, number, status, price, email, expires_at FROM tickets ORDER BY id"
+            ).fetchall()
+        return [
+            Ticket(id=ticket_id, session_id=session_id, row=row, number=number,
+                   status=TicketStatus(status), price=price, email=email, expires_at=expires_at)
+            for ticket_id, session_id, row, number, status, price, email, expires_at in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
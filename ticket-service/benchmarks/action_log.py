@@ -0,0 +1,168 @@
+"""Бенчмарк журнала действий: задержка POST /api/ticket/tickets/reserve с прежним и фоновым писателем.
+
+Запуск из каталога ticket-service:
+    python -m benchmarks.action_log [--threads 4] [--requests 2000] [--rounds 2] [--io-ms 0.5]
+
+Запросы идут через TestClient в приложение app.main (middleware,
+валидация, reserve_ticket_api, сохранение билета, журнал действий).
+Session Service заменен заглушкой mark_seat_as_reserved: ждет --io-ms
+(sleep, как сетевой запрос) и отвечает 200. Билеты (TICKET_DATA_DIR,
+STORAGE_BACKEND=sqlite) и журнал действий пишутся во временный каталог.
+Сравнивается задержка обработки запроса клиентом:
+  sync    - прежний log_action: mkdir, open("a"), write, close на каждую запись;
+  batched - log_action сервиса: запись в очередь ActionLogWriter, файл пишет
+            фоновый поток пачками.
+Варианты чередуются --rounds раз; в конце проверяется, что каждая запись
+записана или учтена как отброшенная. С --io-ms 0 запросы идут подряд без пауз, и видно, успевает
+ли фоновый писатель.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List
+
+from fastapi.testclient import TestClient
+
+from app import logging_service
+from app.logging_service import INDEX_SUFFIX, POSTINGS_SUFFIX, ActionLogWriter
+
+
+def sync_logger(log_file: Path) -> Callable:
+    """Прежний log_action: файл открывается на каждую запись"""
+    def log_action(action: str, user_id: str, details: dict = None, ip: str = None):
+        log_entry = {
+            "timestamp": datetime.now().isoformat(),
+            "action": action,
+            "user_id": user_id,
+            "ip": ip,
+            "details": details or {}
+        }
+        try:
+            log_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(log_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        except Exception as e:
+            print(f"Ошибка при логировании: {e}")
+    return log_action
+
+
+def load_app(directory: Path, io_seconds: float):
+    """Импортировать app.main с данными в directory и заглушкой Session Service"""
+    os.environ["TICKET_DATA_DIR"] = str(directory / "data")
+    os.environ["STORAGE_BACKEND"] = "sqlite"
+    from app import main
+
+    def mark_seat_as_reserved(session_id: int, row: str, number: int) -> int:
+        if io_seconds:
+            time.sleep(io_seconds)
+        return 200
+
+    main.mark_seat_as_reserved = mark_seat_as_reserved
+    # Лог сервиса и httpx на каждый запрос не выводим в консоль бенчмарка
+    main.set_level("WARNING")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return main
+
+
+def run(client: TestClient, threads: int, requests: int, first_session: int) -> List[float]:
+    """Задержки запросов брони (секунды); у каждого запроса свое место"""
+    latencies: List[List[float]] = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def worker(index: int):
+        mine = latencies[index]
+        barrier.wait()
+        for request_id in range(index, requests, threads):
+            body = {"session_id": first_session + request_id // 200, "row": chr(ord("A") + request_id % 200 // 20),
+                    "number": request_id % 20 + 1, "price": 250.0, "email": f"user{request_id % 500}@example.com"}
+            started = time.perf_counter()
+            response = client.post("/api/ticket/tickets/reserve", json=body)
+            mine.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.text
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sorted(latency for part in latencies for latency in part)
+
+
+def percentile(values: List[float], share: float) -> float:
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def count_lines(paths) -> int:
+    total = 0
+    for path in paths:
+        with open(path, "rb") as f:
+            total += sum(1 for _ in f)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=10000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--io-ms", type=float, default=0.5, help="ожидание Session Service на запрос")
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="action-log-"))
+    service = load_app(root, args.io_ms / 1000)
+    results = {name: {"latencies": [], "written": 0, "dropped": 0, "total": 0.0} for name in ("sync", "batched")}
+    try:
+        with TestClient(service.app) as client:
+            # Прогрев: импорт, первые запросы, пул потоков
+            service.log_action = sync_logger(root / "warmup.log")
+            run(client, args.threads, args.threads * 10, 10 ** 6)
+
+            # Варианты чередуются, чтобы рост базы билетов не доставался одному
+            for round_number in range(args.rounds):
+                order = ("sync", "batched") if round_number % 2 == 0 else ("batched", "sync")
+                for name in order:
+                    result = results[name]
+                    first_session = (2 * round_number + order.index(name)) * args.requests
+                    directory = root / f"{name}-{round_number}"
+                    if name == "sync":
+                        service.log_action = sync_logger(directory / "user_actions.log")
+                    else:
+                        # log_action сервиса пишет через logging_service.action_log_writer
+                        writer = ActionLogWriter(directory, 3600, args.queue_size, args.batch, 0.5)
+                        logging_service.action_log_writer = writer
+                        service.log_action = logging_service.log_action
+                    started = time.perf_counter()
+                    result["latencies"].extend(run(client, args.threads, args.requests, first_session))
+                    if name == "batched":
+                        writer.close()
+                        result["dropped"] += writer.dropped
+                    result["total"] += time.perf_counter() - started
+                    result["written"] += count_lines(path for path in directory.iterdir()
+                                                     if path.suffix not in (INDEX_SUFFIX, POSTINGS_SUFFIX))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(f"потоков: {args.threads}, запросов: {args.requests} x {args.rounds}, "
+          f"ожидание Session Service: {args.io_ms} мс")
+    print(f"{'писатель':>8} {'p50, мс':>8} {'p99, мс':>8} {'max, мс':>8} {'записано':>9} {'отброшено':>10} {'всего, с':>9}")
+    for name, result in results.items():
+        latencies = sorted(result["latencies"])
+        result["latencies"] = latencies
+        print(f"{name:>8} {percentile(latencies, 0.5) * 1e3:>8.2f} {percentile(latencies, 0.99) * 1e3:>8.2f} "
+              f"{latencies[-1] * 1e3:>8.2f} {result['written']:>9} {result['dropped']:>10} {result['total']:>9.2f}")
+        assert result["written"] + result["dropped"] == args.requests * args.rounds, (name, result)
+    sync, batched = results["sync"]["latencies"], results["batched"]["latencies"]
+    print(f"p50 быстрее в {percentile(sync, 0.5) / percentile(batched, 0.5):.2f} раза, "
+          f"p99 - в {percentile(sync, 0.99) / percentile(batched, 0.99):.2f} раза")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Стресс-тест брони билетов: параллельные reserve_ticket_api на одни и те же места.
+
+Запуск из каталога ticket-service:
+    python -m benchmarks.reserve_contention [--threads 64] [--attempts 20000] [--rounds 5]
+    python -m benchmarks.reserve_contention --session-url http://localhost:8000 --session-id 1
+
+Сценарии вызывают обработчик reserve_ticket_api из app.main в этом
+процессе: занятие места, создание билета, срок брони, сохранение и журнал
+действий. Билеты (TICKET_DATA_DIR, по умолчанию STORAGE_BACKEND=sqlite) и
+журнал действий пишутся во временный каталог; после проверки билеты теста
+удаляются из памяти. Без --session-url Session Service заменен заглушкой
+mark_seat_as_reserved с тем же контрактом: compare-and-set места под
+блокировкой, 200 - место наше, 409 - уже занято. С --session-url места
+занимает запущенный session-service, в конце теста они освобождаются.
+
+Сценарии:
+  одно место   - все потоки бронируют одно место: в каждой волне ровно
+                 одна бронь и ровно один билет RESERVED на это место;
+  разные места - каждый поток бронирует свое место: все брони успешны,
+                 у каждого билета свой id и на каждое место один билет.
+"""
+import argparse
+import os
+import shutil
+import string
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import requests
+from fastapi import HTTPException
+
+from app import logging_service
+from app.models import TicketStatus
+from app.schemas import ReserveTicketRequest
+
+SeatKey = Tuple[str, int]
+
+
+class StubSessionSeats:
+    """Места сеанса вместо Session Service: контракт mark_seat_as_reserved"""
+
+    def __init__(self, session_id: int, rows: int, seats_per_row: int):
+        self.session_id = session_id
+        self.available = {
+            (string.ascii_uppercase[row], number): True
+            for row in range(rows) for number in range(1, seats_per_row + 1)
+        }
+        self.lock = threading.Lock()
+
+    def seats(self) -> List[SeatKey]:
+        return [seat for seat, available in self.available.items() if available]
+
+    def mark_seat_as_reserved(self, session_id: int, row: str, number: int) -> int:
+        seat = (row, number)
+        with self.lock:
+            if session_id != self.session_id or seat not in self.available:
+                return 404
+            if not self.available[seat]:
+                return 409
+            self.available[seat] = False
+            return 200
+
+    def release(self, seat: SeatKey):
+        with self.lock:
+            self.available[seat] = True
+
+
+class RemoteSessionSeats:
+    """Места сеанса в запущенном session-service (через app.session_client)"""
+
+    def __init__(self, session_client, session_id: int):
+        self.session_client = session_client
+        self.session_id = session_id
+
+    def seats(self) -> List[SeatKey]:
+        response = requests.get(
+            f"{self.session_client.SESSION_SERVICE_URL}/sessions/{self.session_id}/seats", timeout=10
+        )
+        response.raise_for_status()
+        return [(seat["row"], seat["number"]) for seat in response.json() if seat["is_available"]]
+
+    def release(self, seat: SeatKey):
+        self.session_client.mark_seat_as_available(self.session_id, seat[0], seat[1])
+
+
+def load_app(directory: Path, storage: str):
+    """Импортировать app.main с билетами и журналом действий в directory"""
+    os.environ["TICKET_DATA_DIR"] = str(directory / "data")
+    os.environ["STORAGE_BACKEND"] = storage
+    from app import main
+    logging_service.action_log_writer.directory = directory / "user_actions"
+    # Каждая попытка пишет в лог сервиса, а проигравшие - предупреждение о 409
+    main.set_level("ERROR")
+    return main
+
+
+def run_waves(threads: int, attempts: int, attempt: Callable[[int], bool],
+              after_wave: Callable[[List[int]], None]) -> Tuple[List[int], float]:
+    """attempts попыток волнами по threads (как в seat_contention session-service):
+    в каждой волне потоки делают по попытке одновременно, затем
+    after_wave(выигравшие попытки волны) проверяет результат и освобождает место.
+    """
+    waves = max(attempts // threads, 1)
+    winners: List[int] = []
+    wave_winners: List[int] = []
+    winners_lock = threading.Lock()
+
+    def finish_wave():
+        after_wave(sorted(wave_winners))
+        winners.extend(wave_winners)
+        wave_winners.clear()
+
+    start = threading.Barrier(threads + 1)
+    wave_done = threading.Barrier(threads, action=finish_wave)
+
+    def worker(index: int):
+        start.wait()
+        for wave in range(waves):
+            i = wave * threads + index
+            if attempt(i):
+                with winners_lock:
+                    wave_winners.append(i)
+            wave_done.wait()
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    start.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    return winners, time.perf_counter() - started
+
+
+def reserve(main, session_id: int, seat: SeatKey, attempt: int) -> bool:
+    try:
+        main.reserve_ticket_api(ReserveTicketRequest(
+            session_id=session_id, row=seat[0], number=seat[1], email=f"user{attempt}@example.com"
+        ))
+        return True
+    except HTTPException as e:
+        if e.status_code == 409:
+            return False
+        raise
+
+
+def reserved_tickets(main, session_id: int, seats) -> list:
+    """Билеты RESERVED сеанса на места seats"""
+    return [
+        ticket for ticket in list(main.tickets.values())
+        if ticket.session_id == session_id and (ticket.row, ticket.number) in seats
+        and ticket.status == TicketStatus.RESERVED
+    ]
+
+
+def cancel(main, session_seats, tickets: list):
+    """Убрать брони теста: билет удаляется, место освобождается"""
+    for ticket in tickets:
+        main.tickets.pop(ticket.id, None)
+        session_seats.release((ticket.row, ticket.number))
+
+
+def one_seat(main, session_seats, free: List[SeatKey], args) -> List[str]:
+    seat = free[0]
+    errors = []
+
+    def after_wave(wave_winners: List[int]):
+        reserved = reserved_tickets(main, args.session_id, {seat})
+        if len(wave_winners) != 1 or len(reserved) != 1:
+            errors.append(f"одно место: броней в волне {len(wave_winners)}, билетов RESERVED {len(reserved)}")
+        cancel(main, session_seats, reserved)
+
+    winners, elapsed = run_waves(
+        args.threads, args.attempts, lambda i: reserve(main, args.session_id, seat, i), after_wave
+    )
+    print(f"одно место:   {args.attempts} попыток, волн: {max(args.attempts // args.threads, 1)}, "
+          f"броней: {len(winners)}, {elapsed:.2f} с")
+    return errors[:5]
+
+
+def distinct_seats(main, session_seats, free: List[SeatKey], args) -> List[str]:
+    targets = free[:min(args.attempts, len(free))]
+    results = [False] * len(targets)
+    barrier = threading.Barrier(args.threads + 1)
+
+    def worker(first: int):
+        barrier.wait()
+        for i in range(first, len(targets), args.threads):
+            results[i] = reserve(main, args.session_id, targets[i], i)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in pool:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    errors = []
+    reserved = reserved_tickets(main, args.session_id, set(targets))
+    if sum(results) != len(targets) or len(reserved) != len(targets):
+        errors.append(f"разные места: успешно {sum(results)}, билетов {len(reserved)} из {len(targets)}")
+    if len({ticket.id for ticket in reserved}) != len(reserved):
+        errors.append(f"разные места: {len(reserved)} билетов, но id только {len({t.id for t in reserved})}")
+    cancel(main, session_seats, reserved)
+    print(f"разные места: {len(targets)} мест, билетов: {len(reserved)}, {elapsed:.2f} с")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--attempts", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--session-url", help="адрес запущенного session-service")
+    parser.add_argument("--session-id", type=int, default=1)
+    parser.add_argument("--storage", choices=("sqlite", "json"), default="sqlite",
+                        help="STORAGE_BACKEND сервиса (json переписывает tickets.json на каждую бронь)")
+    args = parser.parse_args()
+
+    directory = Path(tempfile.mkdtemp(prefix="reserve-contention-"))
+    main_module = load_app(directory, args.storage)
+    if args.session_url:
+        from app import session_client
+        session_client.SESSION_SERVICE_URL = args.session_url.rstrip("/")
+        session_seats = RemoteSessionSeats(session_client, args.session_id)
+    else:
+        session_seats = StubSessionSeats(args.session_id, 20, 50)
+        main_module.mark_seat_as_reserved = session_seats.mark_seat_as_reserved
+
+    # Переключать потоки как можно чаще, чтобы гонки проявлялись
+    sys.setswitchinterval(1e-6)
+    errors = []
+    try:
+        for round_number in range(args.rounds):
+            free = session_seats.seats()
+            if not free:
+                parser.error(f"в сеансе {args.session_id} нет свободных мест")
+            print(f"раунд {round_number + 1}, потоков: {args.threads}")
+            for scenario in (one_seat, distinct_seats):
+                errors.extend(scenario(main_module, session_seats, free, args))
+    finally:
+        logging_service.action_log_writer.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if errors:
+        print("ОШИБКИ:")
+        for error in errors:
+            print(" ", error)
+        sys.exit(1)
+    print("двойных броней и потерянных билетов нет")
+
+
+if __name__ == "__main__":
+    main()